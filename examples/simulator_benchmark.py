@@ -0,0 +1,72 @@
+"""
+Measures the gate throughput of the simulator back-ends (Python and, if it
+has been built, C++) for 10 to 22 qubits.
+
+Usage:
+
+.. code-block:: bash
+
+	python simulator_benchmark.py [min_qubits] [max_qubits]
+"""
+from __future__ import print_function
+import sys
+import timeit
+
+import numpy as np
+
+from projectq.backends._sim._pysim import Simulator as PySim
+try:
+	from projectq.backends._sim._cppsim import Simulator as CppSim
+except ImportError:
+	CppSim = None
+
+
+H = (np.array([[1, 1], [1, -1]]) / np.sqrt(2)).tolist()
+X = [[0, 1], [1, 0]]
+
+
+def run_circuit(sim, n, depth):
+	"""
+	Apply depth layers of Hadamards and controlled NOTs (with one and two
+	controls) to n qubits.
+	"""
+	for layer in range(depth):
+		for i in range(n):
+			sim.apply_controlled_gate(H, [i], [])
+		for i in range(n):
+			sim.apply_controlled_gate(X, [(i + 1) % n], [i])
+		for i in range(n):
+			sim.apply_controlled_gate(X, [(i + 2) % n], [i, (i + 1) % n])
+		sim.run()
+	return 3 * n * depth
+
+
+def benchmark(backend, n, depth=2, repeat=3):
+	"""
+	Return the number of gates per second and the number of amplitude updates
+	per second when simulating run_circuit on n qubits.
+	"""
+	sim = backend(1)
+	for i in range(n):
+		sim.allocate_qubit(i)
+	run_circuit(sim, n, 1)  # warm up
+	times = timeit.repeat(lambda: run_circuit(sim, n, depth), number=1,
+	                      repeat=repeat)
+	num_gates = 3 * n * depth
+	return num_gates / min(times), num_gates * (1 << n) / min(times)
+
+
+if __name__ == "__main__":
+	min_qubits = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+	max_qubits = int(sys.argv[2]) if len(sys.argv) > 2 else 22
+	backends = [("Python", PySim)]
+	if CppSim is not None:
+		backends.append(("C++", CppSim))
+
+	print("{:>8} {:>8} {:>14} {:>18}".format("backend", "qubits", "gates/s",
+	                                         "amplitudes/s"))
+	for name, backend in backends:
+		for n in range(min_qubits, max_qubits + 1, 2):
+			gates, amplitudes = benchmark(backend, n)
+			print("{:>8} {:>8} {:>14.1f} {:>18.3e}".format(name, n, gates,
+			                                               amplitudes))
@@ -18,11 +18,13 @@ This includes:
 * a debugging tool to print all received commands (CommandPrinter)
 * a circuit drawing engine (which can be used anywhere within the compilation chain)
 * a simulator with emulation capabilities
+* a stabilizer simulator for Clifford circuits on many qubits
 * a resource counter (counts gates and keeps track of the maximal width of the circuit)
 * an interface to the IBM Quantum Experience chip (and simulator).
 """
 from ._printer import CommandPrinter
 from ._circuits import CircuitDrawer
 from ._sim import Simulator
+from ._stabilizer import StabilizerSimulator
 from ._resource import ResourceCounter
 from ._ibm import IBMBackend
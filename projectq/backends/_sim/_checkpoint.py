@@ -0,0 +1,127 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Reading and writing checkpoints of the state of the Python and distributed
+simulators (the C++ simulator implements the same format).
+
+A checkpoint file consists of (all integers are little-endian)
+
+* the magic string b"PQCKPT01",
+* the size of an amplitude in bytes (uint32, 8 for single and 16 for double
+  precision),
+* the number of qubits n (uint32), followed by the n qubit IDs ordered by
+  their bit-location (uint32 each),
+* the state of the random number generator (uint64 length + data, specific to
+  the simulator which wrote the checkpoint),
+* user metadata (uint64 length + UTF-8 data),
+* zero-padding up to a multiple of 4096 bytes,
+* the 2^n amplitudes (interleaved real and imaginary parts).
+
+The amplitudes are read and written in chunks, i.e., without a second copy of
+the state vector.
+"""
+
+import struct
+
+import numpy as _np
+
+_MAGIC = b"PQCKPT01"
+_ALIGNMENT = 4096
+# number of amplitudes per read/write
+_CHUNK_SIZE = 1 << 22
+
+
+def _dtype(itemsize):
+	if itemsize == 8:
+		return _np.complex64
+	if itemsize == 16:
+		return _np.complex128
+	raise ValueError("Unsupported amplitude size in the checkpoint.")
+
+
+def write_header(path, itemsize, ids, rng_state, metadata):
+	"""
+	Create the checkpoint file (with the size of the complete checkpoint) and
+	write its header.
+
+	Args:
+		path (str): Path of the checkpoint file.
+		itemsize (int): Size of an amplitude in bytes.
+		ids (list<int>): Qubit IDs ordered by their bit-location.
+		rng_state (bytes): State of the random number generator.
+		metadata (str): User metadata.
+
+	Returns:
+		Offset of the amplitudes in the file.
+	"""
+	metadata = metadata.encode('utf-8')
+	header = (_MAGIC + struct.pack('<II', itemsize, len(ids)) +
+	          struct.pack('<%dI' % len(ids), *ids) +
+	          struct.pack('<Q', len(rng_state)) + rng_state +
+	          struct.pack('<Q', len(metadata)) + metadata)
+	offset = -(-len(header) // _ALIGNMENT) * _ALIGNMENT
+	with open(path, 'wb') as f:
+		f.write(header)
+		f.truncate(offset + (itemsize << len(ids)))
+	return offset
+
+
+def read_header(path):
+	"""
+	Read the header of a checkpoint file.
+
+	Returns:
+		Tuple (itemsize, ids, rng_state, metadata, offset), see write_header.
+
+	Raises:
+		ValueError: If the file is not a checkpoint.
+	"""
+	with open(path, 'rb') as f:
+		if f.read(len(_MAGIC)) != _MAGIC:
+			raise ValueError("'{}' is not a simulator checkpoint.".format(path))
+		itemsize, num_qubits = struct.unpack('<II', f.read(8))
+		_dtype(itemsize)
+		ids = list(struct.unpack('<%dI' % num_qubits, f.read(4 * num_qubits)))
+		length, = struct.unpack('<Q', f.read(8))
+		rng_state = f.read(length)
+		length, = struct.unpack('<Q', f.read(8))
+		metadata = f.read(length).decode('utf-8')
+		offset = -(-f.tell() // _ALIGNMENT) * _ALIGNMENT
+	return itemsize, ids, rng_state, metadata, offset
+
+
+def write_amplitudes(path, offset, state):
+	"""
+	Write the amplitudes of state (a contiguous NumPy array) to the file path
+	at the given offset.
+	"""
+	with open(path, 'r+b') as f:
+		f.seek(offset)
+		for start in range(0, len(state), _CHUNK_SIZE):
+			f.write(memoryview(state[start:start + _CHUNK_SIZE]))
+
+
+def read_amplitudes(path, offset, state, itemsize):
+	"""
+	Read len(state) amplitudes of size itemsize from the file path at the
+	given offset into state (converting the precision if necessary).
+	"""
+	dtype = _dtype(itemsize)
+	with open(path, 'rb') as f:
+		f.seek(offset)
+		for start in range(0, len(state), _CHUNK_SIZE):
+			count = min(_CHUNK_SIZE, len(state) - start)
+			data = f.read(count * itemsize)
+			if len(data) != count * itemsize:
+				raise ValueError("The checkpoint '{}' is truncated.".format(path))
+			state[start:start + count] = _np.frombuffer(data, dtype=dtype)
@@ -0,0 +1,46 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Tests for projectq.backends._sim._checkpoint.py.
+"""
+
+import numpy
+import pytest
+
+from projectq.backends._sim import _checkpoint
+
+
+def test_checkpoint_roundtrip(tmpdir, monkeypatch):
+	monkeypatch.setattr(_checkpoint, "_CHUNK_SIZE", 4)
+	path = str(tmpdir.join("state.ckpt"))
+	state = numpy.arange(16) * (1. + .5j)
+	offset = _checkpoint.write_header(path, state.itemsize, [3, 1, 4, 2],
+	                                  b"rng", u"metadata")
+	assert offset % 4096 == 0
+	_checkpoint.write_amplitudes(path, offset, state)
+	assert tmpdir.join("state.ckpt").size() == offset + 16 * state.itemsize
+	
+	itemsize, ids, rng_state, metadata, offset = _checkpoint.read_header(path)
+	assert (itemsize, ids, rng_state, metadata) == (16, [3, 1, 4, 2], b"rng",
+	                                                u"metadata")
+	single = numpy.zeros(16, dtype=numpy.complex64)
+	_checkpoint.read_amplitudes(path, offset, single, itemsize)
+	assert numpy.allclose(single, state)
+	with pytest.raises(ValueError):
+		_checkpoint.read_amplitudes(path, offset, numpy.zeros(32, complex), 16)
+
+
+def test_checkpoint_invalid_file(tmpdir):
+	tmpdir.join("invalid.ckpt").write("PQCKPT00")
+	with pytest.raises(ValueError):
+		_checkpoint.read_header(str(tmpdir.join("invalid.ckpt")))
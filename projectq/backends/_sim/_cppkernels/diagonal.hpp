@@ -0,0 +1,278 @@
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+// http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#ifndef DIAGONAL_HPP_
+#define DIAGONAL_HPP_
+
+#include <vector>
+#include <complex>
+#include <algorithm>
+#include "intrin/alignedallocator.hpp"
+
+// Diagonal gate acting on the qubits idx_ which is only applied if all qubits
+// in ctrl_ are 1. Entry k of the phase table is the diagonal entry of the
+// basis state where qubit idx_[l] has the value (k >> l) & 1.
+class PhaseTable{
+public:
+	using Index = unsigned;
+	using IndexVector = std::vector<Index>;
+	using Complex = std::complex<double>;
+	using Diagonal = std::vector<Complex, aligned_allocator<Complex, 64>>;
+	PhaseTable(Diagonal phases, IndexVector idx, IndexVector ctrl = {}) : phases_(phases), idx_(idx), ctrl_(ctrl) {}
+	Diagonal& get_phases() { return phases_; }
+	Diagonal const& get_phases() const { return phases_; }
+	IndexVector& get_indices() { return idx_; }
+	IndexVector const& get_indices() const { return idx_; }
+	IndexVector& get_controls() { return ctrl_; }
+	IndexVector const& get_controls() const { return ctrl_; }
+private:
+	Diagonal phases_;
+	IndexVector idx_;
+	IndexVector ctrl_;
+};
+
+// Collects diagonal gates. Since diagonal gates commute, every new gate is
+// multiplied into the first phase table which stays small enough (at most
+// max_table_qubits_ qubits), such that all of them can be applied in a single
+// sweep over the state vector.
+class DiagonalFusion{
+public:
+	using Index = PhaseTable::Index;
+	using IndexVector = PhaseTable::IndexVector;
+	using Complex = PhaseTable::Complex;
+	using Diagonal = PhaseTable::Diagonal;
+	using TableVector = std::vector<PhaseTable>;
+
+	DiagonalFusion(unsigned max_table_qubits = 10) : num_gates_(0), max_table_qubits_(max_table_qubits) {}
+
+	std::size_t size() const {
+		return num_gates_;
+	}
+
+	void insert(Diagonal diag, IndexVector index_list, IndexVector ctrl_list = {}){
+		num_gates_++;
+		if (index_list.size() + ctrl_list.size() <= max_table_qubits_){
+			add_controls(diag, index_list, ctrl_list);
+			ctrl_list.clear();
+		}
+		PhaseTable table(diag, index_list, ctrl_list);
+		if (ctrl_list.size() == 0){
+			for (auto& t : tables_){
+				if (t.get_controls().size() == 0 && merge(t, table))
+					return;
+			}
+		}
+		tables_.push_back(table);
+	}
+
+	TableVector const& get_tables() const {
+		return tables_;
+	}
+
+private:
+	// turn the controls into target qubits of the diagonal gate
+	void add_controls(Diagonal &diag, IndexVector &index_list, IndexVector const& ctrl_list){
+		if (ctrl_list.size() == 0)
+			return;
+		std::size_t offset = (1UL << (index_list.size() + ctrl_list.size())) - diag.size();
+		Diagonal newdiag(offset + diag.size(), 1.);
+		std::copy(diag.begin(), diag.end(), newdiag.begin() + offset);
+		// the controls are the high bits of the new index, i.e., the original
+		// diagonal ends up where all controls are 1
+		index_list.insert(index_list.end(), ctrl_list.begin(), ctrl_list.end());
+		diag = std::move(newdiag);
+	}
+
+	// multiply the phase table b into a if the resulting table is small enough
+	bool merge(PhaseTable &a, PhaseTable const& b){
+		IndexVector idx = a.get_indices();
+		for (auto i : b.get_indices())
+			if (std::find(idx.begin(), idx.end(), i) == idx.end())
+				idx.push_back(i);
+		if (idx.size() > max_table_qubits_)
+			return false;
+
+		auto bitpos = [&idx](IndexVector const& sub){
+			IndexVector pos(sub.size());
+			for (std::size_t l = 0; l < sub.size(); ++l)
+				pos[l] = std::find(idx.begin(), idx.end(), sub[l]) - idx.begin();
+			return pos;
+		};
+		auto apos = bitpos(a.get_indices());
+		auto bpos = bitpos(b.get_indices());
+
+		Diagonal phases(1UL << idx.size());
+		for (std::size_t k = 0; k < phases.size(); ++k){
+			std::size_t ka = 0, kb = 0;
+			for (std::size_t l = 0; l < apos.size(); ++l)
+				ka |= ((k >> apos[l]) & 1UL) << l;
+			for (std::size_t l = 0; l < bpos.size(); ++l)
+				kb |= ((k >> bpos[l]) & 1UL) << l;
+			phases[k] = a.get_phases()[ka] * b.get_phases()[kb];
+		}
+		a = PhaseTable(phases, idx);
+		return true;
+	}
+
+	TableVector tables_;
+	std::size_t num_gates_;
+	unsigned max_table_qubits_;
+};
+
+// Phase of basis state i (1 if the controls are not satisfied) according to
+// a single phase table.
+inline PhaseTable::Complex get_phase(PhaseTable const& table, std::size_t i){
+	for (auto c : table.get_controls())
+		if (((i >> c) & 1UL) == 0)
+			return 1.;
+	auto const& idx = table.get_indices();
+	std::size_t k = 0;
+	for (std::size_t l = 0; l < idx.size(); ++l)
+		k |= ((i >> idx[l]) & 1UL) << l;
+	return table.get_phases()[k];
+}
+
+inline PhaseTable::Complex mul(PhaseTable::Complex const& a, PhaseTable::Complex const& b){
+	return PhaseTable::Complex(a.real() * b.real() - a.imag() * b.imag(),
+	                           a.real() * b.imag() + a.imag() * b.real());
+}
+
+// Multiply the entries of psi by the phases of a single (small) phase table,
+// skipping all entries whose phase is 1. For each such table entry, the
+// indices of the corresponding entries of psi are obtained by inserting the
+// fixed bits (indices and controls of the table) into a running counter.
+template <class V>
+void sparse_diagonal_kernel(V &psi, PhaseTable const& table){
+	auto const& idx = table.get_indices();
+	auto fixed = idx;
+	fixed.insert(fixed.end(), table.get_controls().begin(), table.get_controls().end());
+	std::sort(fixed.begin(), fixed.end());
+	std::size_t ctrlval = 0;
+	for (auto c : table.get_controls())
+		ctrlval |= (1UL << c);
+	
+	std::size_t num_free = psi.size() >> fixed.size();
+	auto const& phases = table.get_phases();
+	for (std::size_t k = 0; k < phases.size(); ++k){
+		if (phases[k] == 1.)
+			continue;
+		std::size_t val = ctrlval;
+		for (std::size_t l = 0; l < idx.size(); ++l)
+			val |= ((k >> l) & 1UL) << idx[l];
+		auto phase = phases[k];
+		#pragma omp parallel for schedule(static)
+		for (std::size_t r = 0; r < num_free; ++r){
+			std::size_t i = r;
+			for (auto pos : fixed)
+				i = (i & ((1UL << pos) - 1)) | ((i >> pos) << (pos + 1));
+			i |= val;
+			psi[i] = mul(psi[i], phase);
+		}
+	}
+}
+
+// Multiply every entry of psi by its phase (the product of the entries of all
+// phase tables). Indices and controls of the phase tables are bit-locations.
+//
+// The state vector is processed in chunks of 2^L entries: Tables which only
+// act on the low L bits contribute the same row of phases to every chunk,
+// tables which only act on the high bits contribute one phase per chunk, and
+// only the remaining tables have to be looked up for every entry (using the
+// precomputed contribution of the low bits to the table index).
+template <class V>
+void diagonal_kernel(V &psi, DiagonalFusion::TableVector const& tables){
+	if (tables.size() == 1 && (tables[0].get_indices().size() <= 4 || tables[0].get_controls().size() > 0)){
+		sparse_diagonal_kernel(psi, tables[0]);
+		return;
+	}
+	using Complex = PhaseTable::Complex;
+	using Diagonal = PhaseTable::Diagonal;
+	std::size_t const invalid = ~0UL;
+	std::size_t n = psi.size();
+	unsigned L = 0;
+	while ((1UL << L) < n && L < 12)
+		++L;
+	std::size_t chunk = 1UL << L;
+	
+	Diagonal low(chunk, 1.);
+	std::vector<PhaseTable const*> high, mixed;
+	// for each mixed table: contribution of the low bits to the table index
+	// (invalid if the low controls are not satisfied)
+	std::vector<std::vector<std::size_t>> lowidx;
+	for (auto const& t : tables){
+		auto all = t.get_indices();
+		all.insert(all.end(), t.get_controls().begin(), t.get_controls().end());
+		if (*std::max_element(all.begin(), all.end()) < L){
+			for (std::size_t j = 0; j < chunk; ++j)
+				low[j] = mul(low[j], get_phase(t, j));
+		}
+		else if (*std::min_element(all.begin(), all.end()) >= L)
+			high.push_back(&t);
+		else{
+			mixed.push_back(&t);
+			lowidx.push_back(std::vector<std::size_t>(chunk));
+			auto const& idx = t.get_indices();
+			for (std::size_t j = 0; j < chunk; ++j){
+				std::size_t k = 0;
+				for (std::size_t l = 0; l < idx.size(); ++l)
+					if (idx[l] < L)
+						k |= ((j >> idx[l]) & 1UL) << l;
+				for (auto c : t.get_controls())
+					if (c < L && ((j >> c) & 1UL) == 0)
+						k = invalid;
+				lowidx.back()[j] = k;
+			}
+		}
+	}
+	
+	#pragma omp parallel
+	{
+		Diagonal row(chunk);
+		#pragma omp for schedule(static)
+		for (std::size_t h = 0; h < n; h += chunk){
+			Complex c = 1.;
+			for (auto t : high)
+				c = mul(c, get_phase(*t, h));
+			if (mixed.size() == 0){
+				for (std::size_t j = 0; j < chunk; ++j)
+					psi[h + j] = mul(psi[h + j], mul(c, low[j]));
+				continue;
+			}
+			for (std::size_t j = 0; j < chunk; ++j)
+				row[j] = mul(c, low[j]);
+			for (std::size_t m = 0; m < mixed.size(); ++m){
+				auto const& t = *mixed[m];
+				// contribution of the high bits (chunk index) to the table index
+				bool active = true;
+				for (auto ctrl : t.get_controls())
+					if (ctrl >= L && ((h >> ctrl) & 1UL) == 0)
+						active = false;
+				if (!active)
+					continue;
+				auto const& idx = t.get_indices();
+				std::size_t khigh = 0;
+				for (std::size_t l = 0; l < idx.size(); ++l)
+					if (idx[l] >= L)
+						khigh |= ((h >> idx[l]) & 1UL) << l;
+				auto const& phases = t.get_phases();
+				auto const& klow = lowidx[m];
+				for (std::size_t j = 0; j < chunk; ++j)
+					if (klow[j] != invalid)
+						row[j] = mul(row[j], phases[khigh | klow[j]]);
+			}
+			for (std::size_t j = 0; j < chunk; ++j)
+				psi[h + j] = mul(psi[h + j], row[j]);
+		}
+	}
+}
+
+#endif
@@ -71,33 +71,41 @@ public:
 		for (std::size_t i = 0; i < (1UL<<N); ++i)
 			M[i][i] = 1.;
 		
+		// multiply each item onto the fused matrix from the left: for each
+		// combination of the other bits, the rows belonging to the qubits of
+		// the item are replaced by linear combinations of the old rows (whole
+		// rows at a time, which vectorizes well and skips zero entries)
+		std::size_t dim = 1UL << N;
+		std::vector<std::vector<Complex, aligned_allocator<Complex, 64>>> oldrows;
 		for (auto& item : items_){
 			auto const& idx = item.get_indices();
-			IndexVector idx2mat(idx.size());
-			for (std::size_t i = 0; i < idx.size(); ++i)
-				idx2mat[i] = ((std::equal_range(index_list.begin(), index_list.end(), idx[i])).first - index_list.begin());
-			
-			for (std::size_t k = 0; k < (1UL<<N); ++k){ // loop over big matrix columns
-				// check if column index satisfies control-mask
-				// if not: leave it unchanged
-				std::vector<Complex> oldcol(1UL<<N);
-				for (std::size_t i = 0; i < (1UL<<N); ++i)
-					oldcol[i] = M[i][k];
-
-				for (std::size_t i = 0; i < (1UL<<N); ++i){
-					std::size_t local_i = 0;
-					for (std::size_t l = 0; l < idx.size(); ++l)
-						local_i |= ((i >> idx2mat[l])&1UL)<<l;
-						
-					Complex res = 0.;
-					for (std::size_t j = 0; j < (1UL<<idx.size()); ++j){
-						std::size_t locidx = i;
-						for (std::size_t l = 0; l < idx.size(); ++l)
-							if (((j >> l)&1UL) != ((i >> idx2mat[l])&1UL))
-								locidx ^= (1UL << idx2mat[l]);
-						res += oldcol[locidx] * item.get_matrix()[local_i][j];
+			auto const& G = item.get_matrix();
+			std::size_t K = 1UL << idx.size();
+			std::vector<std::size_t> offsets(K, 0);
+			std::size_t mask = 0;
+			for (std::size_t l = 0; l < idx.size(); ++l){
+				std::size_t pos = (std::equal_range(index_list.begin(), index_list.end(), idx[l])).first - index_list.begin();
+				mask |= 1UL << pos;
+				for (std::size_t j = 0; j < K; ++j)
+					offsets[j] |= ((j >> l) & 1UL) << pos;
+			}
+			oldrows.resize(K);
+			for (std::size_t r = 0; r < dim; ++r){
+				if ((r & mask) != 0)
+					continue;
+				for (std::size_t j = 0; j < K; ++j)
+					oldrows[j].swap(M[r + offsets[j]]);
+				for (std::size_t i = 0; i < K; ++i){
+					auto& row = M[r + offsets[i]];
+					row.assign(dim, 0.);
+					for (std::size_t j = 0; j < K; ++j){
+						Complex g = G[i][j];
+						if (g == 0.)
+							continue;
+						auto const& old = oldrows[j];
+						for (std::size_t c = 0; c < dim; ++c)
+							row[c] += g * old[c];
 					}
-					M[i][k] = res;
 				}
 			}
 		}
@@ -119,4 +119,20 @@ template <class U>
 inline __m256d load(U const*p1, U const*p2){
 	return _mm256_loadu2_m128d((double const*)p2, (double const*)p1);
 }
+template <class U>
+inline void store2(U *hi, U *lo, __m256d const& v){
+	_mm256_storeu2_m128d((double*)hi, (double*)lo, v);
+}
+
+// single-precision state vectors: amplitudes are converted to double
+// precision when loaded (and back when stored), i.e., the arithmetic is the
+// same as for double-precision state vectors
+inline __m256d load2(std::complex<float> *p){
+	return _mm256_cvtps_pd(_mm_castpd_ps(_mm_load1_pd((double const*)p)));
+}
+inline void store2(std::complex<float> *hi, std::complex<float> *lo, __m256d const& v){
+	auto tmp = _mm256_cvtpd_ps(v);
+	_mm_storel_pi((__m64*)lo, tmp);
+	_mm_storeh_pi((__m64*)hi, tmp);
+}
 #endif
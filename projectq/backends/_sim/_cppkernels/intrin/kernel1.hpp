@@ -6,7 +6,7 @@ inline void kernel_core(V &psi, unsigned I, unsigned d0, M const& m, M const& mt
 	v[0] = load2(&psi[I]);
 	v[1] = load2(&psi[I + d0]);
 
-	_mm256_storeu2_m128d((double*)&psi[I + d0], (double*)&psi[I], add(mul(v[0], m[0], mt[0]), mul(v[1], m[1], mt[1])));
+	store2(&psi[I + d0], &psi[I], add(mul(v[0], m[0], mt[0]), mul(v[1], m[1], mt[1])));
 
 }
 
@@ -0,0 +1,139 @@
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+// http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <cstddef>
+#include <memory>
+#include <new>
+#include <string>
+#include <vector>
+#include <stdexcept>
+#include <type_traits>
+#include "intrin/alignedallocator.hpp"
+
+#ifndef _WIN32
+#include <sys/mman.h>
+#include <sys/types.h>
+#include <unistd.h>
+#endif
+
+
+// Allocator which places the memory in a temporary, memory-mapped file in
+// the directory dir (e.g., on a local NVMe drive), such that the operating
+// system pages the data in and out as needed. This allows to work with arrays
+// which are larger than the main memory (at the cost of speed).
+// If dir is empty, the memory is allocated in RAM (using aligned_allocator).
+//
+// The file is deleted as soon as it has been mapped, i.e., it disappears
+// when the memory is deallocated (or the process terminates).
+template <typename T, unsigned int Alignment>
+class mmap_allocator
+{
+ public:
+	typedef T* pointer;
+	typedef T const* const_pointer;
+	typedef T& reference;
+	typedef T const& const_reference;
+	typedef T value_type;
+	typedef std::size_t size_type;
+	typedef std::ptrdiff_t difference_type;
+	typedef std::true_type propagate_on_container_copy_assignment;
+	typedef std::true_type propagate_on_container_move_assignment;
+	typedef std::true_type propagate_on_container_swap;
+
+	template <typename U>
+	struct rebind
+	{
+		typedef mmap_allocator<U, Alignment> other;
+	};
+
+	mmap_allocator(std::string const& dir = "") : dir_(dir) {}
+	mmap_allocator(mmap_allocator const& other) noexcept : dir_(other.dir_) {}
+	template <typename U>
+	mmap_allocator(mmap_allocator<U, Alignment> const& other) noexcept : dir_(other.get_directory())
+	{
+	}
+
+	std::string const& get_directory() const noexcept { return dir_; }
+
+	pointer allocate(size_type n)
+	{
+		if (dir_.empty())
+			return aligned_allocator<T, Alignment>().allocate(n);
+#ifdef _WIN32
+		throw std::runtime_error("Memory-mapped state vectors are not supported on Windows.");
+#else
+		std::string name = dir_ + "/projectq_state_XXXXXX";
+		std::vector<char> path(name.begin(), name.end());
+		path.push_back('\0');
+		int fd = mkstemp(path.data());
+		if (fd == -1)
+			throw std::runtime_error("Could not create a file in '" + dir_ + "' to store the state vector.");
+		unlink(path.data());
+		if (ftruncate(fd, n * sizeof(T)) != 0){
+			close(fd);
+			throw std::bad_alloc();
+		}
+		void *p = mmap(nullptr, n * sizeof(T), PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+		close(fd);
+		if (p == MAP_FAILED)
+			throw std::bad_alloc();
+		// the kernels sweep over the state vector (in large blocks), i.e., pages
+		// can be read ahead and dropped after they have been processed
+		madvise(p, n * sizeof(T), MADV_SEQUENTIAL);
+		return reinterpret_cast<pointer>(p);
+#endif
+	}
+
+	void deallocate(pointer p, size_type n) noexcept
+	{
+		if (dir_.empty())
+			aligned_allocator<T, Alignment>().deallocate(p, n);
+#ifndef _WIN32
+		else
+			munmap(p, n * sizeof(T));
+#endif
+	}
+
+	size_type max_size() const noexcept
+	{
+		std::allocator<T> a;
+		return a.max_size();
+	}
+
+	template <typename C, class... Args>
+	void construct(C* c, Args&&... args)
+	{
+		new ((void*)c) C(std::forward<Args>(args)...);
+	}
+
+	// default construction (e.g., by resize) does not initialize the memory,
+	// such that large state vectors can be initialized in parallel
+	template <typename C>
+	void construct(C*)
+	{
+		static_assert(std::is_trivially_destructible<C>::value, "mmap_allocator only supports trivially destructible types.");
+	}
+
+	template <typename C>
+	void destroy(C* c)
+	{
+		c->~C();
+	}
+
+	bool operator==(mmap_allocator const& other) const noexcept { return dir_ == other.dir_; }
+	bool operator!=(mmap_allocator const& other) const noexcept { return dir_ != other.dir_; }
+
+ private:
+	std::string dir_;
+};
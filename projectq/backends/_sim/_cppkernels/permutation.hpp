@@ -0,0 +1,82 @@
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+// http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#ifndef PERMUTATION_HPP_
+#define PERMUTATION_HPP_
+
+#include <vector>
+#include <complex>
+#include <algorithm>
+
+// Apply the (controlled) permutation gate which maps the basis state k of the
+// qubits at bit-locations ids (bit l of k corresponds to ids[l]) to perm[k]
+// by moving amplitudes, i.e., without any floating point operations.
+// Only the entries for which all controls are 1 are visited: The state vector
+// is traversed in contiguous runs of 2^p entries (where p is the lowest target
+// or control bit-location), and the start of each run is obtained by inserting
+// the bits of the target and control qubits into a running counter.
+template <class V>
+void permutation_kernel(V &psi, std::vector<unsigned> const& ids, std::vector<unsigned> const& perm, std::vector<unsigned> const& ctrls){
+	auto fixed = ids;
+	fixed.insert(fixed.end(), ctrls.begin(), ctrls.end());
+	std::sort(fixed.begin(), fixed.end());
+	std::size_t ctrlmask = 0;
+	for (auto c : ctrls)
+		ctrlmask |= (1UL << c);
+
+	std::vector<std::size_t> offsets(perm.size(), 0);
+	for (std::size_t k = 0; k < perm.size(); ++k)
+		for (std::size_t l = 0; l < ids.size(); ++l)
+			offsets[k] |= ((k >> l) & 1UL) << ids[l];
+	// decompose the permutation into cycles (k, perm[k], perm[perm[k]], ...)
+	std::vector<std::vector<std::size_t>> cycles;
+	std::vector<bool> done(perm.size(), false);
+	bool transpositions = true;
+	for (std::size_t k = 0; k < perm.size(); ++k){
+		if (done[k] || perm[k] == k)
+			continue;
+		cycles.push_back({});
+		for (auto l = k; !done[l]; l = perm[l]){
+			done[l] = true;
+			cycles.back().push_back(offsets[l]);
+		}
+		transpositions = transpositions && (cycles.back().size() == 2);
+	}
+
+	std::size_t run = 1UL << fixed[0];
+	std::size_t num_runs = (psi.size() >> fixed.size()) / run;
+	#pragma omp parallel for schedule(static)
+	for (std::size_t r = 0; r < num_runs; ++r){
+		std::size_t i = r << fixed[0];
+		for (auto pos : fixed)
+			i = (i & ((1UL << pos) - 1)) | ((i >> pos) << (pos + 1));
+		i |= ctrlmask;
+		if (transpositions){
+			for (auto const& c : cycles){
+				for (std::size_t j = i; j < i + run; ++j)
+					std::swap(psi[j + c[0]], psi[j + c[1]]);
+			}
+		}
+		else{
+			for (auto const& c : cycles){
+				for (std::size_t j = i; j < i + run; ++j){
+					auto tmp = psi[j + c.back()];
+					for (std::size_t m = c.size() - 1; m > 0; --m)
+						psi[j + c[m]] = psi[j + c[m - 1]];
+					psi[j + c[0]] = tmp;
+				}
+			}
+		}
+	}
+}
+
+#endif
@@ -15,6 +15,8 @@
 
 #include <vector>
 #include <complex>
+#include <cstdint>
+#include <limits>
 
 #if defined(NOINTRIN) || !defined(INTRIN)
 #include "nointrin/kernels.hpp"
@@ -23,43 +25,150 @@
 #endif
 
 #include "intrin/alignedallocator.hpp"
+#include "mmapallocator.hpp"
 #include "fusion.hpp"
+#include "diagonal.hpp"
+#include "permutation.hpp"
 #include <map>
+#include <set>
 #include <cassert>
 #include <algorithm>
 #include <tuple>
 #include <random>
 #include <functional>
+#include <stdexcept>
+#include <bitset>
+#include <type_traits>
+#include <string>
+#include <fstream>
+#include <sstream>
+#include <chrono>
+#include <cmath>
 
 
-class Simulator{
+// State vector simulator storing the amplitudes as std::complex<T>. Gate
+// matrices are always given (and fused) in double precision.
+// If a storage directory is given, the state vector is kept in a memory-mapped
+// file in this directory instead of RAM (see mmap_allocator).
+template <class T>
+class BasicSimulator{
 public:
-	using calc_type = double;
+	using calc_type = T;
 	using complex_type = std::complex<calc_type>;
-	using StateVector = std::vector<complex_type, aligned_allocator<complex_type,64>>;
+	using StateVector = std::vector<complex_type, mmap_allocator<complex_type,64>>;
 	using Map = std::map<unsigned, unsigned>;
 	using RndEngine = std::mt19937;
+	using PauliString = std::vector<std::pair<unsigned, char>>;
+	using PauliTerms = std::vector<std::pair<PauliString, double>>;
 	
-	Simulator(unsigned seed = 1) : N_(0), vec_(1,0.), fusion_qubits_min_(4), fusion_qubits_max_(5), rnd_eng_(seed) {
+	BasicSimulator(unsigned seed = 1, std::string const& storage_dir = "") : N_(0), vec_(1, 0., typename StateVector::allocator_type(storage_dir)), fusion_qubits_min_(4), fusion_qubits_max_(5), fusion_window_(0), fast_positions_(0), rnd_eng_(seed) {
 		vec_[0]=1.; // all-zero initial state
 		std::uniform_real_distribution<double> dist(0., 1.);
 		rng_ = std::bind(dist, std::ref(rnd_eng_));
 	}
 	
+	// snapshot of the simulator: copies the state vector (in parallel), the
+	// qubit map, the pending gates, and the state of the random number generator
+	BasicSimulator(BasicSimulator const& other) : vec_(other.vec_.get_allocator()) {
+		std::uniform_real_distribution<double> dist(0., 1.);
+		rng_ = std::bind(dist, std::ref(rnd_eng_));
+		*this = other;
+	}
+	
+	// restore a snapshot (the memory of the state vector is reused if possible)
+	BasicSimulator& operator=(BasicSimulator const& other){
+		if (this == &other)
+			return *this;
+		N_ = other.N_;
+		vec_.resize(other.vec_.size());
+		#pragma omp parallel for schedule(static)
+		for (std::size_t i = 0; i < vec_.size(); ++i)
+			vec_[i] = other.vec_[i];
+		map_ = other.map_;
+		fused_gates_ = other.fused_gates_;
+		diagonal_gates_ = other.diagonal_gates_;
+		fusion_qubits_min_ = other.fusion_qubits_min_;
+		fusion_qubits_max_ = other.fusion_qubits_max_;
+		fusion_window_ = other.fusion_window_;
+		window_ = other.window_;
+		fast_positions_ = other.fast_positions_;
+		heat_ = other.heat_;
+		rnd_eng_ = other.rnd_eng_;
+		return *this;
+	}
+	
 	void allocate_qubit(unsigned id){
-		if (map_.count(id) == 0){
-			map_[id] = N_++;
-			auto newvec = StateVector(1UL << N_);
+		allocate_qureg({id});
+	}
+	
+	// allocate several qubits at once, i.e., resize the state vector only once
+	// (the qubits are inserted such that qubits which are allocated later, i.e.,
+	// have larger IDs, are at higher bit-locations)
+	void allocate_qureg(std::vector<unsigned> ids){
+		for (std::size_t i = 0; i < ids.size(); ++i){
+			if (map_.count(ids[i]) != 0 || std::count(ids.begin(), ids.begin() + i, ids[i]) != 0)
+				throw(std::runtime_error("AllocateQubit: ID already exists. Qubit IDs should be unique."));
+		}
+		if (ids.size() == 0)
+			return;
+		std::sort(ids.begin(), ids.end());
+		
+		// bit-locations of the new qubits
+		std::vector<unsigned> positions(ids.size());
+		std::size_t newmask = 0;
+		for (std::size_t k = 0; k < ids.size(); ++k){
+			positions[k] = k + std::count_if(map_.begin(), map_.end(), [&](Map::value_type const& p){ return p.first < ids[k]; });
+			newmask |= 1UL << positions[k];
+		}
+		std::vector<unsigned> old_ids(N_);
+		for (auto const& p : map_)
+			old_ids[p.second] = p.first;
+		unsigned pos = 0, k = 0;
+		for (auto id : old_ids){
+			while (k < positions.size() && positions[k] == pos){
+				++pos;
+				++k;
+			}
+			map_[id] = pos++;
+		}
+		for (std::size_t k = 0; k < ids.size(); ++k)
+			map_[ids[k]] = positions[k];
+		N_ += ids.size();
+		
+		// the new entries are not initialized by resize (see mmap_allocator)
+		std::size_t old_size = vec_.size();
+		if (positions[0] == N_ - ids.size() && vec_.capacity() >= (1UL << N_)){
+			// the new qubits are at the top: reuse the memory of previously
+			// deallocated qubits
+			vec_.resize(1UL << N_);
 			#pragma omp parallel for schedule(static)
-			for (std::size_t i = 0; i < newvec.size(); ++i)
-				newvec[i] = (i < vec_.size())?vec_[i]:0.;
-			vec_ = std::move(newvec);
+			for (std::size_t i = old_size; i < vec_.size(); ++i)
+				vec_[i] = 0.;
+			return;
 		}
-		else
-			throw(std::runtime_error("AllocateQubit: ID already exists. Qubit IDs should be unique."));
+		StateVector newvec(vec_.get_allocator());
+		newvec.resize(1UL << N_);
+		#pragma omp parallel for schedule(static)
+		for (std::size_t i = 0; i < newvec.size(); ++i){
+			if ((i & newmask) != 0){
+				newvec[i] = 0.;
+				continue;
+			}
+			// remove the (zero) bits of the new qubits from the index
+			std::size_t j = i;
+			for (std::size_t k = positions.size(); k-- > 0;)
+				j = (j & ((1UL << positions[k]) - 1)) | ((j >> (positions[k] + 1)) << positions[k]);
+			newvec[i] = vec_[j];
+		}
+		vec_ = std::move(newvec);
+	}
+	
+	// tolerance for numerical errors (in the squared norm of an amplitude)
+	static calc_type default_tolerance(){
+		return std::is_same<calc_type, float>::value ? 1.e-8 : 1.e-12;
 	}
 	
-	bool get_classical_value(unsigned id, calc_type tol = 1.e-12){
+	bool get_classical_value(unsigned id, calc_type tol = default_tolerance()){
 		unsigned pos = map_[id];
 		std::size_t delta = (1UL << pos);
 		
@@ -75,7 +184,7 @@ public:
 		return false; // suppress 'control reaches end of non-void...'
 	}
 	
-	bool is_classical(unsigned id, calc_type tol = 1.e-12){
+	bool is_classical(unsigned id, calc_type tol = default_tolerance()){
 		run();
 		unsigned pos = map_[id];
 		std::size_t delta = (1UL << pos);
@@ -105,69 +214,396 @@ public:
 			}
 		}
 		else{
-			StateVector newvec((1UL << (N_-1)));
-			#pragma omp parallel for schedule(static)
-			for (std::size_t i = 0; i < vec_.size(); i += 2*delta)
-				std::copy_n(&vec_[i + static_cast<unsigned>(value)*delta], delta, &newvec[i/2]);
-			vec_ = std::move(newvec);
-			
+			// compact the state vector in-place (keeping its capacity for later
+			// allocations): block b of the result (the amplitudes with the same
+			// bits above pos) is block 2b + value of the old state vector, i.e.,
+			// copying block b only overwrites the source of a block with a
+			// smaller index. The blocks in [2^r, 2^(r+1)) can therefore be copied
+			// in parallel once all blocks below 2^r have been copied.
+			std::size_t half = vec_.size() / 2;
+			std::size_t num_blocks = half / delta;
+			std::size_t offset = static_cast<std::size_t>(value) * delta;
+			if (value){
+				#pragma omp parallel for schedule(static)
+				for (std::size_t j = 0; j < delta; ++j)
+					vec_[j] = vec_[j + delta];
+			}
+			for (std::size_t first = 1; first < num_blocks; first *= 2){
+				std::size_t last = std::min(2 * first, num_blocks);
+				#pragma omp parallel for collapse(2) schedule(static)
+				for (std::size_t b = first; b < last; ++b){
+					for (std::size_t j = 0; j < delta; ++j)
+						vec_[b * delta + j] = vec_[2 * b * delta + offset + j];
+				}
+			}
 			for (auto& p : map_){
 				if (p.second > pos)
 					p.second--;
 			}
+			vec_.resize(half);
 			map_.erase(id);
+			heat_.erase(id);
 			N_--;
 		}
 	}
 	
-	void measure_qubits(std::vector<unsigned> const& ids, std::vector<bool> &res){
+	// Measure the qubits ids and collapse the state vector accordingly. If
+	// deallocate is true, the measured qubits are removed from the state
+	// vector (i.e., they must not be used anymore).
+	void measure_qubits(std::vector<unsigned> const& ids, std::vector<bool> &res, bool deallocate = false){
 		run();
 		
 		std::vector<unsigned> positions(ids.size());
 		for (unsigned i = 0; i < ids.size(); ++i)
 			positions[i] = map_[ids[i]];
-			
-		calc_type P = 0.;
-		calc_type rnd = rng_();
 		
-		// pick entry at random with probability |entry|^2
-		unsigned pick = 0;
-		while (P < rnd && pick < vec_.size())
-			P += std::norm(vec_[pick++]);
+		// probabilities of blocks of entries, split up by the outcome if at most
+		// 4 qubits are measured (such that the norm of the collapsed state is
+		// known after this pass)
+		std::size_t num_outcomes = ids.size() <= 4 ? (1UL << ids.size()) : 1;
+		std::size_t block = std::min(vec_.size(), static_cast<std::size_t>(1UL << 16));
+		std::size_t num_blocks = vec_.size() / block;
+		std::vector<double> probs(num_blocks * num_outcomes, 0.);
+		#pragma omp parallel for schedule(static)
+		for (std::size_t b = 0; b < num_blocks; ++b){
+			double P[16] = {0.};
+			for (std::size_t i = b * block; i < (b + 1) * block; ++i){
+				std::size_t outcome = 0;
+				if (num_outcomes > 1){
+					for (unsigned k = 0; k < positions.size(); ++k)
+						outcome |= ((i >> positions[k]) & 1UL) << k;
+				}
+				P[outcome] += std::norm(vec_[i]);
+			}
+			for (std::size_t o = 0; o < num_outcomes; ++o)
+				probs[b * num_outcomes + o] = P[o];
+		}
+		std::vector<double> cumulative(num_blocks + 1, 0.);
+		for (std::size_t b = 0; b < num_blocks; ++b){
+			cumulative[b + 1] = cumulative[b];
+			for (std::size_t o = 0; o < num_outcomes; ++o)
+				cumulative[b + 1] += probs[b * num_outcomes + o];
+		}
+		
+		// pick entry at random with probability |entry|^2: find the block by
+		// bisection and then the entry within the block
+		double rnd = rng_() * cumulative.back();
+		std::size_t b = std::upper_bound(cumulative.begin() + 1, cumulative.end(), rnd) - cumulative.begin() - 1;
+		b = std::min(b, num_blocks - 1);
+		std::size_t pick = b * block;
+		double P = cumulative[b] + std::norm(vec_[pick]);
+		while (P <= rnd && pick + 1 < (b + 1) * block)
+			P += std::norm(vec_[++pick]);
+		// rounding errors must not lead to an outcome with probability 0
+		while (std::norm(vec_[pick]) == 0. && pick > b * block)
+			--pick;
 		
-		pick--;
 		// determine result vector (boolean values for each qubit)
 		// and create mask to detect bad entries (i.e., entries that don't agree with measurement)
 		res = std::vector<bool>(ids.size());
 		std::size_t mask = 0;
 		std::size_t val = 0;
+		std::size_t outcome = 0;
 		for (unsigned i = 0; i < ids.size(); ++i){
 			bool r = ((pick >> positions[i]) & 1) == 1;
 			res[i] = r;
 			mask |= (1UL << positions[i]);
 			val |= (static_cast<std::size_t>(r&1) << positions[i]);
+			outcome |= (static_cast<std::size_t>(r&1) << i);
 		}
-		// set bad entries to 0
-		calc_type N = 0.;
-		#pragma omp parallel for reduction(+:N) schedule(static)
+		double N = 0.;
+		if (num_outcomes > 1){
+			for (std::size_t b = 0; b < num_blocks; ++b)
+				N += probs[b * num_outcomes + outcome];
+		}
+		
+		if (deallocate){
+			// keep only the amplitudes which agree with the measurement
+			for (unsigned i = 0; i < ids.size(); ++i)
+				collapse_vector(ids[i], res[i], true);
+			mask = val = 0;
+		}
+		if (num_outcomes == 1){
+			#pragma omp parallel for reduction(+:N) schedule(static)
+			for (std::size_t i = 0; i < vec_.size(); ++i){
+				if ((i & mask) == val)
+					N += std::norm(vec_[i]);
+			}
+		}
+		// set bad entries to 0 and re-normalize the others (in one sweep)
+		calc_type factor = 1./std::sqrt(N);
+		#pragma omp parallel for schedule(static)
 		for (std::size_t i = 0; i < vec_.size(); ++i){
 			if ((i & mask) != val)
 				vec_[i] = 0.;
 			else
-				N += std::norm(vec_[i]);
+				vec_[i] *= factor;
 		}
-		// re-normalize
-		N = 1./std::sqrt(N);
-		#pragma omp parallel for schedule(static)
-		for (std::size_t i = 0; i < vec_.size(); ++i)
-			vec_[i] *= N;
 	}
 	
-	std::vector<bool> measure_qubits_return(std::vector<unsigned> const& ids){
+	std::vector<bool> measure_qubits_return(std::vector<unsigned> const& ids, bool deallocate = false){
 		std::vector<bool> ret;
-		measure_qubits(ids, ret);
+		measure_qubits(ids, ret, deallocate);
 		return ret;
 	}
+	std::vector<std::size_t> sample(std::vector<unsigned> const& ids, std::size_t shots){
+		run();
+		
+		std::vector<unsigned> positions(ids.size());
+		for (unsigned i = 0; i < ids.size(); ++i)
+			positions[i] = map_[ids[i]];
+		
+		// cumulative probabilities of blocks of entries
+		std::size_t block = std::min(vec_.size(), static_cast<std::size_t>(1UL << 12));
+		std::size_t num_blocks = vec_.size() / block;
+		std::vector<double> cumulative(num_blocks + 1, 0.);
+		#pragma omp parallel for schedule(static)
+		for (std::size_t b = 0; b < num_blocks; ++b){
+			double P = 0.;
+			for (std::size_t i = b * block; i < (b + 1) * block; ++i)
+				P += std::norm(vec_[i]);
+			cumulative[b + 1] = P;
+		}
+		for (std::size_t b = 0; b < num_blocks; ++b)
+			cumulative[b + 1] += cumulative[b];
+		
+		// draw all random numbers at once and sort them (keeping track of the
+		// shot they belong to) such that each block is scanned only once
+		std::vector<std::pair<double, std::size_t>> rnd(shots);
+		for (std::size_t s = 0; s < shots; ++s)
+			rnd[s] = std::make_pair(rng_() * cumulative.back(), s);
+		std::sort(rnd.begin(), rnd.end());
+		
+		std::vector<std::size_t> res(shots);
+		#pragma omp parallel for schedule(dynamic)
+		for (std::size_t b = 0; b < num_blocks; ++b){
+			auto first = std::lower_bound(rnd.begin(), rnd.end(), std::make_pair(cumulative[b], std::size_t(0)));
+			auto last = rnd.end();
+			if (b + 1 < num_blocks)
+				last = std::lower_bound(first, rnd.end(), std::make_pair(cumulative[b + 1], std::size_t(0)));
+			
+			std::size_t i = b * block;
+			double P = cumulative[b];
+			for (auto it = first; it != last; ++it){
+				while (i + 1 < (b + 1) * block && P + std::norm(vec_[i]) <= it->first)
+					P += std::norm(vec_[i++]);
+				// read out the bits of the sampled qubits
+				std::size_t value = 0;
+				for (unsigned k = 0; k < positions.size(); ++k)
+					value |= ((i >> positions[k]) & 1UL) << k;
+				res[it->second] = value;
+			}
+		}
+		return res;
+	}
+	
+	double get_expectation_value(PauliTerms const& terms){
+		run();
+		
+		// P|i> = i^(#Y) * (-1)^(#Y/Z-qubits which are 1 in i) |i ^ flipmask>,
+		// where flipmask contains all X and Y qubits. Terms with the same
+		// flipmask are evaluated in one sweep.
+		using Complex = std::complex<double>;
+		std::map<std::size_t, std::vector<std::pair<std::size_t, Complex>>> sweeps;
+		Complex const phases[] = {{1., 0.}, {0., 1.}, {-1., 0.}, {0., -1.}};
+		for (auto const& term : terms){
+			std::size_t flipmask = 0, signmask = 0, usedmask = 0;
+			unsigned num_y = 0;
+			for (auto const& op : term.first){
+				auto it = map_.find(op.first);
+				if (it == map_.end())
+					throw(std::runtime_error("get_expectation_value(): Unknown qubit id. Please make sure all qubits have been allocated previously (call eng.flush())."));
+				std::size_t bit = 1UL << it->second;
+				if (usedmask & bit)
+					throw(std::invalid_argument("get_expectation_value(): Pauli strings may act on each qubit at most once."));
+				usedmask |= bit;
+				switch (op.second){
+					case 'X':
+						flipmask |= bit;
+						break;
+					case 'Y':
+						flipmask |= bit;
+						signmask |= bit;
+						num_y++;
+						break;
+					case 'Z':
+						signmask |= bit;
+						break;
+					default:
+						throw(std::invalid_argument("Pauli strings may only contain 'X', 'Y', and 'Z'."));
+				}
+			}
+			sweeps[flipmask].push_back(std::make_pair(signmask, term.second * phases[num_y % 4]));
+		}
+		
+		double expectation = 0.;
+		for (auto const& sweep : sweeps){
+			std::size_t flipmask = sweep.first;
+			auto const& coeffs = sweep.second;
+			double re = 0.;
+			#pragma omp parallel for reduction(+:re) schedule(static)
+			for (std::size_t i = 0; i < vec_.size(); ++i){
+				Complex factor = 0.;
+				for (auto const& c : coeffs){
+					if (std::bitset<64>(i & c.first).count() & 1)
+						factor -= c.second;
+					else
+						factor += c.second;
+				}
+				re += (std::conj(Complex(vec_[i ^ flipmask])) * Complex(vec_[i]) * factor).real();
+			}
+			expectation += re;
+		}
+		return expectation;
+	}
+	
+	template <class D>
+	double get_expectation_value_diagonal(D const* diagonal, std::vector<unsigned> const& ids){
+		run();
+		
+		std::vector<unsigned> positions(ids.size());
+		for (unsigned i = 0; i < ids.size(); ++i)
+			positions[i] = map_[ids[i]];
+		
+		double expectation = 0.;
+		#pragma omp parallel for reduction(+:expectation) schedule(static)
+		for (std::size_t i = 0; i < vec_.size(); ++i){
+			std::size_t k = 0;
+			for (unsigned l = 0; l < positions.size(); ++l)
+				k |= ((i >> positions[l]) & 1UL) << l;
+			expectation += std::norm(vec_[i]) * diagonal[k];
+		}
+		return expectation;
+	}
+	
+	// Replace the state vector by wavefunction (2^#qubits amplitudes), where
+	// bit k of the index corresponds to the qubit ids[k], i.e., the qubits are
+	// mapped to the bit-locations given by ids (no amplitudes are permuted).
+	void set_wavefunction(complex_type const* wavefunction, std::vector<unsigned> const& ids){
+		run();
+		std::set<unsigned> unique_ids(ids.begin(), ids.end());
+		if (ids.size() != N_ || unique_ids.size() != N_ || std::any_of(ids.begin(), ids.end(), [&](unsigned id){ return map_.count(id) == 0; }))
+			throw(std::runtime_error("set_wavefunction(): Invalid mapping provided. Please make sure all qubits have been allocated previously (call eng.flush())."));
+		for (unsigned k = 0; k < N_; ++k)
+			map_[ids[k]] = k;
+		#pragma omp parallel for schedule(static)
+		for (std::size_t i = 0; i < vec_.size(); ++i)
+			vec_[i] = wavefunction[i];
+	}
+	
+	// Collapse the qubits ids to the given values (post-selection) and
+	// re-normalize the state.
+	void collapse_wavefunction(std::vector<unsigned> const& ids, std::vector<bool> const& values){
+		run();
+		if (ids.size() != values.size())
+			throw(std::invalid_argument("collapse_wavefunction(): The number of qubits and values must agree."));
+		std::size_t mask = 0, val = 0;
+		for (std::size_t k = 0; k < ids.size(); ++k){
+			if (map_.count(ids[k]) == 0)
+				throw(std::runtime_error("collapse_wavefunction(): Unknown qubit id. Please make sure all qubits have been allocated previously (call eng.flush())."));
+			mask |= 1UL << map_[ids[k]];
+			val |= static_cast<std::size_t>(values[k]) << map_[ids[k]];
+		}
+		double N = 0.;
+		#pragma omp parallel for reduction(+:N) schedule(static)
+		for (std::size_t i = 0; i < vec_.size(); ++i){
+			if ((i & mask) == val)
+				N += std::norm(vec_[i]);
+		}
+		if (N < default_tolerance())
+			throw(std::runtime_error("collapse_wavefunction(): Invalid collapse! Probability is ~0."));
+		calc_type factor = 1./std::sqrt(N);
+		#pragma omp parallel for schedule(static)
+		for (std::size_t i = 0; i < vec_.size(); ++i){
+			if ((i & mask) != val)
+				vec_[i] = 0.;
+			else
+				vec_[i] *= factor;
+		}
+	}
+	
+	// Write a checkpoint of the simulator (qubit map, state of the random number
+	// generator, and state vector) to the file path, see _checkpoint.py for the
+	// format. The amplitudes are written by all threads (at their offsets in
+	// the file), i.e., without copying the state vector.
+	void save_checkpoint(std::string const& path, std::string const& metadata = ""){
+		run();
+		std::vector<unsigned> ids(N_);
+		for (auto const& p : map_)
+			ids[p.second] = p.first;
+		std::ostringstream rng;
+		rng << "mt19937\n" << rnd_eng_;
+		
+		std::string header = "PQCKPT01";
+		append_integer(header, sizeof(complex_type), 4);
+		append_integer(header, N_, 4);
+		for (auto id : ids)
+			append_integer(header, id, 4);
+		append_integer(header, rng.str().size(), 8);
+		header += rng.str();
+		append_integer(header, metadata.size(), 8);
+		header += metadata;
+		std::size_t offset = (header.size() + 4095) / 4096 * 4096;
+		{
+			std::ofstream f(path, std::ios::binary | std::ios::trunc);
+			f.write(header.data(), header.size());
+			// the file has its final size before the threads write to it
+			f.seekp(offset + vec_.size() * sizeof(complex_type) - 1);
+			f.put('\0');
+			if (!f)
+				throw(std::runtime_error("Could not write the checkpoint '" + path + "'."));
+		}
+		transfer_amplitudes<complex_type>(path, offset, true);
+	}
+	
+	// Replace the state of the simulator by the one stored in the checkpoint
+	// file path and return the metadata of the checkpoint. Checkpoints of the
+	// other precision are converted.
+	std::string load_checkpoint(std::string const& path){
+		run();
+		std::ifstream f(path, std::ios::binary);
+		if (!f)
+			throw(std::runtime_error("Could not open the checkpoint '" + path + "'."));
+		std::string magic(8, '\0');
+		f.read(&magic[0], 8);
+		if (!f || magic != "PQCKPT01")
+			throw(std::invalid_argument("'" + path + "' is not a simulator checkpoint."));
+		std::size_t itemsize = read_integer(f, 4);
+		if (itemsize != 8 && itemsize != 16)
+			throw(std::invalid_argument("Unsupported amplitude size in the checkpoint."));
+		unsigned num_qubits = read_integer(f, 4);
+		std::vector<unsigned> ids(num_qubits);
+		for (auto& id : ids)
+			id = read_integer(f, 4);
+		std::string rng(read_integer(f, 8), '\0');
+		f.read(&rng[0], rng.size());
+		std::string metadata(read_integer(f, 8), '\0');
+		f.read(&metadata[0], metadata.size());
+		if (!f)
+			throw(std::invalid_argument("The checkpoint '" + path + "' is truncated."));
+		std::size_t offset = (static_cast<std::size_t>(f.tellg()) + 4095) / 4096 * 4096;
+		f.close();
+		
+		N_ = num_qubits;
+		map_.clear();
+		for (unsigned k = 0; k < num_qubits; ++k)
+			map_[ids[k]] = k;
+		heat_.clear();
+		vec_.resize(1UL << N_);
+		if (itemsize == sizeof(complex_type))
+			transfer_amplitudes<complex_type>(path, offset, false);
+		else if (itemsize == sizeof(std::complex<float>))
+			transfer_amplitudes<std::complex<float>>(path, offset, false);
+		else
+			transfer_amplitudes<std::complex<double>>(path, offset, false);
+		// the state of the random number generator of another simulator is ignored
+		if (rng.compare(0, 8, "mt19937\n") == 0){
+			std::istringstream is(rng.substr(8));
+			is >> rnd_eng_;
+		}
+		return metadata;
+	}
+	
 	void deallocate_qubit(unsigned id){
 		run();
 		assert(map_.count(id) == 1);
@@ -180,6 +616,21 @@ public:
 	
 	template <class M>
 	void apply_controlled_gate(M const& m, std::vector<unsigned> ids, std::vector<unsigned> ctrl){
+		bool diagonal = is_diagonal(m);
+		// buffer the gate in the fusion window (if enabled)
+		if (fusion_window_ > 0 && !(diagonal && window_.size() == 0)){
+			window_.emplace_back(m, ids, ctrl);
+			if (window_.size() >= fusion_window_)
+				run_fused_block();
+			return;
+		}
+		// diagonal gates commute: collect them until the next non-diagonal gate
+		if (diagonal && fused_gates_.size() == 0){
+			diagonal_gates_.insert(get_diagonal(m), ids, ctrl);
+			return;
+		}
+		run_diagonal_gates();
+		
 		auto fused_gates = fused_gates_;
 		fused_gates.insert(m, ids, ctrl);
 		
@@ -189,13 +640,114 @@ public:
 		}
 		else if (fused_gates.num_qubits() > fusion_qubits_max_ || (fused_gates.num_qubits()-ids.size())>fused_gates_.num_qubits()){
 			run();
-			fused_gates_.insert(m, ids, ctrl);
+			if (diagonal)
+				diagonal_gates_.insert(get_diagonal(m), ids, ctrl);
+			else
+				fused_gates_.insert(m, ids, ctrl);
 		}
 		else
 			fused_gates_ = fused_gates;
 		//run();
 	}
 	
+	void apply_controlled_permutation(std::vector<unsigned> const& perm, std::vector<unsigned> ids, std::vector<unsigned> ctrl){
+		// if there are pending (dense) gates, try to fuse the permutation with them
+		if (fused_gates_.size() > 0 || window_.size() > 0){
+			Fusion::Matrix m(perm.size(), Fusion::Matrix::value_type(perm.size(), 0.));
+			for (std::size_t k = 0; k < perm.size(); ++k)
+				m[perm[k]][k] = 1.;
+			apply_controlled_gate(m, ids, ctrl);
+			return;
+		}
+		run_diagonal_gates();
+		
+		for (auto& id : ids)
+			id = map_[id];
+		for (auto& c : ctrl)
+			c = map_[c];
+		permutation_kernel(vec_, ids, perm, ctrl);
+	}
+	
+	// Gates are fused until they act on at least fusion_min qubits, and at
+	// most on fusion_max qubits.
+	void set_fusion_limits(unsigned fusion_min, unsigned fusion_max){
+		if (fusion_min < 1 || fusion_min > fusion_max || fusion_max > 5)
+			throw(std::invalid_argument("The fusion limits must satisfy 1 <= fusion_min <= fusion_max <= 5."));
+		run();
+		fusion_qubits_min_ = fusion_min;
+		fusion_qubits_max_ = fusion_max;
+	}
+	
+	std::tuple<unsigned, unsigned> get_fusion_limits() const{
+		return std::make_tuple(fusion_qubits_min_, fusion_qubits_max_);
+	}
+	
+	// Pick the fusion limits for this machine (and set them): time one sweep
+	// of a k-qubit kernel (k = 1, ..., 5) over a scratch state vector of
+	// 2^num_qubits amplitudes. A fused k-qubit gate replaces (at least) k
+	// gates, i.e., fusing more qubits pays off as long as the time per qubit
+	// decreases (compute-bound kernels get more expensive with k).
+	std::tuple<unsigned, unsigned> autotune_fusion(unsigned num_qubits = 18){
+		if (num_qubits < 5)
+			throw(std::invalid_argument("The fusion limits must be tuned on at least 5 qubits."));
+		StateVector psi(1UL << num_qubits, 0.);
+		psi[0] = 1.;
+		std::vector<double> cost(6, 0.);
+		for (unsigned k = 1; k <= 5; ++k){
+			std::size_t dim = 1UL << k;
+			Fusion::Matrix m(dim, Fusion::Matrix::value_type(dim));
+			for (std::size_t i = 0; i < dim; ++i)
+				for (std::size_t j = 0; j < dim; ++j)
+					m[i][j] = (std::bitset<5>(i & j).count() % 2 ? -1. : 1.) / std::sqrt(double(dim));
+			Fusion::IndexVector ids(k);
+			for (unsigned l = 0; l < k; ++l)
+				ids[l] = num_qubits - k + l; // worst case: the highest bit-locations
+			double best = -1.;
+			for (unsigned rep = 0; rep < 3; ++rep){
+				auto start = std::chrono::steady_clock::now();
+				apply_kernel(psi, ids, m, 0);
+				std::chrono::duration<double> t = std::chrono::steady_clock::now() - start;
+				if (best < 0. || t.count() < best)
+					best = t.count();
+			}
+			cost[k] = best / k;
+		}
+		unsigned fusion_max = 1;
+		for (unsigned k = 2; k <= 5; ++k)
+			if (cost[k] < cost[fusion_max])
+				fusion_max = k;
+		// run as soon as the cost per qubit is close to optimal
+		unsigned fusion_min = fusion_max;
+		while (fusion_min > 1 && cost[fusion_min - 1] <= 1.1 * cost[fusion_max])
+			fusion_min--;
+		set_fusion_limits(fusion_min, fusion_max);
+		return get_fusion_limits();
+	}
+	
+	// Enable (fast_positions > 0) or disable (fast_positions = 0) the automatic
+	// reordering of qubits: qubits which are used repeatedly by dense gates are
+	// moved to the fast_positions lowest bit-locations, where the kernels
+	// access the state vector with good locality (e.g., 2^14 amplitudes fit
+	// into the L2 cache).
+	void set_qubit_reordering(unsigned fast_positions){
+		fast_positions_ = fast_positions;
+	}
+	
+	// Buffer up to size gates (0: disabled) and fuse them into blocks of at
+	// most fusion_max qubits, where a gate may join a block across the gates
+	// which are skipped in between if it acts on other qubits than those (gates
+	// on disjoint qubits commute).
+	void set_fusion_window(unsigned size){
+		run();
+		fusion_window_ = size;
+	}
+	
+	void swap_qubits(unsigned id1, unsigned id2){
+		// pending gates are mapped to bit-locations when they are run
+		run();
+		std::swap(map_[id1], map_[id2]);
+	}
+	
 	template <class F, class QuReg>
 	void emulate_math(F const& f, QuReg quregs, std::vector<unsigned> ctrl, unsigned num_threads=1){
 		run();
@@ -205,26 +757,57 @@ public:
 			for (unsigned j = 0; j < quregs[i].size(); ++j)
 				quregs[i][j] = map_[quregs[i][j]];
 
-		StateVector newvec(vec_.size(), 0.);
+		// map the basis state i to its new index (calls f)
+		auto new_index = [&](std::size_t i, std::vector<int>& res){
+			for (unsigned qr_i = 0; qr_i < quregs.size(); ++qr_i){
+				res[qr_i] = 0;
+				for (unsigned qb_i = 0; qb_i < quregs[qr_i].size(); ++qb_i)
+					res[qr_i] |= ((i >> quregs[qr_i][qb_i])&1) << qb_i;
+			}
+			f(res);
+			auto new_i = i;
+			for (unsigned qr_i = 0; qr_i < quregs.size(); ++qr_i){
+				for (unsigned qb_i = 0; qb_i < quregs[qr_i].size(); ++qb_i){
+					if (!(((new_i >> quregs[qr_i][qb_i])&1) == ((res[qr_i] >> qb_i)&1)))
+						new_i ^= (1UL << quregs[qr_i][qb_i]);
+				}
+			}
+			return new_i;
+		};
+		// amplitudes below the rounding error are treated as zero, i.e., f is
+		// only evaluated on the support of the state
+		calc_type tol = std::numeric_limits<calc_type>::epsilon() * std::numeric_limits<calc_type>::epsilon();
+		std::size_t support = 0;
+		#pragma omp parallel for schedule(static) reduction(+:support)
+		for (std::size_t i = 0; i < vec_.size(); ++i)
+			support += ((ctrlmask&i) == ctrlmask && std::norm(vec_[i]) > tol);
 		std::vector<int> res(quregs.size());
 		
+		if (support <= vec_.size() / 4){
+			// sparse state: move the non-zero amplitudes out of the state vector
+			// and scatter them back to their new locations
+			math_buffer_.clear();
+			for (std::size_t i = 0; i < vec_.size(); ++i){
+				if ((ctrlmask&i) == ctrlmask){
+					if (std::norm(vec_[i]) > tol)
+						math_buffer_.emplace_back(i, vec_[i]);
+					vec_[i] = 0.;
+				}
+			}
+			#pragma omp parallel for schedule(static) firstprivate(res) num_threads(num_threads)
+			for (std::size_t k = 0; k < math_buffer_.size(); ++k)
+				math_buffer_[k].first = new_index(math_buffer_[k].first, res);
+			for (auto const& entry : math_buffer_)
+				vec_[entry.first] += entry.second;
+			return;
+		}
+		
+		StateVector newvec(vec_.size(), 0., vec_.get_allocator());
 		#pragma omp parallel for schedule(static) firstprivate(res) num_threads(num_threads)
 		for (std::size_t i = 0; i < vec_.size(); ++i){
 			if ((ctrlmask&i) == ctrlmask){
-				for (unsigned qr_i = 0; qr_i < quregs.size(); ++qr_i){
-					res[qr_i] = 0;
-					for (unsigned qb_i = 0; qb_i < quregs[qr_i].size(); ++qb_i)
-						res[qr_i] |= ((i >> quregs[qr_i][qb_i])&1) << qb_i;
-				}
-				f(res);
-				auto new_i = i;
-				for (unsigned qr_i = 0; qr_i < quregs.size(); ++qr_i){
-					for (unsigned qb_i = 0; qb_i < quregs[qr_i].size(); ++qb_i){
-						if (!(((new_i >> quregs[qr_i][qb_i])&1) == ((res[qr_i] >> qb_i)&1)))
-							new_i ^= (1UL << quregs[qr_i][qb_i]);
-					}
-				}
-				newvec[new_i] += vec_[i];
+				if (std::norm(vec_[i]) > tol)
+					newvec[new_index(i, res)] += vec_[i];
 			}
 			else
 				newvec[i] += vec_[i];
@@ -232,7 +815,71 @@ public:
 		vec_ = std::move(newvec);
 	}
 	
+	// Add the constant a to the number stored in the qubits ids (from low- to
+	// high-bit) modulo 2^#qubits.
+	void emulate_math_add_constant(long long a, std::vector<unsigned> const& ids, std::vector<unsigned> const& ctrl){
+		std::size_t mask = (1UL << ids.size()) - 1;
+		std::size_t shift = static_cast<std::size_t>(a) & mask;
+		emulate_math_permutation([=](std::size_t x){ return (x + shift) & mask; }, ids, ctrl);
+	}
+	
+	// Add the constant a to the number stored in the qubits ids modulo N
+	// (values x >= N are left unchanged).
+	void emulate_math_add_constant_modN(long long a, std::size_t N, std::vector<unsigned> const& ids, std::vector<unsigned> const& ctrl){
+		if (N == 0 || N > (1UL << ids.size()))
+			throw(std::invalid_argument("The modulus must satisfy 0 < N <= 2^#qubits."));
+		std::size_t shift = static_cast<std::size_t>(((a % (long long)N) + (long long)N) % (long long)N);
+		emulate_math_permutation([=](std::size_t x){ return x < N ? (x + shift) % N : x; }, ids, ctrl);
+	}
+	
+	// Multiply the number stored in the qubits ids by the constant a modulo N
+	// (values x >= N are left unchanged).
+	void emulate_math_multiply_by_constant_modN(std::size_t a, std::size_t N, std::vector<unsigned> const& ids, std::vector<unsigned> const& ctrl){
+		if (N == 0 || N > (1UL << ids.size()))
+			throw(std::invalid_argument("The modulus must satisfy 0 < N <= 2^#qubits."));
+		a %= N;
+		std::size_t g = a, h = N;
+		while (h != 0){
+			std::swap(g, h);
+			h %= g;
+		}
+		auto f = [=](std::size_t x){ return x < N ? mulmod(a, x, N) : x; };
+		if (g == 1){
+			emulate_math_permutation(f, ids, ctrl);
+			return;
+		}
+		// not a permutation: sum up the amplitudes (sequentially)
+		emulate_math([&](std::vector<int>& x){ x[0] = static_cast<int>(f(x[0])); }, std::vector<std::vector<unsigned>>{ids}, ctrl);
+	}
+	
+	// Emulate a math function given by its lookup table, i.e., the number x
+	// stored in the qubits ids (from low- to high-bit) is mapped to table[x]
+	// (table has 2^#qubits entries).
+	void emulate_math_table(std::int64_t const* table, std::vector<unsigned> const& ids, std::vector<unsigned> const& ctrl){
+		std::size_t size = 1UL << ids.size();
+		auto f = [=](std::size_t x){ return static_cast<std::size_t>(table[x]) & (size - 1); };
+		std::vector<bool> seen(size, false);
+		bool permutation = true;
+		for (std::size_t x = 0; x < size && permutation; ++x){
+			permutation = !seen[f(x)];
+			seen[f(x)] = true;
+		}
+		if (permutation){
+			emulate_math_permutation(f, ids, ctrl);
+			return;
+		}
+		// not a permutation: sum up the amplitudes (sequentially)
+		emulate_math([&](std::vector<int>& x){ x[0] = static_cast<int>(f(x[0])); }, std::vector<std::vector<unsigned>>{ids}, ctrl);
+	}
+	
 	void run(){
+		while (window_.size() > 0)
+			run_fused_block();
+		run_diagonal_gates();
+		run_fused_gates();
+	}
+	
+	void run_fused_gates(){
 		if (fused_gates_.size() < 1)
 			return;
 		
@@ -241,43 +888,267 @@ public:
 		
 		fused_gates_.perform_fusion(m, ids, ctrls);
 		
+		bool diagonal = is_diagonal(m);
+		if (!diagonal && fast_positions_ > 0)
+			reorder_qubits(ids);
+		
 		for (auto& id : ids)
 			id = map_[id];
 		
+		if (diagonal){
+			for (auto& c : ctrls)
+				c = map_[c];
+			diagonal_kernel(vec_, {PhaseTable(get_diagonal(m), ids, ctrls)});
+			fused_gates_ = Fusion();
+			return;
+		}
+		
 		auto ctrlmask = get_control_mask(ctrls);
-			
+		apply_kernel(vec_, ids, m, ctrlmask);
+		
+		fused_gates_ = Fusion();
+	}
+	
+	void run_diagonal_gates(){
+		if (diagonal_gates_.size() < 1)
+			return;
+		
+		// translate qubit IDs to bit-locations
+		auto tables = diagonal_gates_.get_tables();
+		for (auto& t : tables){
+			for (auto& id : t.get_indices())
+				id = map_[id];
+			for (auto& c : t.get_controls())
+				c = map_[c];
+		}
+		diagonal_kernel(vec_, tables);
+		
+		diagonal_gates_ = DiagonalFusion();
+	}
+	
+	std::tuple<Map, StateVector&> cheat(){
+		run();
+		return make_tuple(map_, std::ref(vec_));
+	}
+	~BasicSimulator(){
+	}
+private:
+	static void append_integer(std::string& s, std::uint64_t value, unsigned num_bytes){
+		for (unsigned k = 0; k < num_bytes; ++k)
+			s.push_back(static_cast<char>((value >> (8 * k)) & 0xff));
+	}
+	
+	// Return a * b % N without overflow (for a, b < N).
+	static std::size_t mulmod(std::size_t a, std::size_t b, std::size_t N){
+#ifdef __SIZEOF_INT128__
+		return static_cast<std::size_t>(static_cast<unsigned __int128>(a) * b % N);
+#else
+		// double-and-add, keeping all intermediate results below N
+		std::size_t result = 0;
+		for (; b != 0; b >>= 1){
+			if (b & 1)
+				result = result >= N - a ? result - (N - a) : result + a;
+			a = a >= N - a ? a - (N - a) : a + a;
+		}
+		return result;
+#endif
+	}
+	
+	static std::uint64_t read_integer(std::istream& is, unsigned num_bytes){
+		std::uint64_t value = 0;
+		for (unsigned k = 0; k < num_bytes; ++k)
+			value |= static_cast<std::uint64_t>(static_cast<unsigned char>(is.get())) << (8 * k);
+		return value;
+	}
+	
+	// Read (or write) the state vector from (to) the file path, where the
+	// amplitudes are stored as C starting at offset. Each thread processes
+	// chunks of the state vector using its own file stream.
+	template <class C>
+	void transfer_amplitudes(std::string const& path, std::size_t offset, bool write){
+		bool convert = !std::is_same<C, complex_type>::value;
+		std::size_t chunk = std::min(vec_.size(), static_cast<std::size_t>(1UL << 22));
+		std::size_t num_chunks = vec_.size() / chunk;
+		bool ok = true;
+		#pragma omp parallel reduction(&&:ok)
+		{
+			std::fstream f(path, std::ios::binary | (write ? std::ios::in | std::ios::out : std::ios::in));
+			std::vector<C> buffer(convert ? chunk : 0);
+			#pragma omp for schedule(static)
+			for (std::size_t c = 0; c < num_chunks; ++c){
+				complex_type* data = &vec_[c * chunk];
+				std::streamoff pos = offset + c * chunk * sizeof(C);
+				if (write){
+					f.seekp(pos);
+					f.write(reinterpret_cast<char const*>(data), chunk * sizeof(C));
+				}
+				else if (!convert){
+					f.seekg(pos);
+					f.read(reinterpret_cast<char*>(data), chunk * sizeof(C));
+				}
+				else{
+					f.seekg(pos);
+					f.read(reinterpret_cast<char*>(buffer.data()), chunk * sizeof(C));
+					for (std::size_t i = 0; i < chunk; ++i)
+						data[i] = complex_type(buffer[i].real(), buffer[i].imag());
+				}
+			}
+			ok = static_cast<bool>(f);
+		}
+		if (!ok)
+			throw(std::runtime_error(std::string("Could not ") + (write ? "write" : "read") + " the checkpoint '" + path + "'."));
+	}
+	
+	// Apply the permutation f of the values of the number stored in the qubits
+	// ids (from low- to high-bit) to the amplitudes where all ctrl qubits are 1.
+	template <class F>
+	void emulate_math_permutation(F const& f, std::vector<unsigned> ids, std::vector<unsigned> const& ctrl){
+		run();
+		auto ctrlmask = get_control_mask(ctrl);
+		for (auto& id : ids)
+			id = map_[id];
+		
+		// every entry is written exactly once (f is a permutation)
+		StateVector newvec(vec_.get_allocator());
+		newvec.resize(vec_.size());
+		#pragma omp parallel for schedule(static)
+		for (std::size_t i = 0; i < vec_.size(); ++i){
+			std::size_t new_i = i;
+			if ((i & ctrlmask) == ctrlmask){
+				std::size_t x = 0;
+				for (std::size_t k = 0; k < ids.size(); ++k)
+					x |= ((i >> ids[k]) & 1UL) << k;
+				std::size_t y = f(x);
+				for (std::size_t k = 0; k < ids.size(); ++k)
+					new_i = (new_i & ~(1UL << ids[k])) | (((y >> k) & 1UL) << ids[k]);
+			}
+			newvec[new_i] = vec_[i];
+		}
+		vec_ = std::move(newvec);
+	}
+	
+	struct WindowGate{
+		WindowGate(Fusion::Matrix const& m, std::vector<unsigned> const& ids, std::vector<unsigned> const& ctrl) : m(m), ids(ids), ctrl(ctrl) {}
+		Fusion::Matrix m;
+		std::vector<unsigned> ids, ctrl;
+	};
+	
+	// Fuse the first gate of the window with all later gates which fit into
+	// the block (at most fusion_max qubits) and do not act on any of the
+	// qubits of the gates which have been skipped, then run the block.
+	void run_fused_block(){
+		run_diagonal_gates();
+		std::set<unsigned> block, blocked;
+		std::vector<WindowGate> skipped;
+		for (auto& g : window_){
+			std::set<unsigned> qubits(g.ids.begin(), g.ids.end());
+			qubits.insert(g.ctrl.begin(), g.ctrl.end());
+			bool commutes = std::none_of(qubits.begin(), qubits.end(), [&blocked](unsigned q){ return blocked.count(q) > 0; });
+			auto joined = block;
+			joined.insert(qubits.begin(), qubits.end());
+			if (fused_gates_.size() == 0 || (commutes && joined.size() <= fusion_qubits_max_)){
+				fused_gates_.insert(g.m, g.ids, g.ctrl);
+				block = std::move(joined);
+			}
+			else{
+				blocked.insert(qubits.begin(), qubits.end());
+				skipped.push_back(std::move(g));
+			}
+		}
+		window_ = std::move(skipped);
+		run_fused_gates();
+	}
+	
+	// apply the dense k-qubit gate m (k <= 5) to the bit-locations ids of psi
+	void apply_kernel(StateVector& psi, Fusion::IndexVector const& ids, Fusion::Matrix const& m, std::size_t ctrlmask){
 		switch (ids.size()){
 			case 1:
 				#pragma omp parallel
-				kernel(vec_, ids[0], m, ctrlmask);
+				kernel(psi, ids[0], m, ctrlmask);
 				break;
 			case 2:
 				#pragma omp parallel
-				kernel(vec_, ids[1], ids[0], m, ctrlmask);
+				kernel(psi, ids[1], ids[0], m, ctrlmask);
 				break;
 			case 3:
 				#pragma omp parallel
-				kernel(vec_, ids[2], ids[1], ids[0], m, ctrlmask);
+				kernel(psi, ids[2], ids[1], ids[0], m, ctrlmask);
 				break;
 			case 4:
 				#pragma omp parallel
-				kernel(vec_, ids[3], ids[2], ids[1], ids[0], m, ctrlmask);
+				kernel(psi, ids[3], ids[2], ids[1], ids[0], m, ctrlmask);
 				break;
 			case 5:
 				#pragma omp parallel
-				kernel(vec_, ids[4], ids[3], ids[2], ids[1], ids[0], m, ctrlmask);
+				kernel(psi, ids[4], ids[3], ids[2], ids[1], ids[0], m, ctrlmask);
 				break;
+			default:
+				throw(std::invalid_argument("Gates with more than 5 qubits are not supported!"));
 		}
+	}
+	
+	// Move the (hot) target qubits ids of a dense gate to the fast bit-locations
+	// by swapping them with the coldest qubits there.
+	void reorder_qubits(Fusion::IndexVector const& ids){
+		for (auto& h : heat_)
+			h.second *= 0.9;
+		for (auto id : ids)
+			heat_[id] += 1.;
+		if (N_ <= fast_positions_)
+			return;
 		
-		fused_gates_ = Fusion();
+		std::vector<unsigned> id_at(N_);
+		for (auto const& p : map_)
+			id_at[p.second] = p.first;
+		for (auto id : ids){
+			unsigned pos = map_[id];
+			if (pos < fast_positions_)
+				continue;
+			unsigned cold = fast_positions_;
+			for (unsigned q = 0; q < fast_positions_; ++q){
+				if (std::find(ids.begin(), ids.end(), id_at[q]) == ids.end() && (cold == fast_positions_ || heat_[id_at[q]] < heat_[id_at[cold]]))
+					cold = q;
+			}
+			// the swap costs about one sweep over the state vector, i.e., it
+			// only pays off for qubits which have been used repeatedly by the
+			// last few gates (and are therefore likely to be used again)
+			if (cold == fast_positions_ || heat_[id] - heat_[id_at[cold]] < 1.5)
+				continue;
+			swap_positions(cold, pos);
+			std::swap(map_[id], map_[id_at[cold]]);
+			std::swap(id_at[cold], id_at[pos]);
+		}
 	}
-	std::tuple<Map, StateVector&> cheat(){
-		run();
-		return make_tuple(map_, std::ref(vec_));
+	
+	// exchange the amplitudes of the qubits at the bit-locations q < p
+	void swap_positions(unsigned q, unsigned p){
+		std::size_t dq = 1UL << q, dp = 1UL << p;
+		#pragma omp parallel for collapse(2) schedule(static)
+		for (std::size_t i = 0; i < vec_.size(); i += 2*dp){
+			for (std::size_t j = 0; j < dp; j += 2*dq){
+				for (std::size_t k = 0; k < dq; ++k)
+					std::swap(vec_[i + j + k + dq], vec_[i + j + k + dp]);
+			}
+		}
 	}
-	~Simulator(){
+	
+	template <class M>
+	bool is_diagonal(M const& m){
+		for (std::size_t i = 0; i < m.size(); ++i)
+			for (std::size_t j = 0; j < m.size(); ++j)
+				if (i != j && m[i][j] != 0.)
+					return false;
+		return true;
 	}
-private:
+	
+	template <class M>
+	DiagonalFusion::Diagonal get_diagonal(M const& m){
+		DiagonalFusion::Diagonal diag(m.size());
+		for (std::size_t i = 0; i < m.size(); ++i)
+			diag[i] = m[i][i];
+		return diag;
+	}
+	
 	std::size_t get_control_mask(std::vector<unsigned> const& ctrls){
 		std::size_t ctrlmask = 0;
 		for (auto c : ctrls)
@@ -289,9 +1160,18 @@ private:
 	StateVector vec_;
 	Map map_;
 	Fusion fused_gates_;
+	DiagonalFusion diagonal_gates_;
 	unsigned fusion_qubits_min_, fusion_qubits_max_;
+	unsigned fusion_window_; // 0: gates are fused in the order of arrival
+	std::vector<WindowGate> window_;
+	unsigned fast_positions_; // 0: qubits are not reordered automatically
+	std::map<unsigned, double> heat_; // (decaying) usage count of each qubit
+	std::vector<std::pair<std::size_t, complex_type>> math_buffer_; // support of the state (emulate_math)
 	RndEngine rnd_eng_;
 	std::function<double()> rng_;
 };
 
+using Simulator = BasicSimulator<double>;
+using SimulatorSingle = BasicSimulator<float>;
+
 #endif
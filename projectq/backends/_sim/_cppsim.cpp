@@ -25,13 +25,11 @@
 
 namespace py = pybind11;
 
-using c_type = std::complex<double>;
-using ArrayType = std::vector<c_type, aligned_allocator<c_type,64>>;
-using MatrixType = std::vector<ArrayType>;
+using MatrixType = std::vector<std::vector<std::complex<double>, aligned_allocator<std::complex<double>,64>>>;
 using QuRegs = std::vector<std::vector<unsigned>>;
 
-template <class QR>
-void emulate_math_wrapper(Simulator &sim, py::function const& pyfunc, QR const& qr, std::vector<unsigned> const& ctrls){
+template <class Sim, class QR>
+void emulate_math_wrapper(Sim &sim, py::function const& pyfunc, QR const& qr, std::vector<unsigned> const& ctrls){
 	auto f = [&](std::vector<int>& x) {
 		pybind11::gil_scoped_acquire acquire;
 		x = std::move(pyfunc(x).cast<std::vector<int>>());
@@ -39,19 +37,116 @@ void emulate_math_wrapper(Simulator &sim, py::function const& pyfunc, QR const&
 	pybind11::gil_scoped_release release;
 	sim.emulate_math(f, qr, ctrls);
 }
+template <class Sim>
+py::array_t<std::size_t> sample_wrapper(Sim &sim, std::vector<unsigned> const& ids, std::size_t shots){
+	std::vector<std::size_t> samples;
+	{
+		pybind11::gil_scoped_release release;
+		samples = sim.sample(ids, shots);
+	}
+	return py::array_t<std::size_t>(samples.size(), samples.data());
+}
+
+template <class Sim>
+double expectation_value_diagonal_wrapper(Sim &sim, py::array_t<double, py::array::c_style | py::array::forcecast> const& diagonal, std::vector<unsigned> const& ids){
+	if (diagonal.size() != (1UL << ids.size()))
+		throw(std::invalid_argument("The diagonal must have 2^(#qubits) entries."));
+	double const* data = diagonal.data();
+	pybind11::gil_scoped_release release;
+	return sim.get_expectation_value_diagonal(data, ids);
+}
+
+template <class Sim>
+void emulate_math_table_wrapper(Sim &sim, py::array_t<std::int64_t, py::array::c_style | py::array::forcecast> const& table, std::vector<unsigned> const& ids, std::vector<unsigned> const& ctrls){
+	if (table.size() != (1UL << ids.size()))
+		throw(std::invalid_argument("The lookup table must have 2^(#qubits) entries."));
+	std::int64_t const* data = table.data();
+	pybind11::gil_scoped_release release;
+	sim.emulate_math_table(data, ids, ctrls);
+}
+
+template <class Sim>
+void set_wavefunction_wrapper(Sim &sim, py::array_t<typename Sim::complex_type, py::array::c_style | py::array::forcecast> const& wavefunction, std::vector<unsigned> const& ids){
+	if (wavefunction.size() != (1UL << ids.size()))
+		throw(std::invalid_argument("The wavefunction must have 2^(#qubits) entries."));
+	auto data = wavefunction.data();
+	pybind11::gil_scoped_release release;
+	sim.set_wavefunction(data, ids);
+}
+
+template <class Sim>
+Sim* snapshot_wrapper(Sim const& sim){
+	pybind11::gil_scoped_release release;
+	return new Sim(sim);
+}
+
+template <class Sim>
+void restore_wrapper(Sim &sim, Sim const& snapshot){
+	pybind11::gil_scoped_release release;
+	sim = snapshot;
+}
+
+// Return the qubit IDs ordered by their bit-location and a NumPy array which
+// aliases the state vector of the simulator (read-only unless writable=true).
+template <class Sim>
+py::tuple cheat_wrapper(py::object self, bool writable){
+	using c_type = typename Sim::complex_type;
+	auto res = self.cast<Sim&>().cheat();
+	auto const& map = std::get<0>(res);
+	auto& vec = std::get<1>(res);
+	
+	py::array_t<unsigned> ids(map.size());
+	auto ids_ptr = ids.mutable_data();
+	for (auto const& p : map)
+		ids_ptr[p.second] = p.first;
+	
+	// the array keeps the simulator alive
+	py::array_t<c_type> state({vec.size()}, {sizeof(c_type)}, vec.data(), self);
+	if (!writable)
+		state.attr("setflags")(py::arg("write") = false);
+	return py::make_tuple(ids, state);
+}
+
+template <class Sim>
+void declare_simulator(py::module &m, char const* name){
+	py::class_<Sim>(m, name)
+		.def(py::init<unsigned, std::string const&>(), py::arg("seed"), py::arg("storage_dir") = "")
+		.def("allocate_qubit", &Sim::allocate_qubit)
+		.def("allocate_qureg", &Sim::allocate_qureg)
+		.def("set_qubit_reordering", &Sim::set_qubit_reordering)
+		.def("set_fusion_window", &Sim::set_fusion_window)
+		.def("set_fusion_limits", &Sim::set_fusion_limits)
+		.def("get_fusion_limits", &Sim::get_fusion_limits)
+		.def("autotune_fusion", &Sim::autotune_fusion, py::arg("num_qubits") = 18)
+		.def("deallocate_qubit", &Sim::deallocate_qubit)
+		.def("get_classical_value", &Sim::get_classical_value)
+		.def("is_classical", &Sim::is_classical)
+		.def("measure_qubits", &Sim::measure_qubits_return, py::arg("ids"), py::arg("deallocate") = false)
+		.def("sample", &sample_wrapper<Sim>)
+		.def("get_expectation_value", &Sim::get_expectation_value)
+		.def("get_expectation_value_diagonal", &expectation_value_diagonal_wrapper<Sim>)
+		.def("apply_controlled_gate", &Sim::template apply_controlled_gate<MatrixType>)
+		.def("apply_controlled_permutation", &Sim::apply_controlled_permutation)
+		.def("swap_qubits", &Sim::swap_qubits)
+		.def("emulate_math", &emulate_math_wrapper<Sim, QuRegs>)
+		.def("emulate_math_table", &emulate_math_table_wrapper<Sim>)
+		.def("emulate_math_add_constant", &Sim::emulate_math_add_constant)
+		.def("emulate_math_add_constant_modN", &Sim::emulate_math_add_constant_modN)
+		.def("emulate_math_multiply_by_constant_modN", &Sim::emulate_math_multiply_by_constant_modN)
+		.def("run", &Sim::run)
+		.def("cheat", &cheat_wrapper<Sim>, py::arg("writable") = false)
+		.def("set_wavefunction", &set_wavefunction_wrapper<Sim>)
+		.def("collapse_wavefunction", &Sim::collapse_wavefunction)
+		.def("save_checkpoint", &Sim::save_checkpoint, py::arg("path"), py::arg("metadata") = "")
+		.def("load_checkpoint", &Sim::load_checkpoint)
+		.def("snapshot", &snapshot_wrapper<Sim>)
+		.def("restore", &restore_wrapper<Sim>)
+		;
+}
+
 PYBIND11_PLUGIN(_cppsim) {
 	py::module m("_cppsim", "_cppsim");
-	py::class_<Simulator>(m, "Simulator")
-		.def(py::init<unsigned>())
-		.def("allocate_qubit", &Simulator::allocate_qubit)
-		.def("deallocate_qubit", &Simulator::deallocate_qubit)
-		.def("get_classical_value", &Simulator::get_classical_value)
-		.def("is_classical", &Simulator::is_classical)
-		.def("measure_qubits", &Simulator::measure_qubits_return)
-		.def("apply_controlled_gate", &Simulator::apply_controlled_gate<MatrixType>)
-		.def("emulate_math", &emulate_math_wrapper<QuRegs>)
-		.def("run", &Simulator::run)
-		.def("cheat", &Simulator::cheat)
-		;
+	declare_simulator<Simulator>(m, "Simulator");
+	declare_simulator<SimulatorSingle>(m, "SimulatorSingle");
 	return m.ptr();
 }
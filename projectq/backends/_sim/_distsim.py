@@ -0,0 +1,1161 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Contains a simulator which distributes the state vector over several worker
+processes.
+
+The state vector is sharded by its top k bits (the global qubits), i.e., each
+of the 2^k workers (ranks) stores the amplitudes where the global qubits take
+the value of its rank, and simulates the remaining (local) qubits using a
+C++/Python simulator. Gates acting on local qubits are applied by all workers
+independently. Before a gate is applied to global qubits, these are swapped
+with local qubits (qubit-swap remapping), which requires each pair of workers
+to exchange half of their amplitudes. Gates which do not mix the values of the
+global qubits (e.g., diagonal gates) are applied without any communication.
+"""
+
+import json
+import multiprocessing as _mp
+import random
+import weakref
+
+import numpy as _np
+
+from . import _checkpoint
+
+# Minimal number of local qubits (before any global qubit is used), such that
+# each k-qubit gate with k <= 5 can be made local by swapping qubits.
+_MIN_LOCAL_QUBITS = 5
+
+_LOCAL = 'l'
+_GLOBAL = 'g'
+
+
+class _Shard(object):
+	"""
+	Part of the state vector which is stored by a worker process.
+
+	Local qubits are referred to by handles (the qubit IDs of the underlying
+	simulator), global qubits by their slot, i.e., the bit of the rank which
+	encodes their value.
+	"""
+	def __init__(self, rank, simulator, partners):
+		"""
+		Initialize the shard. Only rank 0 holds the (non-zero) initial state.
+
+		Args:
+			rank (int): Rank of the worker process.
+			simulator: C++/Python simulator for the local qubits.
+			partners (dict): Maps each slot to the connection to the worker whose
+				rank differs in this bit.
+		"""
+		self._rank = rank
+		self._sim = simulator
+		self._partners = partners
+		self._snapshots = dict()
+		if rank != 0:
+			self._state()[0] = 0.
+
+	def _state(self):
+		return self._sim.cheat(True)[1]
+
+	def _positions(self):
+		return dict((int(h), pos) for pos, h in
+		            enumerate(self._sim.cheat()[0]))
+
+	def _bit(self, slot):
+		return (self._rank >> slot) & 1
+
+	def _tolerance(self, state):
+		# same tolerance as the C++ simulator (which uses the squared norm)
+		return 1.e-4 if state.dtype == _np.complex64 else 1.e-6
+
+	def _is_active(self, global_ctrls):
+		return all(self._bit(slot) == 1 for slot in global_ctrls)
+
+	def _exchange(self, slot, data):
+		"""
+		Send data to the partner for the given slot and return its data (the
+		worker with the lower rank sends first to avoid a deadlock).
+		"""
+		conn = self._partners[slot]
+		data = _np.ascontiguousarray(data)
+		if self._bit(slot) == 0:
+			conn.send_bytes(data)
+			received = conn.recv_bytes()
+		else:
+			received = conn.recv_bytes()
+			conn.send_bytes(data)
+		return _np.frombuffer(received, dtype=data.dtype).reshape(data.shape)
+
+	def allocate(self, handles):
+		self._sim.allocate_qureg(handles)
+
+	def deallocate(self, handle):
+		state = self._state()
+		if _np.any(_np.abs(state) > self._tolerance(state)):
+			self._sim.deallocate_qubit(handle)
+			return
+		# the simulator only deallocates qubits which are classical
+		state[:] = 0.
+		state[0] = 1.
+		self._sim.deallocate_qubit(handle)
+		self._state()[0] = 0.
+
+	def run(self):
+		self._sim.run()
+
+	def set_qubit_reordering(self, fast_positions):
+		self._sim.set_qubit_reordering(fast_positions)
+
+	def set_fusion_window(self, size):
+		self._sim.set_fusion_window(size)
+
+	def set_fusion_limits(self, fusion_min, fusion_max):
+		self._sim.set_fusion_limits(fusion_min, fusion_max)
+
+	def get_fusion_limits(self):
+		return tuple(self._sim.get_fusion_limits())
+
+	def autotune_fusion(self, num_qubits):
+		return tuple(self._sim.autotune_fusion(num_qubits))
+
+	def apply_gate(self, m, targets, ctrls, global_ctrls):
+		"""
+		Apply the gate m, where targets contains a reference (_LOCAL, handle)
+		or (_GLOBAL, slot) for each bit of the matrix index. The matrix must not
+		mix the values of global qubits.
+		"""
+		if not self._is_active(global_ctrls):
+			return
+		m = _np.asarray(m)
+		glob = [(l, ref) for l, (kind, ref) in enumerate(targets)
+		        if kind == _GLOBAL]
+		if len(glob) > 0:
+			# the block of the matrix which belongs to the rank of this worker
+			rows = [i for i in range(len(m))
+			        if all(((i >> l) & 1) == self._bit(slot) for l, slot in glob)]
+			m = m[_np.ix_(rows, rows)]
+		handles = [ref for kind, ref in targets if kind == _LOCAL]
+		if len(handles) > 0:
+			self._sim.apply_controlled_gate(m.tolist(), handles, ctrls)
+			return
+		# only a phase remains
+		state = self._state()
+		if len(ctrls) == 0:
+			state *= m[0, 0]
+		else:
+			pos = self._positions()
+			mask = sum(1 << pos[c] for c in ctrls)
+			indices = _np.arange(len(state))
+			state[(indices & mask) == mask] *= m[0, 0]
+
+	def apply_permutation(self, perm, handles, ctrls, global_ctrls):
+		if self._is_active(global_ctrls):
+			self._sim.apply_controlled_permutation(perm, handles, ctrls)
+
+	def emulate_math(self, table, sizes, quregs, ctrls, global_ctrls):
+		"""
+		Emulate a math gate acting on local qubits, where table[key] contains
+		the result of the math function for the register values encoded in key
+		(the first register in the lowest bits).
+		"""
+		if not self._is_active(global_ctrls):
+			return
+
+		def f(x):
+			key = 0
+			shift = 0
+			for value, size in zip(x, sizes):
+				key |= value << shift
+				shift += size
+			return list(table[key])
+		self._sim.emulate_math(f, quregs, ctrls)
+
+	def emulate_math_table(self, table, handles, ctrls, global_ctrls):
+		if self._is_active(global_ctrls):
+			self._sim.emulate_math_table(table, handles, ctrls)
+
+	def emulate_math_native(self, name, args, handles, ctrls, global_ctrls):
+		if self._is_active(global_ctrls):
+			getattr(self._sim, name)(*(list(args) + [handles, ctrls]))
+
+	def swap_local(self, handle1, handle2):
+		self._sim.swap_qubits(handle1, handle2)
+
+	def swap_global(self, slot, handle):
+		"""
+		Exchange the roles of the qubit in slot and the local qubit handle. The
+		amplitudes where the local qubit differs from the bit of the rank are
+		exchanged with the partner for this slot.
+		"""
+		halves = self._state().reshape(-1, 2, 1 << self._positions()[handle])
+		other = 1 - self._bit(slot)
+		halves[:, other, :] = self._exchange(slot, halves[:, other, :])
+
+	def flip_global(self, slot):
+		"""
+		Exchange all amplitudes with the partner for slot (i.e., apply an X gate
+		to the global qubit in slot).
+		"""
+		state = self._state()
+		state[:] = self._exchange(slot, state)
+
+	def classical_flags(self, kind, ref):
+		"""
+		Return whether there are non-zero amplitudes where the qubit is 0 and
+		where it is 1, respectively.
+		"""
+		state = self._sim.cheat()[1]
+		nonzero = _np.abs(state) > self._tolerance(state)
+		if kind == _GLOBAL:
+			occupied = bool(_np.any(nonzero))
+			return (occupied and self._bit(ref) == 0,
+			        occupied and self._bit(ref) == 1)
+		halves = nonzero.reshape(-1, 2, 1 << self._positions()[ref])
+		return bool(_np.any(halves[:, 0, :])), bool(_np.any(halves[:, 1, :]))
+
+	def norm(self):
+		state = self._sim.cheat()[1]
+		return float(_np.vdot(state, state).real)
+
+	def pick(self, P, handles):
+		"""
+		Pick the entry at which the cumulative probability exceeds P and return
+		the values of the local qubits in handles.
+		"""
+		state = self._sim.cheat()[1]
+		cumulative = _np.cumsum(_np.abs(state) ** 2)
+		i = min(int(_np.searchsorted(cumulative, P)), len(state) - 1)
+		pos = self._positions()
+		return [(i >> pos[h]) & 1 for h in handles]
+
+	def collapse(self, local_values, global_values):
+		"""
+		Set all amplitudes which disagree with the measurement outcomes to zero
+		and return the norm of the remaining ones.
+		"""
+		state = self._state()
+		if any(self._bit(slot) != value for slot, value in global_values):
+			state[:] = 0.
+			return 0.
+		pos = self._positions()
+		for h, value in local_values:
+			state.reshape(-1, 2, 1 << pos[h])[:, 1 - value, :] = 0.
+		return float(_np.vdot(state, state).real)
+
+	def collapsed_norm(self, local_values, global_values):
+		"""
+		Return the norm of the amplitudes which agree with the given values
+		(without modifying the state).
+		"""
+		if any(self._bit(slot) != value for slot, value in global_values):
+			return 0.
+		state = self._sim.cheat()[1]
+		pos = self._positions()
+		mask = sum(1 << pos[h] for h, value in local_values)
+		val = sum(value << pos[h] for h, value in local_values)
+		keep = state[(_np.arange(len(state)) & mask) == val]
+		return float(_np.vdot(keep, keep).real)
+
+	def scale(self, factor):
+		state = self._state()
+		state *= factor
+
+	def sample(self, rnd, bits):
+		"""
+		Return the samples for the (sorted) random numbers rnd, where bits
+		contains tuples (k, handle) of the local qubits to read out into bit k.
+		"""
+		state = self._sim.cheat()[1]
+		cumulative = _np.cumsum(_np.abs(state) ** 2)
+		picked = _np.minimum(_np.searchsorted(cumulative, rnd, side='right'),
+		                     len(state) - 1)
+		pos = self._positions()
+		samples = _np.zeros(len(rnd), dtype=_np.int64)
+		for k, h in bits:
+			samples |= ((picked >> pos[h]) & 1) << k
+		return samples
+
+	def expectation(self, flips, signs, global_signs):
+		"""
+		Return <psi|P|psi> (without the factor i^(#Y)) for the Pauli string P
+		which flips the local qubits in flips and has a sign (-1)^(value) for
+		the local qubits in signs and the global qubits in global_signs.
+		"""
+		state = self._sim.cheat()[1]
+		pos = self._positions()
+		indices = _np.arange(len(state))
+		flipmask = sum(1 << pos[h] for h in flips)
+		parity = _np.zeros(len(state), dtype=_np.int64)
+		for h in signs:
+			parity ^= (indices >> pos[h]) & 1
+		for slot in global_signs:
+			parity ^= self._bit(slot)
+		return complex(_np.sum(_np.conj(state[indices ^ flipmask]) * state *
+		                       (1 - 2 * parity)))
+
+	def expectation_diagonal(self, diagonal, refs):
+		state = self._sim.cheat()[1]
+		pos = self._positions()
+		indices = _np.arange(len(state))
+		k = _np.zeros(len(state), dtype=_np.int64)
+		for l, (kind, ref) in enumerate(refs):
+			if kind == _GLOBAL:
+				k |= self._bit(ref) << l
+			else:
+				k |= ((indices >> pos[ref]) & 1) << l
+		return float(_np.dot(_np.abs(state) ** 2, _np.asarray(diagonal)[k]))
+
+	def snapshot(self, key):
+		self._snapshots[key] = self._sim.snapshot()
+
+	def restore(self, key):
+		self._sim.restore(self._snapshots[key])
+
+	def drop_snapshots(self, keys):
+		for key in keys:
+			del self._snapshots[key]
+
+	def itemsize(self):
+		return self._state().itemsize
+
+	def handles(self):
+		return [int(h) for h in self._sim.cheat()[0]]
+
+	def write_state(self, path, offsets):
+		"""
+		Write the amplitudes of this shard to the checkpoint file path (at
+		offsets[rank], if the rank is contained in offsets).
+		"""
+		if self._rank in offsets:
+			_checkpoint.write_amplitudes(path, offsets[self._rank],
+			                             self._state())
+
+	def read_state(self, path, offsets, itemsize):
+		if self._rank in offsets:
+			_checkpoint.read_amplitudes(path, offsets[self._rank], self._state(),
+			                            itemsize)
+
+	def get_state(self):
+		ids, state = self._sim.cheat()
+		return [int(h) for h in ids], _np.array(state)
+
+	def set_state(self, state):
+		self._state()[:] = state
+
+
+def _worker_loop(rank, backend, args, conn, partners):
+	"""
+	Main loop of a worker process: Execute the methods of the shard requested
+	by the master process and send back the result (or the exception).
+	"""
+	shard = _Shard(rank, backend(*args), partners)
+	while True:
+		request = conn.recv()
+		if request is None:
+			break
+		method, method_args = request
+		try:
+			conn.send((True, getattr(shard, method)(*method_args)))
+		except Exception as e:
+			conn.send((False, e))
+
+
+def _shutdown(conns, processes):
+	"""
+	Stop the worker processes.
+	"""
+	for conn in conns:
+		try:
+			conn.send(None)
+		except (IOError, OSError):
+			pass
+	for process in processes:
+		process.join()
+
+
+class _Snapshot(object):
+	"""
+	Handle of a snapshot of the distributed simulator: the copies of the
+	shards are kept by the workers (until the handle is garbage-collected).
+	"""
+	def __init__(self, key, local, global_, next_handle, rng_state):
+		self.key = key
+		self.local = local
+		self.global_ = global_
+		self.next_handle = next_handle
+		self.rng_state = rng_state
+
+
+class DistributedSimulator(object):
+	"""
+	Simulator which shards the state vector over several worker processes by
+	the values of the global qubits.
+
+	The first qubits are simulated locally (by each worker), until enough
+	local qubits are available to make any gate local by swapping qubits.
+	Afterwards, new qubits are assigned to free global slots first. Free slots
+	correspond to qubits in the state 0, i.e., the workers whose rank has a
+	free slot set to 1 only store zeros.
+
+	The workers are local processes which are connected by pipes (both to the
+	master process and to each other).
+	"""
+	def __init__(self, backend, num_processes, rnd_seed, *args):
+		"""
+		Start the worker processes.
+
+		Args:
+			backend (class): C++/Python simulator class to use for the shards.
+			num_processes (int): Number of worker processes (a power of 2).
+			rnd_seed (int): Seed to initialize the random number generator.
+			args: Further arguments for the constructor of backend.
+
+		Raises:
+			ValueError: If num_processes is not a power of 2.
+		"""
+		if num_processes < 1 or num_processes & (num_processes - 1) != 0:
+			raise ValueError("The number of processes must be a power of 2.")
+		self._num_slots = num_processes.bit_length() - 1
+		self._rng = random.Random(rnd_seed)
+		self._local = dict()  # qubit ID -> handle
+		self._global = dict()  # qubit ID -> slot
+		self._next_handle = 0
+		self._next_snapshot = 0
+		self._released_snapshots = []
+
+		partners = [dict() for _ in range(num_processes)]
+		for rank in range(num_processes):
+			for slot in range(self._num_slots):
+				partner = rank ^ (1 << slot)
+				if rank < partner:
+					partners[rank][slot], partners[partner][slot] = _mp.Pipe()
+		self._conns = []
+		self._processes = []
+		for rank in range(num_processes):
+			conn, worker_conn = _mp.Pipe()
+			process = _mp.Process(target=_worker_loop,
+			                      args=(rank, backend, (rnd_seed,) + args,
+			                            worker_conn, partners[rank]))
+			process.daemon = True
+			process.start()
+			self._conns.append(conn)
+			self._processes.append(process)
+		# stop the workers when the simulator is garbage-collected (or at exit)
+		self._finalizer = weakref.finalize(self, _shutdown, self._conns,
+		                                   self._processes)
+
+	def close(self):
+		"""
+		Stop the worker processes.
+		"""
+		self._finalizer()
+
+	def _broadcast(self, method, *args):
+		"""
+		Execute a method of all shards and return the results (or raise the
+		first exception, after all workers have replied).
+		"""
+		for conn in self._conns:
+			conn.send((method, args))
+		replies = [conn.recv() for conn in self._conns]
+		for success, result in replies:
+			if not success:
+				raise result
+		return [result for success, result in replies]
+
+	def _call(self, rank, method, *args):
+		self._conns[rank].send((method, args))
+		success, result = self._conns[rank].recv()
+		if not success:
+			raise result
+		return result
+
+	def _ref(self, ID):
+		if ID in self._global:
+			return (_GLOBAL, self._global[ID])
+		return (_LOCAL, self._local[ID])
+
+	def _split_controls(self, ctrlids):
+		return ([self._local[c] for c in ctrlids if c in self._local],
+		        [self._global[c] for c in ctrlids if c in self._global])
+
+	def _swap_global(self, global_id, local_id):
+		"""
+		Move the qubit global_id to the local position of local_id and vice
+		versa.
+		"""
+		slot = self._global.pop(global_id)
+		handle = self._local.pop(local_id)
+		self._broadcast('swap_global', slot, handle)
+		self._local[global_id] = handle
+		self._global[local_id] = slot
+
+	def _make_local(self, ids, exclude):
+		"""
+		Swap the global qubits in ids with local qubits which are not in
+		exclude.
+
+		Raises:
+			RuntimeError: If there are not enough local qubits.
+		"""
+		candidates = [ID for ID in self._local if ID not in exclude]
+		for ID in ids:
+			if ID in self._global:
+				if len(candidates) == 0:
+					raise RuntimeError("Not enough local qubits to apply the "
+					                   "operation.")
+				self._swap_global(ID, candidates.pop())
+
+	def allocate_qubit(self, ID):
+		"""
+		Allocate a qubit (in a free global slot if enough qubits are local).
+
+		Args:
+			ID (int): ID of the qubit which is being allocated.
+		"""
+		self.allocate_qureg([ID])
+
+	def allocate_qureg(self, IDs):
+		"""
+		Allocate several qubits at once (the local ones with a single resize of
+		the shards).
+
+		Args:
+			IDs (list<int>): IDs of the qubits which are being allocated.
+		"""
+		if (len(set(IDs)) != len(IDs) or
+		    any(ID in self._local or ID in self._global for ID in IDs)):
+			raise RuntimeError("AllocateQubit: ID already exists. Qubit IDs "
+			                   "should be unique.")
+		used = set(self._global.values())
+		free = [s for s in range(self._num_slots) if s not in used]
+		handles = []
+		for ID in IDs:
+			if len(self._local) >= _MIN_LOCAL_QUBITS and len(free) > 0:
+				self._global[ID] = free.pop(0)
+			else:
+				handles.append(self._next_handle)
+				self._local[ID] = self._next_handle
+				self._next_handle += 1
+		if len(handles) > 0:
+			self._broadcast('allocate', handles)
+
+	def _get_classical_value(self, ID):
+		flags = self._broadcast('classical_flags', *self._ref(ID))
+		up = any(f[0] for f in flags)
+		down = any(f[1] for f in flags)
+		if up and down:
+			raise RuntimeError("Qubit has not been measured / uncomputed. Cannot "
+			                   "access its classical value and/or deallocate a "
+			                   "qubit in superposition!")
+		return down
+
+	def deallocate_qubit(self, ID):
+		"""
+		Deallocate a qubit (if it has been measured / uncomputed).
+
+		Args:
+			ID (int): ID of the qubit to deallocate.
+
+		Raises:
+			RuntimeError: If the qubit is in a superposition, i.e., has not been
+				measured / uncomputed.
+		"""
+		self.run()
+		value = self._get_classical_value(ID)
+		if (ID in self._local and len(self._local) <= _MIN_LOCAL_QUBITS and
+		        len(self._global) > 0):
+			# keep enough local qubits: free a global slot instead
+			self._swap_global(next(iter(self._global)), ID)
+		if ID in self._global:
+			# free slots correspond to qubits in the state 0
+			if value:
+				self._broadcast('flip_global', self._global[ID])
+			del self._global[ID]
+		else:
+			self._broadcast('deallocate', self._local.pop(ID))
+
+	def apply_controlled_gate(self, m, ids, ctrlids):
+		"""
+		Applies the k-qubit gate matrix m to the qubits with indices ids,
+		using ctrlids as control qubits.
+
+		Args:
+			m (list<list>): 2^k x 2^k complex matrix describing the k-qubit gate,
+				where bit l of the row/column index corresponds to qubit ids[l].
+			ids (list): A list containing the qubit IDs to which to apply the gate.
+			ctrlids (list): A list of control qubit IDs.
+		"""
+		mask = sum(1 << l for l, ID in enumerate(ids) if ID in self._global)
+		if mask != 0:
+			indices = _np.arange(len(m))
+			mixing = ((indices[:, None] ^ indices[None, :]) & mask) != 0
+			if _np.any(_np.asarray(m)[mixing] != 0):
+				self._make_local(ids, ids)
+		ctrls, global_ctrls = self._split_controls(ctrlids)
+		self._broadcast('apply_gate', m, [self._ref(ID) for ID in ids], ctrls,
+		                global_ctrls)
+
+	def apply_controlled_permutation(self, perm, ids, ctrlids):
+		"""
+		Applies the permutation gate perm to the qubits with indices ids, using
+		ctrlids as control qubits.
+
+		Args:
+			perm (list<int>): Permutation mapping basis state k to perm[k].
+			ids (list): A list containing the qubit IDs to which to apply the gate.
+			ctrlids (list): A list of control qubit IDs.
+		"""
+		self._make_local(ids, ids)
+		ctrls, global_ctrls = self._split_controls(ctrlids)
+		self._broadcast('apply_permutation', list(perm),
+		                [self._local[ID] for ID in ids], ctrls, global_ctrls)
+
+	def swap_qubits(self, ID1, ID2):
+		"""
+		Swap two qubits by exchanging their locations (no amplitudes are moved).
+
+		Args:
+			ID1 (int): ID of the first qubit.
+			ID2 (int): ID of the second qubit.
+		"""
+		ref1 = self._ref(ID1)
+		ref2 = self._ref(ID2)
+		for ID, (kind, ref) in [(ID1, ref2), (ID2, ref1)]:
+			self._local.pop(ID, None)
+			self._global.pop(ID, None)
+			if kind == _GLOBAL:
+				self._global[ID] = ref
+			else:
+				self._local[ID] = ref
+
+	def emulate_math_add_constant(self, a, ids, ctrlids):
+		"""
+		Add the constant a to the number stored in the qubits ids (from low- to
+		high-bit) modulo 2^len(ids).
+		"""
+		mod = 1 << len(ids)
+		self._emulate_math_native('emulate_math_add_constant', [a],
+		                          lambda x: [(x[0] + a) % mod], ids, ctrlids)
+
+	def emulate_math_add_constant_modN(self, a, N, ids, ctrlids):
+		"""
+		Add the constant a to the number stored in the qubits ids modulo N
+		(values x >= N are left unchanged).
+		"""
+		if not 0 < N <= 1 << len(ids):
+			raise ValueError("The modulus must satisfy 0 < N <= 2^#qubits.")
+		self._emulate_math_native('emulate_math_add_constant_modN', [a, N],
+		                          lambda x: [(x[0] + a) % N if x[0] < N
+		                                     else x[0]], ids, ctrlids)
+
+	def emulate_math_multiply_by_constant_modN(self, a, N, ids, ctrlids):
+		"""
+		Multiply the number stored in the qubits ids by the constant a modulo N
+		(values x >= N are left unchanged).
+		"""
+		if not 0 < N <= 1 << len(ids):
+			raise ValueError("The modulus must satisfy 0 < N <= 2^#qubits.")
+		self._emulate_math_native('emulate_math_multiply_by_constant_modN',
+		                          [a, N], lambda x: [a * x[0] % N if x[0] < N
+		                                             else x[0]], ids, ctrlids)
+
+	def _emulate_math_native(self, name, args, f, ids, ctrlids):
+		"""
+		Let the workers apply the native math kernel name (with arguments args)
+		to the qubits ids if they can be made local. Otherwise, the state vector
+		is gathered by the master process, which applies the function f.
+		"""
+		num_global = sum(1 for ID in ids if ID in self._global)
+		if num_global > len([ID for ID in self._local if ID not in ids]):
+			self._emulate_math_gathered(f, [ids], ctrlids)
+			return
+		self._make_local(ids, ids)
+		ctrls, global_ctrls = self._split_controls(ctrlids)
+		self._broadcast('emulate_math_native', name, args,
+		                [self._local[ID] for ID in ids], ctrls, global_ctrls)
+
+	def emulate_math(self, f, qubit_ids, ctrlqubit_ids):
+		"""
+		Emulate a math function (e.g., BasicMathGate).
+
+		If possible, the qubits are made local and the workers emulate the
+		function using a lookup table. Otherwise, the state vector is gathered
+		by the master process.
+
+		Args:
+			f (function): Function executing the operation to emulate.
+			qubit_ids (list<list<int>>): List of lists of qubit IDs to which the
+				gate is being applied.
+			ctrlqubit_ids (list<int>): List of control qubit ids.
+		"""
+		ids = [ID for qureg in qubit_ids for ID in qureg]
+		num_global = sum(1 for ID in ids if ID in self._global)
+		if num_global > len([ID for ID in self._local if ID not in ids]):
+			self._emulate_math_gathered(f, qubit_ids, ctrlqubit_ids)
+			return
+		self._make_local(ids, ids)
+		sizes = [len(qureg) for qureg in qubit_ids]
+		table = []
+		for key in range(1 << len(ids)):
+			values = []
+			for size in sizes:
+				values.append(key & ((1 << size) - 1))
+				key >>= size
+			table.append(list(f(values)))
+		ctrls, global_ctrls = self._split_controls(ctrlqubit_ids)
+		self._broadcast('emulate_math', table, sizes,
+		                [[self._local[ID] for ID in qureg]
+		                 for qureg in qubit_ids], ctrls, global_ctrls)
+
+	def emulate_math_table(self, table, ids, ctrlids):
+		"""
+		Emulate a math function given by its lookup table, where table[x] is
+		the new value of the number x stored in the qubits ids (from low- to
+		high-bit).
+
+		The table is broadcast to the workers if the qubits can be made local.
+		Otherwise, the state vector is gathered by the master process.
+		"""
+		table = _np.asarray(table, dtype=_np.int64)
+		if len(table) != 1 << len(ids):
+			raise ValueError("The lookup table must have 2^#qubits entries.")
+		num_global = sum(1 for ID in ids if ID in self._global)
+		if num_global > len([ID for ID in self._local if ID not in ids]):
+			self._emulate_math_gathered(lambda x: [int(table[x[0]])], [ids],
+			                            ctrlids)
+			return
+		self._make_local(ids, ids)
+		ctrls, global_ctrls = self._split_controls(ctrlids)
+		self._broadcast('emulate_math_table', table,
+		                [self._local[ID] for ID in ids], ctrls, global_ctrls)
+
+	def _emulate_math_gathered(self, f, qubit_ids, ctrlqubit_ids):
+		ids, state = self._gather()
+		pos = dict((ID, p) for p, ID in enumerate(ids))
+		mask = sum(1 << pos[c] for c in ctrlqubit_ids)
+		indices = _np.arange(len(state), dtype=_np.int64)
+		active = (indices & mask) == mask
+		newstate = _np.where(active, 0., state).astype(state.dtype)
+		# f is only evaluated on the support of the state
+		tol = _np.finfo(state.dtype).eps ** 2
+		for i in _np.flatnonzero(active & (_np.abs(state) ** 2 > tol)).tolist():
+			args = [sum(((i >> pos[ID]) & 1) << l
+			            for l, ID in enumerate(qureg)) for qureg in qubit_ids]
+			res = f(args)
+			new_i = i
+			for qureg, value in zip(qubit_ids, res):
+				for l, ID in enumerate(qureg):
+					new_i &= ~(1 << pos[ID])
+					new_i |= ((value >> l) & 1) << pos[ID]
+			newstate[new_i] += state[i]
+		self._scatter(newstate)
+
+	def _bound_slots(self):
+		"""
+		Return the slots which are in use (sorted) and the corresponding qubit
+		IDs.
+		"""
+		slot_ids = sorted((slot, ID) for ID, slot in self._global.items())
+		return [slot for slot, ID in slot_ids], [ID for slot, ID in slot_ids]
+
+	def _gather(self):
+		"""
+		Return the qubit IDs ordered by their bit-location and the full state
+		vector (local qubits first, followed by the global qubits).
+		"""
+		shards = self._broadcast('get_state')
+		handle_ids = dict((h, ID) for ID, h in self._local.items())
+		ids = [handle_ids[h] for h in shards[0][0]]
+		slots, global_ids = self._bound_slots()
+		num_local = len(ids)
+		state = _np.zeros(1 << (num_local + len(slots)),
+		                  dtype=shards[0][1].dtype)
+		for c in range(1 << len(slots)):
+			rank = sum(((c >> l) & 1) << slot for l, slot in enumerate(slots))
+			state[c << num_local:(c + 1) << num_local] = shards[rank][1]
+		return ids + global_ids, state
+
+	def _scatter(self, state):
+		slots, global_ids = self._bound_slots()
+		num_local = len(self._local)
+		for c in range(1 << len(slots)):
+			rank = sum(((c >> l) & 1) << slot for l, slot in enumerate(slots))
+			self._call(rank, 'set_state',
+			           state[c << num_local:(c + 1) << num_local])
+
+	def cheat(self, writable=False):
+		"""
+		Return the qubit IDs ordered by their bit-location and a copy of the
+		(gathered) state vector.
+
+		Args:
+			writable (bool): Must be False, the state vector of the distributed
+				simulator cannot be modified this way.
+		"""
+		if writable:
+			raise RuntimeError("The state vector of the distributed simulator "
+			                   "cannot be modified via cheat().")
+		ids, state = self._gather()
+		state.flags.writeable = False
+		return _np.array(ids), state
+
+	def snapshot(self):
+		"""
+		Take a snapshot of the simulator (the workers copy their shards) and
+		return a handle which can be passed to restore.
+		"""
+		self._drop_released_snapshots()
+		key = self._next_snapshot
+		self._next_snapshot += 1
+		self._broadcast('snapshot', key)
+		snapshot = _Snapshot(key, dict(self._local), dict(self._global),
+		                     self._next_handle, self._rng.getstate())
+		# the copies are dropped with the next snapshot/restore after the handle
+		# has been garbage-collected (not by the finalizer itself, which may run
+		# while the master is waiting for a reply of the workers)
+		weakref.finalize(snapshot, self._released_snapshots.append, key)
+		return snapshot
+
+	def restore(self, snapshot):
+		"""
+		Restore the state of the simulator from a snapshot (which can be
+		restored several times).
+
+		Args:
+			snapshot: Handle returned by snapshot().
+		"""
+		self._drop_released_snapshots()
+		self._broadcast('restore', snapshot.key)
+		self._local = dict(snapshot.local)
+		self._global = dict(snapshot.global_)
+		self._next_handle = snapshot.next_handle
+		self._rng.setstate(snapshot.rng_state)
+
+	def _drop_released_snapshots(self):
+		if len(self._released_snapshots) > 0:
+			keys = self._released_snapshots[:]
+			del self._released_snapshots[:len(keys)]
+			self._broadcast('drop_snapshots', keys)
+
+	def _layout(self):
+		"""
+		Return the qubit IDs ordered by their bit-location in the gathered
+		state vector (see _gather) and the offsets of the shards which store
+		the corresponding parts of the state vector.
+		"""
+		handle_ids = dict((h, ID) for ID, h in self._local.items())
+		ids = [handle_ids[h] for h in self._call(0, 'handles')]
+		slots, global_ids = self._bound_slots()
+		offsets = dict()
+		for c in range(1 << len(slots)):
+			rank = sum(((c >> l) & 1) << slot for l, slot in enumerate(slots))
+			offsets[rank] = c << len(ids)
+		return ids + global_ids, offsets
+
+	def _relabel(self, ids):
+		"""
+		Relabel the qubits such that ids is the layout of the gathered state
+		vector and return the offsets of the shards (see _layout).
+		"""
+		layout, offsets = self._layout()
+		for pos, ID in enumerate(ids):
+			if layout[pos] != ID:
+				other = layout.index(ID)
+				self.swap_qubits(layout[pos], ID)
+				layout[pos], layout[other] = ID, layout[pos]
+		return offsets
+
+	def set_wavefunction(self, wavefunction, ids):
+		"""
+		Replace the state vector by wavefunction, where bit k of the index
+		corresponds to the qubit ids[k] (the amplitudes are sent to the
+		workers).
+
+		Args:
+			wavefunction (array): 2^len(ids) complex amplitudes.
+			ids (list<int>): IDs of all allocated qubits.
+
+		Raises:
+			ValueError: If the number of amplitudes does not match the number of
+				qubits.
+			RuntimeError: If ids does not contain each allocated qubit exactly
+				once.
+		"""
+		if len(wavefunction) != 1 << len(ids):
+			raise ValueError("The wavefunction must have 2^(#qubits) entries.")
+		if sorted(ids) != sorted(list(self._local) + list(self._global)):
+			raise RuntimeError("set_wavefunction(): Invalid mapping provided. "
+			                   "Please make sure all qubits have been allocated "
+			                   "previously (call eng.flush()).")
+		self._relabel(ids)
+		self._scatter(_np.asarray(wavefunction))
+
+	def collapse_wavefunction(self, ids, values):
+		"""
+		Collapse the qubits ids to the given values (post-selection) and
+		re-normalize the state.
+
+		Raises:
+			RuntimeError: If a qubit has not been allocated or if the
+				probability of the outcome is (close to) zero.
+		"""
+		if len(ids) != len(values):
+			raise ValueError("collapse_wavefunction(): The number of qubits and "
+			                 "values must agree.")
+		if any(ID not in self._local and ID not in self._global for ID in ids):
+			raise RuntimeError("collapse_wavefunction(): Unknown qubit id. "
+			                   "Please make sure all qubits have been allocated "
+			                   "previously (call eng.flush()).")
+		local_values = [(self._local[ID], int(value))
+		                for ID, value in zip(ids, values) if ID in self._local]
+		global_values = [(self._global[ID], int(value))
+		                 for ID, value in zip(ids, values) if ID in self._global]
+		nrm = sum(self._broadcast('collapsed_norm', local_values, global_values))
+		# same tolerance as the C++ simulator
+		tol = 1.e-8 if self._call(0, 'itemsize') == 8 else 1.e-12
+		if nrm < tol:
+			raise RuntimeError("collapse_wavefunction(): Invalid collapse! "
+			                   "Probability is ~0.")
+		self._broadcast('collapse', local_values, global_values)
+		self._broadcast('scale', 1. / _np.sqrt(nrm))
+
+	def save_checkpoint(self, path, metadata=""):
+		"""
+		Write a checkpoint of the simulator, where each worker writes its part
+		of the state vector (see _checkpoint).
+
+		Args:
+			path (str): Path of the checkpoint file.
+			metadata (str): Data to store along with the state.
+		"""
+		self.run()
+		ids, offsets = self._layout()
+		version, internal, gauss = self._rng.getstate()
+		rng_state = b"python\n" + json.dumps([version, list(internal),
+		                                      gauss]).encode('utf-8')
+		itemsize = self._call(0, 'itemsize')
+		offset = _checkpoint.write_header(path, itemsize, ids, rng_state,
+		                                  metadata)
+		self._broadcast('write_state', path,
+		                dict((rank, offset + c * itemsize)
+		                     for rank, c in offsets.items()))
+
+	def load_checkpoint(self, path):
+		"""
+		Load a checkpoint into the (empty) simulator.
+
+		Args:
+			path (str): Path of the checkpoint file.
+
+		Returns:
+			The metadata stored in the checkpoint.
+
+		Raises:
+			RuntimeError: If qubits have been allocated already.
+		"""
+		if len(self._local) + len(self._global) > 0:
+			raise RuntimeError("Checkpoints can only be loaded into a simulator "
+			                   "without qubits.")
+		itemsize, ids, rng_state, metadata, offset = _checkpoint.read_header(path)
+		self.allocate_qureg(sorted(ids))
+		offsets = self._relabel(ids)
+		self._broadcast('read_state', path,
+		                dict((rank, offset + c * itemsize)
+		                     for rank, c in offsets.items()), itemsize)
+		if rng_state.startswith(b"python\n"):
+			version, internal, gauss = json.loads(rng_state[7:].decode('utf-8'))
+			self._rng.setstate((version, tuple(internal), gauss))
+		return metadata
+
+	def measure_qubits(self, ids, deallocate=False):
+		"""
+		Measure the qubits with IDs ids and return a list of measurement outcomes
+		(True/False).
+
+		Args:
+			ids (list<int>): List of qubit IDs to measure.
+			deallocate (bool): If True, the measured qubits are removed from the
+				state vector (i.e., they must not be used anymore).
+
+		Returns:
+			List of measurement results (containing either True or False).
+		"""
+		norms = _np.cumsum(self._broadcast('norm'))
+		P = self._rng.random() * norms[-1]
+		rank = min(int(_np.searchsorted(norms, P)), len(norms) - 1)
+		offset = norms[rank - 1] if rank > 0 else 0.
+		handles = [self._local[ID] for ID in ids if ID in self._local]
+		local_values = dict(zip(handles, self._call(rank, 'pick', P - offset,
+		                                            handles)))
+		res = []
+		for ID in ids:
+			if ID in self._global:
+				res.append(((rank >> self._global[ID]) & 1) == 1)
+			else:
+				res.append(local_values[self._local[ID]] == 1)
+
+		nrm = sum(self._broadcast(
+		    'collapse', list(local_values.items()),
+		    [(self._global[ID], int(r)) for ID, r in zip(ids, res)
+		     if ID in self._global]))
+		self._broadcast('scale', 1. / _np.sqrt(nrm))
+		if deallocate:
+			for ID in ids:
+				self.deallocate_qubit(ID)
+		return res
+
+	def sample(self, ids, shots):
+		"""
+		Sample the qubits with IDs ids shots times (without collapsing the
+		state vector).
+
+		Args:
+			ids (list<int>): List of qubit IDs to sample.
+			shots (int): Number of samples to draw.
+
+		Returns:
+			NumPy array of integers, where bit k of each sample corresponds to the
+			qubit ids[k].
+		"""
+		norms = _np.cumsum(self._broadcast('norm'))
+		rnd = _np.array([self._rng.random() for _ in range(shots)]) * norms[-1]
+		ranks = _np.minimum(_np.searchsorted(norms, rnd, side='right'),
+		                    len(norms) - 1)
+		bits = [(k, self._local[ID]) for k, ID in enumerate(ids)
+		        if ID in self._local]
+		samples = _np.zeros(shots, dtype=_np.int64)
+		for rank in _np.unique(ranks):
+			selected = ranks == rank
+			offset = norms[rank - 1] if rank > 0 else 0.
+			value = self._call(int(rank), 'sample', rnd[selected] - offset, bits)
+			for k, ID in enumerate(ids):
+				if ID in self._global:
+					value |= ((int(rank) >> self._global[ID]) & 1) << k
+			samples[selected] = value
+		return samples
+
+	def get_expectation_value(self, terms):
+		"""
+		Return the expectation value of a weighted sum of Pauli strings.
+
+		Args:
+			terms (list): List of tuples (pauli_string, coefficient), where
+				pauli_string is a list of tuples (qubit ID, 'X' / 'Y' / 'Z') and
+				coefficient is a real number.
+
+		Returns:
+			Expectation value (float).
+		"""
+		phases = [1., 1j, -1., -1j]
+		expectation = 0.
+		for pauli_string, coefficient in terms:
+			for ID, op in pauli_string:
+				if op not in ('X', 'Y', 'Z'):
+					raise ValueError("Pauli strings may only contain 'X', 'Y', "
+					                 "and 'Z'.")
+				if ID not in self._local and ID not in self._global:
+					raise RuntimeError("get_expectation_value(): Unknown qubit "
+					                   "id. Please make sure all qubits have been "
+					                   "allocated previously (call eng.flush()).")
+			if len(set(ID for ID, op in pauli_string)) != len(pauli_string):
+				raise ValueError("get_expectation_value(): Pauli strings may act "
+				                 "on each qubit at most once.")
+			flips = [ID for ID, op in pauli_string if op in ('X', 'Y')]
+			self._make_local(flips, flips)
+			num_y = sum(1 for ID, op in pauli_string if op == 'Y')
+			signs = [ID for ID, op in pauli_string if op in ('Y', 'Z')]
+			value = sum(self._broadcast(
+			    'expectation', [self._local[ID] for ID in flips],
+			    [self._local[ID] for ID in signs if ID in self._local],
+			    [self._global[ID] for ID in signs if ID in self._global]))
+			expectation += coefficient * (phases[num_y % 4] * value).real
+		return expectation
+
+	def get_expectation_value_diagonal(self, diagonal, ids):
+		"""
+		Return the expectation value of a diagonal observable.
+
+		Args:
+			diagonal (numpy.ndarray): Diagonal of the observable, where bit k of
+				the index corresponds to the qubit ids[k].
+			ids (list<int>): List of qubit IDs on which the observable acts.
+
+		Returns:
+			Expectation value (float).
+		"""
+		if len(diagonal) != 1 << len(ids):
+			raise ValueError("The diagonal must have 2^(#qubits) entries.")
+		return sum(self._broadcast('expectation_diagonal', diagonal,
+		                           [self._ref(ID) for ID in ids]))
+
+	def set_fusion_limits(self, fusion_min, fusion_max):
+		"""
+		Set the fusion limits of all workers (see Simulator).
+
+		Args:
+			fusion_min (int): Minimal number of qubits of a fused gate.
+			fusion_max (int): Maximal number of qubits of a fused gate.
+		"""
+		self._broadcast('set_fusion_limits', fusion_min, fusion_max)
+
+	def get_fusion_limits(self):
+		"""
+		Return the fusion limits (fusion_min, fusion_max) of the workers.
+		"""
+		return self._broadcast('get_fusion_limits')[0]
+
+	def autotune_fusion(self, num_qubits=18):
+		"""
+		Pick the fusion limits by timing the kernels (on each worker) and use
+		the limits of the first worker for all of them.
+
+		Args:
+			num_qubits (int): Number of qubits of the scratch state vector.
+
+		Returns:
+			Tuple (fusion_min, fusion_max).
+		"""
+		limits = self._broadcast('autotune_fusion', num_qubits)[0]
+		self.set_fusion_limits(*limits)
+		return limits
+
+	def set_fusion_window(self, size):
+		"""
+		Set the number of gates which the workers buffer for fusion (see
+		Simulator).
+
+		Args:
+			size (int): Number of buffered gates (0: fuse in order of arrival).
+		"""
+		self._broadcast('set_fusion_window', size)
+
+	def set_qubit_reordering(self, fast_positions):
+		"""
+		Enable (fast_positions > 0) or disable the automatic reordering of the
+		local qubits of each worker (see Simulator.set_qubit_reordering).
+
+		Args:
+			fast_positions (int): Number of low bit-locations to which qubits
+				which are used repeatedly are moved.
+		"""
+		self._broadcast('set_qubit_reordering', fast_positions)
+
+	def run(self):
+		"""
+		Execute all gates which have been cached by the workers.
+		"""
+		if self._finalizer.alive:
+			self._broadcast('run')
@@ -0,0 +1,275 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Tests for projectq.backends._sim._distsim.py, comparing the distributed
+simulator to the (single-process) C++/Python simulator.
+"""
+
+import numpy
+import pytest
+
+from projectq import MainEngine
+from projectq.ops import (H,
+                          X,
+                          CNOT,
+                          Toffoli,
+                          Measure,
+                          Rx,
+                          Ry,
+                          Rz,
+                          Swap,
+                          BasicMathGate)
+from projectq.meta import Control
+
+from projectq.backends import Simulator
+from projectq.backends._sim._distsim import DistributedSimulator
+
+
+@pytest.fixture(params=["_cppsim", "_pysim"])
+def backend(request):
+	module = __import__("projectq.backends._sim." + request.param,
+	                    fromlist=["Simulator"])
+	return module.Simulator
+
+
+def _make_simulators(backend, num_processes):
+	sim = Simulator(gate_fusion=True)
+	sim._simulator = backend(1)
+	dist_sim = Simulator(gate_fusion=True)
+	dist_sim._simulator = DistributedSimulator(backend, num_processes, 1)
+	return sim, dist_sim
+
+
+def _ordered_state(sim, qureg):
+	# state vector where bit k of the index corresponds to qureg[k]
+	mapping, state = sim.cheat()
+	assert len(mapping) == len(qureg)
+	n = len(qureg)
+	axes = [n - 1 - mapping[qb.id] for qb in reversed(qureg)]
+	return numpy.array(state).reshape([2] * n).transpose(axes).flatten()
+
+
+def test_distributed_simulator_invalid_num_processes(backend):
+	with pytest.raises(ValueError):
+		DistributedSimulator(backend, 3, 1)
+
+
+def test_distributed_simulator_gates(backend):
+	sim, dist_sim = _make_simulators(backend, 4)
+	states = []
+	for s in [sim, dist_sim]:
+		eng = MainEngine(s, [])
+		qureg = eng.allocate_qureg(8)
+		for i, qb in enumerate(qureg):
+			Rx(0.3 * (i + 1)) | qb
+		# the last two qubits are global
+		CNOT | (qureg[7], qureg[0])
+		CNOT | (qureg[0], qureg[6])
+		Rz(0.7) | qureg[7]
+		with Control(eng, qureg[6]):
+			Ry(0.4) | qureg[1]
+			X | qureg[7]
+		Toffoli | (qureg[2], qureg[3], qureg[6])
+		Swap | (qureg[1], qureg[7])
+		with Control(eng, qureg[2]):
+			Swap | (qureg[6], qureg[5])
+		H | qureg[7]
+		with Control(eng, qureg[0]):
+			BasicMathGate(lambda x: ((x + 3) % 8,)) | qureg[5:8]
+			BasicMathGate(lambda x, y: (x, y ^ x), vectorized=True) | (
+			    qureg[6:8], qureg[1:3])
+		eng.flush()
+		states.append(_ordered_state(s, qureg))
+		Measure | qureg
+	assert numpy.allclose(states[0], states[1])
+
+
+def test_distributed_simulator_native_math_gates(backend, monkeypatch):
+	from projectq.libs.math import (AddConstant,
+	                                AddConstantModN,
+	                                MultiplyByConstantModN)
+
+	def no_python_function(self, *args):
+		raise AssertionError("The gate should be emulated by the workers.")
+
+	monkeypatch.setattr(DistributedSimulator, "emulate_math",
+	                    no_python_function)
+	monkeypatch.setattr(DistributedSimulator, "_emulate_math_gathered",
+	                    no_python_function)
+	sim, dist_sim = _make_simulators(backend, 4)
+	states = []
+	for s in [sim, dist_sim]:
+		eng = MainEngine(s, [])
+		qureg = eng.allocate_qureg(8)
+		for i, qb in enumerate(qureg):
+			Ry(0.3 * (i + 1)) | qb
+		# the registers contain the global qubits 6 and 7
+		AddConstant(5) | qureg[4:8]
+		with Control(eng, qureg[7]):
+			AddConstantModN(3, 11) | qureg[1:5]
+		with Control(eng, qureg[0]):
+			MultiplyByConstantModN(4, 13) | qureg[3:7]
+		eng.flush()
+		states.append(_ordered_state(s, qureg))
+		Measure | qureg
+	assert numpy.allclose(states[0], states[1])
+
+
+def test_distributed_simulator_allocation(backend):
+	sim, dist_sim = _make_simulators(backend, 4)
+	states = []
+	for s in [sim, dist_sim]:
+		eng = MainEngine(s, [])
+		qureg = eng.allocate_qureg(7)
+		for i, qb in enumerate(qureg):
+			Ry(0.5 * (i + 1)) | qb
+		# deallocate a global qubit in state 1 and a local qubit
+		Ry(-0.5 * 7) | qureg[6]
+		X | qureg[6]
+		qureg[6].__del__()
+		Ry(-0.5) | qureg[0]
+		qureg[0].__del__()
+		ancilla = eng.allocate_qubit()
+		H | ancilla
+		CNOT | (ancilla, qureg[3])
+		eng.flush()
+		qureg = qureg[1:6] + ancilla
+		states.append(_ordered_state(s, qureg))
+		with pytest.raises(RuntimeError):
+			qureg[5].__del__()
+		Measure | qureg
+	assert numpy.allclose(states[0], states[1])
+
+
+def test_distributed_simulator_measurement(backend):
+	sim, dist_sim = _make_simulators(backend, 8)
+	eng = MainEngine(dist_sim, [])
+	qureg = eng.allocate_qureg(8)
+	H | qureg[0]
+	for qb in qureg[1:]:
+		CNOT | (qureg[0], qb)
+	eng.flush()
+	samples = dist_sim.sample(qureg, 100)
+	assert set(samples.tolist()) <= set([0, 255])
+	assert len(set(samples.tolist())) == 2
+	Measure | qureg
+	values = [int(qb) for qb in qureg]
+	assert values == [values[0]] * 8
+	assert 1. == pytest.approx(abs(dist_sim.cheat()[1][255 * values[0]]))
+
+
+def test_distributed_simulator_expectation_value(backend):
+	sim, dist_sim = _make_simulators(backend, 4)
+	terms = {((0, 'X'), (6, 'Z')): 0.5, ((7, 'Y'),): -1.,
+	         ((1, 'Y'), (6, 'X'), (7, 'Z')): 2., (): 0.25}
+	diagonal = numpy.arange(256) * 0.01
+	results = []
+	for s in [sim, dist_sim]:
+		eng = MainEngine(s, [])
+		qureg = eng.allocate_qureg(8)
+		for i, qb in enumerate(qureg):
+			Rx(0.2 * (i + 1)) | qb
+		CNOT | (qureg[6], qureg[7])
+		eng.flush()
+		results.append((s.get_expectation_value(terms, qureg),
+		                s.get_expectation_value(diagonal, qureg)))
+		with pytest.raises(ValueError):
+			s.get_expectation_value({((0, 'X'), (0, 'Z')): 1.}, qureg)
+		with pytest.raises(RuntimeError):
+			s._simulator.get_expectation_value([([(12345, 'Z')], 1.)])
+		Measure | qureg
+	assert results[0][0] == pytest.approx(results[1][0])
+	assert results[0][1] == pytest.approx(results[1][1])
+
+
+def test_distributed_simulator_engine():
+	sim = Simulator(num_processes=2)
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(6)
+	X | qureg[5]
+	Measure | qureg
+	assert [int(qb) for qb in qureg] == [0, 0, 0, 0, 0, 1]
+
+
+def test_distributed_simulator_snapshot(backend):
+	sim, dist_sim = _make_simulators(backend, 4)
+	states = []
+	for s in [sim, dist_sim]:
+		eng = MainEngine(s, [])
+		qureg = eng.allocate_qureg(8)
+		for i, qb in enumerate(qureg):
+			Ry(0.3 * (i + 1)) | qb
+		eng.flush()
+		dropped = s.snapshot()
+		snapshot = s.snapshot()
+		# the copies of the shards are released with the next snapshot/restore
+		del dropped
+		CNOT | (qureg[7], qureg[0])
+		Swap | (qureg[6], qureg[1])
+		H | qureg[6]
+		eng.flush()
+		s.restore(snapshot)
+		Rx(0.4) | qureg[7]
+		eng.flush()
+		states.append(_ordered_state(s, qureg))
+		Measure | qureg
+	assert numpy.allclose(states[0], states[1])
+	assert dist_sim._simulator._released_snapshots == []
+
+
+def test_distributed_simulator_checkpoint(backend, tmpdir):
+	path = str(tmpdir.join("state.ckpt"))
+	sim, dist_sim = _make_simulators(backend, 4)
+	states = []
+	for writer, reader in [(dist_sim, sim), (sim, dist_sim)]:
+		eng = MainEngine(writer, [])
+		qureg = eng.allocate_qureg(8)
+		for i, qb in enumerate(qureg):
+			Ry(0.3 * (i + 1)) | qb
+		CNOT | (qureg[7], qureg[0])
+		Swap | (qureg[6], qureg[1])
+		eng.flush()
+		state = _ordered_state(writer, qureg)
+		writer.save_checkpoint(path)
+		Measure | qureg
+		del qureg
+		eng.flush()
+
+		eng = MainEngine(reader, [])
+		qureg = reader.load_checkpoint(path)
+		assert numpy.allclose(_ordered_state(reader, qureg), state)
+		Measure | qureg
+		del qureg
+		eng.flush()
+
+
+def test_distributed_simulator_set_wavefunction(backend):
+	sim, dist_sim = _make_simulators(backend, 4)
+	wavefunction = numpy.arange(256) * numpy.exp(0.1j * numpy.arange(256))
+	wavefunction /= numpy.linalg.norm(wavefunction)
+	states = []
+	for s in [sim, dist_sim]:
+		eng = MainEngine(s, [])
+		qureg = eng.allocate_qureg(8)
+		Swap | (qureg[6], qureg[1])
+		eng.flush()
+		s.set_wavefunction(wavefunction, qureg[::-1])
+		assert numpy.allclose(_ordered_state(s, qureg[::-1]), wavefunction)
+		s.collapse_wavefunction([qureg[0], qureg[5]], [1, 0])
+		H | qureg[3]
+		eng.flush()
+		states.append(_ordered_state(s, qureg))
+		with pytest.raises(RuntimeError):
+			s.collapse_wavefunction([qureg[0]], [0])
+		Measure | qureg
+	assert numpy.allclose(states[0], states[1])
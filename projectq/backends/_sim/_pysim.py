@@ -17,9 +17,14 @@ Please compile the c++ simulator for large-scale simulations.
 """
 
 import cmath
+import copy
+import json
 import random
+import tempfile
 import numpy as _np
 
+from . import _checkpoint
+
 
 class Simulator(object):
 	"""
@@ -29,77 +34,312 @@ class Simulator(object):
 	not an option (for some reason). It has the same features but is much
 	slower, so please consider building the c++ version for larger experiments.
 	"""
-	def __init__(self, rnd_seed, *args, **kwargs):
+	# data type of the state vector and tolerance for numerical errors in the
+	# amplitudes of classical states
+	_dtype = _np.complex128
+	_tol = 1.e-10
+	# probability below which a collapse is invalid (as in the C++ simulator)
+	_prob_tol = 1.e-12
+	
+	def __init__(self, rnd_seed, storage_dir="", *args, **kwargs):
 		"""
 		Initialize the simulator.
 		
 		Args:
 			rnd_seed (int): Seed to initialize the random number generator.
+			storage_dir (str): If not empty, the state vector is stored in a
+				temporary, memory-mapped file in this directory (instead of RAM).
 			args: Dummy argument to allow an interface identical to the c++
 				simulator.
 			kwargs: Same as args.
 		"""
 		random.seed(rnd_seed)
-		self._state = _np.ones(1, dtype=_np.complex128)
+		self._storage_dir = storage_dir
+		self._state = self._new_state(1)
+		self._state[0] = 1.
 		self._map = dict()
 		self._num_qubits = 0
+		self._fusion_limits = (4, 5)
 		print("(Note: This is the (slow) Python simulator.)")
 	
 	
-	def cheat(self):
+	def cheat(self, writable=False):
 		"""
-		Return the qubit index to bit location map and the corresponding state
-		vector.
+		Return the qubit IDs ordered by their bit-location and the corresponding
+		state vector.
 		
 		This function can be used to measure expectation values more efficiently
 		(emulation).
 		
+		Args:
+			writable (bool): If True, the returned state vector may be modified.
+		
+		Returns:
+			A tuple where the first entry is a NumPy array containing the ID of the
+			qubit at bit-location i in entry i, and the second entry is a NumPy
+			array which aliases the state vector (read-only unless writable=True).
+		"""
+		ids = _np.empty(len(self._map), dtype=_np.uint32)
+		for ID, pos in self._map.items():
+			ids[pos] = ID
+		state = self._state.view()
+		state.flags.writeable = writable
+		return (ids, state)
+	
+	def snapshot(self):
+		"""
+		Return a copy of the simulator (state vector, qubit mapping, and state
+		of the random number generator), which can be restored using restore.
+		"""
+		snapshot = copy.copy(self)
+		snapshot._state = self._new_state(len(self._state))
+		snapshot._state[:] = self._state
+		snapshot._map = dict(self._map)
+		snapshot._rng_state = random.getstate()
+		return snapshot
+	
+	def restore(self, snapshot):
+		"""
+		Restore the state of the simulator from a snapshot (the snapshot itself
+		is not modified, i.e., it can be restored several times).
+		
+		Args:
+			snapshot (Simulator): Snapshot returned by snapshot().
+		"""
+		if len(self._state) != len(snapshot._state):
+			self._state = self._new_state(len(snapshot._state))
+		self._state[:] = snapshot._state
+		self._map = dict(snapshot._map)
+		self._num_qubits = snapshot._num_qubits
+		self._fusion_limits = snapshot._fusion_limits
+		random.setstate(snapshot._rng_state)
+	
+	def set_wavefunction(self, wavefunction, ids):
+		"""
+		Replace the state vector by wavefunction, where bit k of the index
+		corresponds to the qubit ids[k].
+		
+		Args:
+			wavefunction (array): 2^len(ids) complex amplitudes.
+			ids (list<int>): IDs of all allocated qubits.
+		
+		Raises:
+			ValueError: If the number of amplitudes does not match the number of
+				qubits.
+			RuntimeError: If ids does not contain each allocated qubit exactly
+				once.
+		"""
+		if len(wavefunction) != 1 << len(ids):
+			raise ValueError("The wavefunction must have 2^(#qubits) entries.")
+		if sorted(ids) != sorted(self._map):
+			raise RuntimeError("set_wavefunction(): Invalid mapping provided. "
+			                   "Please make sure all qubits have been allocated "
+			                   "previously (call eng.flush()).")
+		self._map = dict((ID, pos) for pos, ID in enumerate(ids))
+		self._state[:] = wavefunction
+	
+	def collapse_wavefunction(self, ids, values):
+		"""
+		Collapse the qubits ids to the given values (post-selection) and
+		re-normalize the state.
+		
+		Args:
+			ids (list<int>): Qubit IDs to collapse.
+			values (list<bool>): Values to which the qubits are collapsed.
+		
+		Raises:
+			RuntimeError: If a qubit has not been allocated or if the
+				probability of the outcome is (close to) zero.
+		"""
+		if len(ids) != len(values):
+			raise ValueError("collapse_wavefunction(): The number of qubits and "
+			                 "values must agree.")
+		mask = 0
+		val = 0
+		for ID, value in zip(ids, values):
+			if ID not in self._map:
+				raise RuntimeError("collapse_wavefunction(): Unknown qubit id. "
+				                   "Please make sure all qubits have been "
+				                   "allocated previously (call eng.flush()).")
+			mask |= 1 << self._map[ID]
+			val |= int(value) << self._map[ID]
+		keep = (_np.arange(len(self._state)) & mask) == val
+		nrm = _np.vdot(self._state[keep], self._state[keep]).real
+		if nrm < self._prob_tol:
+			raise RuntimeError("collapse_wavefunction(): Invalid collapse! "
+			                   "Probability is ~0.")
+		self._state[~keep] = 0.
+		self._state *= 1. / _np.sqrt(nrm)
+	
+	def save_checkpoint(self, path, metadata=""):
+		"""
+		Write the state of the simulator (qubit mapping, state of the random
+		number generator, and state vector) to a checkpoint file.
+		
+		Args:
+			path (str): Path of the checkpoint file.
+			metadata (str): Data to store along with the state.
+		"""
+		ids = [0] * len(self._map)
+		for ID, pos in self._map.items():
+			ids[pos] = ID
+		version, internal, gauss = random.getstate()
+		rng_state = b"python\n" + json.dumps([version, list(internal),
+		                                      gauss]).encode('utf-8')
+		offset = _checkpoint.write_header(path, self._state.itemsize, ids,
+		                                  rng_state, metadata)
+		_checkpoint.write_amplitudes(path, offset, self._state)
+	
+	def load_checkpoint(self, path):
+		"""
+		Replace the state of the simulator by the one stored in a checkpoint
+		file.
+		
+		Args:
+			path (str): Path of the checkpoint file.
+		
 		Returns:
-			A tuple where the first entry is a dictionary mapping qubit indices to
-			bit-locations	and the second entry is the corresponding state vector
+			The metadata stored in the checkpoint.
 		"""
-		return (self._map, self._state)
+		itemsize, ids, rng_state, metadata, offset = _checkpoint.read_header(path)
+		state = self._new_state(1 << len(ids))
+		_checkpoint.read_amplitudes(path, offset, state, itemsize)
+		self._state = state
+		self._map = dict((ID, pos) for pos, ID in enumerate(ids))
+		self._num_qubits = len(ids)
+		# the state of the random number generator of another simulator is
+		# ignored
+		if rng_state.startswith(b"python\n"):
+			version, internal, gauss = json.loads(rng_state[7:].decode('utf-8'))
+			random.setstate((version, tuple(internal), gauss))
+		return metadata
 	
-	def measure_qubits(self, ids):
+	def measure_qubits(self, ids, deallocate=False):
 		"""
 		Measure the qubits with IDs ids and return a list of measurement outcomes
 		(True/False).
 		
 		Args:
 			ids (list<int>): List of qubit IDs to measure.
+			deallocate (bool): If True, the measured qubits are removed from the
+				state vector (i.e., they must not be used anymore).
 			
 		Returns:
 			List of measurement results (containing either True or False).
 		"""
 		P = random.random()
-		val = 0.
-		i_picked = 0
-		while val < P and i_picked < len(self._state):
-			val += _np.abs(self._state[i_picked]) ** 2
-			i_picked += 1
-		
-		i_picked -= 1
+		# pick entry at random with probability |entry|^2
+		cumulative = _np.cumsum(_np.abs(self._state) ** 2)
+		i_picked = min(int(_np.searchsorted(cumulative, P)),
+		               len(self._state) - 1)
 		
 		pos = [self._map[ID] for ID in ids]
 		res = [False] * len(pos)
 		
-		mask = 0
-		val = 0
 		for i in range(len(pos)):
 			res[i] = (((i_picked >> pos[i]) & 1) == 1)
-			mask |= (1 << pos[i])
-			val |= ((res[i] & 1) << pos[i])
-			
-		nrm = 0.
-		for i in range(len(self._state)):
-			if (mask & i) != val:
-				self._state[i] = 0.
-			else:
-				nrm += _np.abs(self._state[i]) ** 2
-
+			# set entries which disagree with the measurement outcome to 0
+			self._split(pos[i])[:, int(not res[i]), :] = 0.
+		
+		nrm = _np.vdot(self._state, self._state).real
 		self._state *= 1. / _np.sqrt(nrm)
+		if deallocate:
+			for ID in ids:
+				self.deallocate_qubit(ID)
 		return res
 	
+	def sample(self, ids, shots):
+		"""
+		Sample the qubits with IDs ids shots times (without collapsing the
+		state vector).
+		
+		Args:
+			ids (list<int>): List of qubit IDs to sample.
+			shots (int): Number of samples to draw.
+			
+		Returns:
+			NumPy array of integers, where bit k of each sample corresponds to the
+			qubit ids[k].
+		"""
+		cumulative = _np.cumsum(_np.abs(self._state) ** 2)
+		rnd = _np.array([random.random() for _ in range(shots)]) * cumulative[-1]
+		picked = _np.minimum(_np.searchsorted(cumulative, rnd, side='right'),
+		                     len(self._state) - 1)
+		samples = _np.zeros(shots, dtype=_np.int64)
+		for k, ID in enumerate(ids):
+			samples |= ((picked >> self._map[ID]) & 1) << k
+		return samples
+	
+	def get_expectation_value(self, terms):
+		"""
+		Return the expectation value of a weighted sum of Pauli strings.
+		
+		Args:
+			terms (list): List of tuples (pauli_string, coefficient), where
+				pauli_string is a list of tuples (qubit ID, 'X' / 'Y' / 'Z') and
+				coefficient is a real number.
+		
+		Returns:
+			Expectation value (float).
+		"""
+		indices = _np.arange(len(self._state))
+		phases = [1., 1j, -1., -1j]
+		expectation = 0.
+		for pauli_string, coefficient in terms:
+			flipmask = signmask = num_y = 0
+			used = set()
+			for ID, op in pauli_string:
+				if ID not in self._map:
+					raise RuntimeError("get_expectation_value(): Unknown qubit id. "
+					                   "Please make sure all qubits have been "
+					                   "allocated previously (call eng.flush()).")
+				if ID in used:
+					raise ValueError("get_expectation_value(): Pauli strings may "
+					                 "act on each qubit at most once.")
+				used.add(ID)
+				bit = 1 << self._map[ID]
+				if op == 'X':
+					flipmask |= bit
+				elif op == 'Y':
+					flipmask |= bit
+					signmask |= bit
+					num_y += 1
+				elif op == 'Z':
+					signmask |= bit
+				else:
+					raise ValueError("Pauli strings may only contain 'X', 'Y', and "
+					                 "'Z'.")
+			# P|i> = i^(#Y) * (-1)^(#Y/Z-qubits which are 1 in i) |i ^ flipmask>
+			parity = _np.zeros(len(self._state), dtype=_np.int64)
+			for pos in range(self._num_qubits):
+				if (signmask >> pos) & 1:
+					parity ^= (indices >> pos) & 1
+			value = _np.sum(_np.conj(self._state[indices ^ flipmask]) *
+			                self._state * (1 - 2 * parity))
+			expectation += coefficient * (phases[num_y % 4] * value).real
+		return expectation
+	
+	def get_expectation_value_diagonal(self, diagonal, ids):
+		"""
+		Return the expectation value of a diagonal observable.
+		
+		Args:
+			diagonal (numpy.ndarray): Diagonal of the observable, where bit k of
+				the index corresponds to the qubit ids[k].
+			ids (list<int>): List of qubit IDs on which the observable acts.
+		
+		Returns:
+			Expectation value (float).
+		"""
+		if len(diagonal) != 1 << len(ids):
+			raise ValueError("The diagonal must have 2^(#qubits) entries.")
+		indices = _np.arange(len(self._state))
+		k = _np.zeros(len(self._state), dtype=_np.int64)
+		for l, ID in enumerate(ids):
+			k |= ((indices >> self._map[ID]) & 1) << l
+		return float(_np.dot(_np.abs(self._state) ** 2,
+		                     _np.asarray(diagonal)[k]))
+	
 	def allocate_qubit(self, ID):
 		"""
 		Allocate a qubit.
@@ -107,11 +347,44 @@ class Simulator(object):
 		Args:
 			ID (int): ID of the qubit which is being allocated.
 		"""
-		self._map[ID] = self._num_qubits
-		self._num_qubits += 1
-		self._state.resize(1 << self._num_qubits)
+		self.allocate_qureg([ID])
 	
-	def get_classical_value(self, ID, tol=1.e-10):
+	def allocate_qureg(self, IDs):
+		"""
+		Allocate several qubits at once (resizing the state vector only once).
+		
+		The qubits are inserted such that qubits which have been allocated
+		later (i.e., have larger IDs) are at higher bit-locations.
+		
+		Args:
+			IDs (list<int>): IDs of the qubits which are being allocated.
+		"""
+		if len(set(IDs)) != len(IDs) or any(ID in self._map for ID in IDs):
+			raise RuntimeError("AllocateQubit: ID already exists. Qubit IDs "
+			                   "should be unique.")
+		if len(IDs) == 0:
+			return
+		IDs = sorted(IDs)
+		positions = [k + sum(1 for ID in self._map if ID < new_id)
+		             for k, new_id in enumerate(IDs)]
+		old_ids = sorted(self._map, key=self._map.get)
+		free = [pos for pos in range(self._num_qubits + len(IDs))
+		        if pos not in positions]
+		self._map = dict(zip(old_ids, free))
+		self._map.update(zip(IDs, positions))
+		self._num_qubits += len(IDs)
+		# (copy instead of resizing in-place, as the state vector may still be
+		# referenced by the arrays returned by cheat)
+		newstate = self._new_state(1 << self._num_qubits)
+		# the axes of the reshaped state vectors are ordered from the highest to
+		# the lowest bit-location
+		index = tuple(0 if pos in positions else slice(None)
+		              for pos in reversed(range(self._num_qubits)))
+		newstate.reshape([2] * self._num_qubits)[index] = (
+		    self._state.reshape([2] * (self._num_qubits - len(IDs))))
+		self._state = newstate
+	
+	def get_classical_value(self, ID, tol=None):
 		"""
 		Return the classical value of a classical bit (i.e., a qubit which has
 		been measured / uncomputed).
@@ -119,25 +392,22 @@ class Simulator(object):
 		Args:
 			ID (int): ID of the qubit of which to get the classical value.
 			tol (float): Tolerance for numerical errors when determining whether
-				the qubit is indeed classical.
+				the qubit is indeed classical (depends on the precision of the
+				state vector by default).
 			
 		Raises:
 			RuntimeError: If the qubit is in a superposition, i.e., has not been
 				measured / uncomputed.
 		"""
-		pos = self._map[ID]
-		up = down = False
-		
-		for i in range(0, len(self._state), (1 << (pos + 1))):
-			for j in range(0, (1 << pos)):
-				if _np.abs(self._state[i + j]) > tol:
-					up = True
-				if _np.abs(self._state[i + j + (1 << pos)]) > tol:
-					down = True
-				if up and down:
-					raise RuntimeError("Qubit has not been measured / uncomputed. Cannot "
-					                "access its classical value and/or deallocate a "
-					                "qubit in superposition!")
+		if tol is None:
+			tol = self._tol
+		halves = self._split(self._map[ID])
+		up = bool(_np.any(_np.abs(halves[:, 0, :]) > tol))
+		down = bool(_np.any(_np.abs(halves[:, 1, :]) > tol))
+		if up and down:
+			raise RuntimeError("Qubit has not been measured / uncomputed. Cannot "
+			                   "access its classical value and/or deallocate a "
+			                   "qubit in superposition!")
 		return down
 	
 	def deallocate_qubit(self, ID):
@@ -155,12 +425,10 @@ class Simulator(object):
 		
 		cv = self.get_classical_value(ID)
 		
-		newstate = _np.zeros((1 << (self._num_qubits - 1)), dtype=_np.complex128)
-		k = 0
-		for i in range((1 << pos) * int(cv), len(self._state), (1 << (pos + 1))):
-			newstate[k:k + (1 << pos)] = self._state[i:i + (1 << pos)]
-			k += (1 << pos)
-			
+		halves = self._split(pos)
+		newstate = self._new_state(len(self._state) // 2)
+		newstate.reshape(halves.shape[0], halves.shape[2])[:] = halves[:, int(cv), :]
+		
 		newmap = dict()
 		for key, value in self._map.items():
 			if value > pos:
@@ -171,6 +439,33 @@ class Simulator(object):
 		self._state = newstate
 		self._num_qubits -= 1
 	
+	def _new_state(self, size):
+		"""
+		Return a new state vector of the given size which is initialized to zero
+		(and memory-mapped if a storage directory has been specified).
+		
+		Args:
+			size (int): Number of entries of the new state vector.
+		"""
+		if not self._storage_dir:
+			return _np.zeros(size, dtype=self._dtype)
+		with tempfile.TemporaryFile(dir=self._storage_dir) as f:
+			return _np.memmap(f, dtype=self._dtype, mode='w+', shape=(size,))
+	
+	def _split(self, pos):
+		"""
+		Return a view of the state vector which separates the amplitudes where
+		the qubit at bit-location pos is 0 from the ones where it is 1.
+		
+		Args:
+			pos (int): Bit-location of the qubit.
+		
+		Returns:
+			View of the state vector with shape (2**(n-pos-1), 2, 2**pos), where
+			n is the number of qubits.
+		"""
+		return self._state.reshape(-1, 2, 1 << pos)
+	
 	def _get_control_mask(self, ctrlids):
 		"""
 		Get control mask from list of control qubit IDs.
@@ -203,56 +498,226 @@ class Simulator(object):
 			for qubit_id in qureg:
 				qb_locs[-1].append(self._map[qubit_id])
 
-		newstate = _np.zeros_like(self._state)
-		for i in range(0, len(self._state)):
-			if (mask & i) == mask:
-				arg_list = [0] * len(qb_locs)
-				for qr_i in range(len(qb_locs)):
-					for qb_i in range(len(qb_locs[qr_i])):
-						arg_list[qr_i] |= (((i >> qb_locs[qr_i][qb_i]) & 1) << qb_i)
-				
-				res = f(arg_list)
-				new_i = i
-				for qr_i in range(len(qb_locs)):
-					for qb_i in range(len(qb_locs[qr_i])):
-						if not (((new_i >> qb_locs[qr_i][qb_i]) & 1) ==
-						        ((res[qr_i] >> qb_i) & 1)):
-							new_i ^= (1 << qb_locs[qr_i][qb_i])
-				newstate[new_i] = self._state[i]
-			else:
-				newstate[i] = self._state[i]
+		# f is only evaluated on the support of the state (where the controls
+		# are satisfied), amplitudes below the rounding error are dropped
+		indices = _np.arange(len(self._state), dtype=_np.int64)
+		active = (indices & mask) == mask
+		tol = _np.finfo(self._dtype).eps ** 2
+		support = _np.flatnonzero(active & (_np.abs(self._state) ** 2 > tol))
+		amplitudes = self._state[support]
+		self._state[active] = 0.
+		new_indices = []
+		for i in support.tolist():
+			arg_list = [0] * len(qb_locs)
+			for qr_i in range(len(qb_locs)):
+				for qb_i in range(len(qb_locs[qr_i])):
+					arg_list[qr_i] |= (((i >> qb_locs[qr_i][qb_i]) & 1) << qb_i)
 			
+			res = f(arg_list)
+			new_i = i
+			for qr_i in range(len(qb_locs)):
+				for qb_i in range(len(qb_locs[qr_i])):
+					if not (((new_i >> qb_locs[qr_i][qb_i]) & 1) ==
+					        ((res[qr_i] >> qb_i) & 1)):
+						new_i ^= (1 << qb_locs[qr_i][qb_i])
+			new_indices.append(new_i)
+		_np.add.at(self._state, _np.array(new_indices, dtype=_np.int64),
+		           amplitudes)
+	
+	def _emulate_math_vectorized(self, f, ids, ctrlids):
+		"""
+		Emulate a function f which maps the values of the number stored in the
+		qubits ids (from low- to high-bit) to new values, where f is applied to
+		all values at once (as a NumPy array).
+		"""
+		mask = self._get_control_mask(ctrlids)
+		locs = [self._map[ID] for ID in ids]
+		indices = _np.arange(len(self._state), dtype=_np.int64)
+		x = _np.zeros(len(indices), dtype=_np.int64)
+		for k, loc in enumerate(locs):
+			x |= ((indices >> loc) & 1) << k
+		y = _np.asarray(f(x), dtype=_np.int64)
+		new_indices = indices.copy()
+		for k, loc in enumerate(locs):
+			new_indices &= ~(1 << loc)
+			new_indices |= ((y >> k) & 1) << loc
+		active = (indices & mask) == mask
+		new_indices = _np.where(active, new_indices, indices)
+		newstate = self._new_state(len(self._state))
+		_np.add.at(newstate, new_indices, self._state)
 		self._state = newstate
 	
+	def emulate_math_add_constant(self, a, ids, ctrlids):
+		"""
+		Add the constant a to the number stored in the qubits ids (from low- to
+		high-bit) modulo 2^len(ids).
+		"""
+		self._emulate_math_vectorized(lambda x: (x + a) % (1 << len(ids)),
+		                              ids, ctrlids)
+	
+	def emulate_math_add_constant_modN(self, a, N, ids, ctrlids):
+		"""
+		Add the constant a to the number stored in the qubits ids modulo N
+		(values x >= N are left unchanged).
+		"""
+		if not 0 < N <= 1 << len(ids):
+			raise ValueError("The modulus must satisfy 0 < N <= 2^#qubits.")
+		self._emulate_math_vectorized(lambda x: _np.where(x < N, (x + a) % N, x),
+		                              ids, ctrlids)
+	
+	def emulate_math_multiply_by_constant_modN(self, a, N, ids, ctrlids):
+		"""
+		Multiply the number stored in the qubits ids by the constant a modulo N
+		(values x >= N are left unchanged).
+		"""
+		if not 0 < N <= 1 << len(ids):
+			raise ValueError("The modulus must satisfy 0 < N <= 2^#qubits.")
+		self._emulate_math_vectorized(
+		    lambda x: _np.where(x < N, (a % N) * x % N, x), ids, ctrlids)
+	
+	def emulate_math_table(self, table, ids, ctrlids):
+		"""
+		Emulate a math function given by its lookup table.
+		
+		Args:
+			table (array): Array of length 2^len(ids), where table[x] is the new
+				value of the number x stored in the qubits ids (from low- to
+				high-bit).
+			ids (list<int>): Qubit IDs to which the function is applied.
+			ctrlids (list<int>): List of control qubit ids.
+		"""
+		table = _np.asarray(table, dtype=_np.int64)
+		if len(table) != 1 << len(ids):
+			raise ValueError("The lookup table must have 2^#qubits entries.")
+		self._emulate_math_vectorized(lambda x: table[x], ids, ctrlids)
+	
 	def apply_controlled_gate(self, m, ids, ctrlids):
 		"""
-		Applies the single qubit gate matrix m to the qubit with index ids[0],
+		Applies the k-qubit gate matrix m to the qubits with indices ids,
 		using ctrlids as control qubits.
 		
 		Args:
-			m (list<list>): 2x2 complex matrix describing the single-qubit gate.
-			ids (list): A list containing the qubit ID to which to apply the gate.
+			m (list<list>): 2^k x 2^k complex matrix describing the k-qubit gate,
+				where bit l of the row/column index corresponds to qubit ids[l].
+			ids (list): A list containing the qubit IDs to which to apply the gate.
 			ctrlids (list): A list of control qubit IDs (i.e., the gate is only
 				applied where these qubits are 1).
 		"""
-		ID = ids[0]
-		pos = self._map[ID]
+		n = self._num_qubits
+		# view the state vector as a tensor with one axis per qubit, where axis
+		# n - 1 - pos corresponds to the qubit at bit-location pos
+		psi = self._state.reshape([2] * n)
 		
-		mask = self._get_control_mask(ctrlids)
-
-		def kernel(u, d, m):
-			return u * m[0][0] + d * m[0][1], u * m[1][0] + d * m[1][1]
+		# restrict the view to the subspace where all controls are 1
+		subspace = [slice(None)] * n
+		for ctrlid in ctrlids:
+			subspace[n - 1 - self._map[ctrlid]] = slice(1, 2)
+		sub = psi[tuple(subspace)]
+		
+		# bit l of the matrix index corresponds to qubit ids[l]
+		k = len(ids)
+		axes = [n - 1 - self._map[ID] for ID in reversed(ids)]
+		m = _np.asarray(m, dtype=_np.complex128).reshape([2] * (2 * k))
+		res = _np.tensordot(m, sub, axes=(list(range(k, 2 * k)), axes))
+		sub[...] = _np.moveaxis(res, list(range(k)), axes)
+	
+	def apply_controlled_permutation(self, perm, ids, ctrlids):
+		"""
+		Applies the permutation gate perm (e.g., X or Swap) to the qubits with
+		indices ids, using ctrlids as control qubits. Amplitudes are moved
+		instead of multiplying by the (permutation) matrix of the gate.
+		
+		Args:
+			perm (list<int>): Permutation of the 2^k basis states of the k qubits
+				in ids, i.e., the basis state l is mapped to perm[l], where bit i of
+				l corresponds to qubit ids[i].
+			ids (list): A list containing the qubit IDs to which to apply the gate.
+			ctrlids (list): A list of control qubit IDs (i.e., the gate is only
+				applied where these qubits are 1).
+		"""
+		n = self._num_qubits
+		psi = self._state.reshape([2] * n)
+		
+		subspace = [slice(None)] * n
+		for ctrlid in ctrlids:
+			subspace[n - 1 - self._map[ctrlid]] = slice(1, 2)
 		
-		for i in range(0, len(self._state), (1 << (pos + 1))):
-			for j in range(0, 1 << pos):
-				if ((i + j) & mask) == mask:
-					self._state[i + j], self._state[i + j + (1 << pos)] = kernel(
-                                              self._state[i + j],
-                                              self._state[i + j + (1 << pos)],
-                                              m)
+		def block(l):
+			# view of the amplitudes where the target qubits are in basis state l
+			index = list(subspace)
+			for i, ID in enumerate(ids):
+				bit = (l >> i) & 1
+				index[n - 1 - self._map[ID]] = slice(bit, bit + 1)
+			return psi[tuple(index)]
+		
+		moved = [l for l in range(len(perm)) if perm[l] != l]
+		blocks = [block(l).copy() for l in moved]
+		for l, values in zip(moved, blocks):
+			block(perm[l])[...] = values
+	
+	def swap_qubits(self, ID1, ID2):
+		"""
+		Swap two qubits by exchanging their bit-locations (the state vector
+		remains untouched).
+		
+		Args:
+			ID1 (int): ID of the first qubit.
+			ID2 (int): ID of the second qubit.
+		"""
+		self._map[ID1], self._map[ID2] = self._map[ID2], self._map[ID1]
+	
+	def set_fusion_limits(self, fusion_min, fusion_max):
+		"""
+		Set the fusion limits (only stored, as the Python simulator applies
+		all gates immediately).
+		
+		Raises:
+			ValueError: If not 1 <= fusion_min <= fusion_max <= 5.
+		"""
+		if not 1 <= fusion_min <= fusion_max <= 5:
+			raise ValueError("The fusion limits must satisfy 1 <= fusion_min <= "
+			                 "fusion_max <= 5.")
+		self._fusion_limits = (fusion_min, fusion_max)
+	
+	def get_fusion_limits(self):
+		"""
+		Return the fusion limits (fusion_min, fusion_max).
+		"""
+		return self._fusion_limits
+	
+	def autotune_fusion(self, num_qubits=18):
+		"""
+		Dummy function to implement the same interface as the c++ simulator
+		(returns the current fusion limits).
+		"""
+		return self._fusion_limits
+	
+	def set_fusion_window(self, size):
+		"""
+		Dummy function to implement the same interface as the c++ simulator.
+		"""
+		pass
+	
+	def set_qubit_reordering(self, fast_positions):
+		"""
+		Dummy function to implement the same interface as the c++ simulator
+		(the NumPy kernels do not depend on the bit-locations of the qubits as
+		strongly).
+		"""
+		pass
 	
 	def run(self):
 		"""
 		Dummy function to implement the same interface as the c++ simulator.
 		"""
 		pass
+
+
+class SimulatorSingle(Simulator):
+	"""
+	Python implementation of a quantum computer simulator which stores the
+	state vector in single precision (complex64).
+	"""
+	_dtype = _np.complex64
+	_tol = 1.e-4
+	_prob_tol = 1.e-8
@@ -16,22 +16,60 @@ built first. If the c++ simulator is not exported to python, a (slow) python
 implementation is used as an alternative.
 """
 
+import json
+import math
 import random
+import numpy as _np
 from projectq.cengines import BasicEngine
 from projectq.meta import get_control_count
 from projectq.ops import (NOT,
                           H,
                           R,
+                          Swap,
                           Measure,
                           FlushGate,
                           Allocate,
                           Deallocate,
                           BasicMathGate)
+from projectq.types import Qubit, Qureg
 
 try:
-	from ._cppsim import Simulator as SimulatorBackend
+	from ._cppsim import (Simulator as SimulatorBackend,
+	                      SimulatorSingle as SimulatorSingleBackend)
 except ImportError:
-	from ._pysim import Simulator as SimulatorBackend
+	from ._pysim import (Simulator as SimulatorBackend,
+	                     SimulatorSingle as SimulatorSingleBackend)
+
+
+def _math_table(math_fun, sizes, chunk_size=1 << 20):
+	"""
+	Return the lookup table of a vectorized math function, i.e., the array
+	table where table[x] holds the output for the register values encoded in
+	x (the first register in the lowest bits of x and table[x]).
+	
+	Args:
+		math_fun (function): Vectorized math function (see
+			BasicMathGate.get_math_function_vectorized).
+		sizes (list<int>): Number of qubits of each register.
+		chunk_size (int): Number of inputs which are passed to math_fun at once.
+	"""
+	table = _np.empty(1 << sum(sizes), dtype=_np.int64)
+	for start in range(0, len(table), chunk_size):
+		keys = _np.arange(start, min(start + chunk_size, len(table)),
+		                  dtype=_np.int64)
+		values = []
+		shift = 0
+		for size in sizes:
+			values.append((keys >> shift) & ((1 << size) - 1))
+			shift += size
+		keys[:] = 0
+		shift = 0
+		for size, result in zip(sizes, math_fun(values)):
+			result = _np.asarray(result, dtype=_np.int64)
+			keys |= (result & ((1 << size) - 1)) << shift
+			shift += size
+		table[start:start + len(keys)] = keys
+	return table
 
 
 class Simulator(BasicEngine):
@@ -47,7 +85,9 @@ class Simulator(BasicEngine):
 		export OMP_NUM_THREADS=4 # use 4 threads
 		export OMP_PROC_BIND=spread # bind threads to processors by spreading
 	"""
-	def __init__(self, gate_fusion=False, rnd_seed=None):
+	def __init__(self, gate_fusion=False, rnd_seed=None, precision='double',
+	             storage_dir=None, num_processes=1, qubit_reordering=False,
+	             fusion_min=4, fusion_max=5, fusion_window=0):
 		"""
 		Construct the C++/Python-simulator object and initialize it with a random
 		seed.
@@ -57,6 +97,37 @@ class Simulator(BasicEngine):
 				certain gate-size has been reached (only has an effect for the c++
 				simulator).
 			rnd_seed (int): Random seed (uses random.randint(0, 1024) by default).
+			precision (str): Precision of the state vector, either 'double'
+				(complex128, default) or 'single' (complex64). Single precision
+				halves the memory requirements (i.e., allows to simulate one more
+				qubit) and is faster for large states, at the cost of an accuracy
+				of about 1e-6 in the amplitudes.
+			storage_dir (str): If given, the state vector is stored in a
+				temporary, memory-mapped file in this directory instead of RAM
+				(e.g., on a local NVMe drive). This allows to simulate more qubits
+				than fit into memory at the cost of speed. Enabling gate_fusion is
+				recommended, as it reduces the number of sweeps over the file.
+			num_processes (int): Number of processes (a power of 2) over which
+				the state vector is distributed. Each process stores the part of
+				the state vector which belongs to one value of the global qubits
+				(see DistributedSimulator).
+			qubit_reordering (bool or int): If True (or a number of bit-locations,
+				14 by default), qubits which are used repeatedly by dense gates
+				are moved to the lowest bit-locations of the state vector, where
+				the C++ kernels access the memory with good locality. The
+				reordering is transparent to cheat().
+			fusion_min (int): If gate_fusion is True, gates are fused until the
+				fused gate acts on at least fusion_min qubits.
+			fusion_max (int or str): Maximal number of qubits (at most 5) of a
+				fused gate. If 'auto', both limits are chosen by timing the
+				kernels on this machine (see autotune_fusion of the C++
+				simulator).
+			fusion_window (int): If gate_fusion is True and fusion_window > 0,
+				the C++ simulator buffers this many gates and fuses each gate
+				with later gates which can be moved next to it (as they act on
+				other qubits than the gates in between), which reduces the
+				number of sweeps over the state vector (e.g., for QFT and
+				Trotter circuits).
 			
 		Example of gate_fusion: Instead of applying a Hadamard gate to 5 qubits,
 		the simulator calculates the kronecker product of the 1-qubit matrices and
@@ -73,21 +144,47 @@ class Simulator(BasicEngine):
 			If you need to run large simulations, check out the tutorial in the docs
 			which gives futher hints on how to build the C++ extension.
 		"""
+		if precision == 'double':
+			backend = SimulatorBackend
+		elif precision == 'single':
+			backend = SimulatorSingleBackend
+		else:
+			raise ValueError("Unknown precision '{}'. Use either 'double' or "
+			                 "'single'.".format(precision))
 		if rnd_seed is None:
 			rnd_seed = random.randint(0, 1024)
 		BasicEngine.__init__(self)
-		self._simulator = SimulatorBackend(rnd_seed)
+		if num_processes > 1:
+			from ._distsim import DistributedSimulator
+			self._simulator = DistributedSimulator(backend, num_processes,
+			                                       rnd_seed, storage_dir or "")
+		else:
+			self._simulator = backend(rnd_seed, storage_dir or "")
+		if fusion_max == 'auto':
+			self._simulator.autotune_fusion()
+		else:
+			self._simulator.set_fusion_limits(fusion_min, fusion_max)
+		if gate_fusion and fusion_window > 0:
+			self._simulator.set_fusion_window(fusion_window)
+		if qubit_reordering:
+			if qubit_reordering is True:
+				qubit_reordering = 14
+			self._simulator.set_qubit_reordering(int(qubit_reordering))
 		self._gate_fusion = gate_fusion
+		# IDs of allocated qubits which are still in |0> and have not been
+		# added to the state vector yet (they are folded in by the first
+		# non-trivial gate acting on them)
+		self._lazy_qubits = set()
 	
 	def is_available(self, cmd):
 		"""
 		Specialized implementation of is_available: The simulator can deal with
-		all arbitrarily-controlled single-qubit gates which provide a gate-matrix
-		(via gate.get_matrix()).
+		all arbitrarily-controlled gates which provide a gate-matrix (via
+		gate.matrix) and act on at most 5 qubits.
 		
 		Args:
-			cmd (Command): Command for which to check availability (single-qubit
-				gate, arbitrary controls)
+			cmd (Command): Command for which to check availability (k-qubit gate
+				with k <= 5, arbitrary controls)
 			
 		Returns:
 			True if it can be simulated and False otherwise.
@@ -97,75 +194,410 @@ class Simulator(BasicEngine):
 			return True
 		try:
 			m = cmd.gate.matrix
-			if len(m) > 2:
+			# Allow up to 5-qubit gates
+			if len(m) > 2 ** 5:
 				return False
 			return True
 		except:
 			return False
 	
-	def cheat(self):
+	def cheat(self, writable=False):
 		"""
 		Access the ordering of the qubits and the state vector directly.
 		
 		This is a cheat function which enables, e.g., more efficient evaluation of
 		expectation values and debugging.
 		
+		Args:
+			writable (bool): If True, the returned state vector may be modified
+				(changes are applied to the state of the simulator).
+		
 		Returns:
 			A tuple where the first entry is a dictionary mapping qubit indices to
 			bit-locations and the second entry is the corresponding state vector
+			as a NumPy array. The array aliases the memory of the simulator (no
+			copy is made) and is read-only unless writable=True.
+		
+		Note:
+			The state vector reflects all gates executed by the simulator so far
+			and must not be used after any further commands have been sent to
+			the simulator (the memory may have been reallocated).
 		"""
-		return self._simulator.cheat()
+		self._materialize(self._lazy_qubits)
+		qubit_ids, state = self._simulator.cheat(writable)
+		return (dict((int(ID), pos) for pos, ID in enumerate(qubit_ids)), state)
+	
+	def snapshot(self):
+		"""
+		Take a snapshot of the simulation, which can be restored (any number of
+		times) using restore, e.g., to try several continuations of a long
+		state preparation without simulating it again.
+		
+		The snapshot contains a copy of the state vector, the mapping of the
+		qubits, the state of the random number generator, and the measurement
+		results registered with the MainEngine. Call eng.flush() before taking
+		a snapshot such that the simulator has received all gates.
+		
+		Returns:
+			An opaque snapshot object (to be passed to restore).
+		"""
+		return (self._simulator.snapshot(), set(self._lazy_qubits),
+		        self._active_ids(), self.main_engine.get_measurement_results())
+	
+	def restore(self, snapshot):
+		"""
+		Restore the state of the simulation from a snapshot.
+		
+		Qubits which have been allocated after the snapshot was taken are
+		(again) in the state |0>. Qubits which have been deallocated after the
+		snapshot was taken are removed from the restored state, where qubits
+		in a superposition are measured first (i.e., the state collapses
+		randomly, as if they had been measured before deallocation).
+		
+		Args:
+			snapshot: Snapshot returned by snapshot().
+		"""
+		backend_snapshot, lazy_qubits, active_ids, measurements = snapshot
+		self._simulator.restore(backend_snapshot)
+		current_ids = self._active_ids()
+		self._lazy_qubits = (lazy_qubits & current_ids) | (current_ids -
+		                                                   active_ids)
+		superposition = []
+		for ID in sorted(active_ids - current_ids - lazy_qubits):
+			try:
+				self._simulator.deallocate_qubit(ID)
+			except RuntimeError:
+				superposition.append(ID)
+		if len(superposition) > 0:
+			self._simulator.measure_qubits(superposition, deallocate=True)
+		self.main_engine.set_measurement_results(measurements)
+	
+	def set_wavefunction(self, wavefunction, qureg):
+		"""
+		Set the state of the simulator to wavefunction, such that a known
+		initial state does not have to be prepared using gates.
+		
+		The amplitudes are copied directly into the state vector of the
+		simulator, where the qubits are mapped to the bit-locations given by
+		qureg (i.e., no amplitudes are permuted).
+		
+		Args:
+			wavefunction (array): 2^len(qureg) complex amplitudes, where bit k
+				of the index corresponds to qureg[k] (normalized).
+			qureg (Qureg): All allocated qubits (e.g., a freshly allocated
+				quantum register).
+		
+		Raises:
+			ValueError: If the number of amplitudes does not match the number of
+				qubits.
+			RuntimeError: If qureg does not contain all allocated qubits.
+		
+		Note:
+			Make sure all previous commands have passed through the compilation
+			chain (call main_engine.flush() beforehand).
+		"""
+		wavefunction = _np.asarray(wavefunction)
+		if wavefunction.ndim != 1 or len(wavefunction) != 1 << len(qureg):
+			raise ValueError("The wavefunction must have 2^len(qureg) entries.")
+		ids = [qb.id for qb in qureg]
+		# also qubits which have not been added to the state vector yet (lazy
+		# qubits) have to be in qureg
+		if len(set(ids)) != len(ids) or set(ids) != self._active_ids():
+			raise RuntimeError("set_wavefunction(): qureg must contain each "
+			                   "allocated qubit exactly once.")
+		self._materialize(ids)
+		self._simulator.set_wavefunction(wavefunction, ids)
+	
+	def collapse_wavefunction(self, qureg, values):
+		"""
+		Collapse the qubits in qureg to the given values (post-selection),
+		i.e., without drawing random numbers, and re-normalize the state.
+		
+		Args:
+			qureg (Qureg): Qubits to collapse.
+			values (list<bool>): Values to which the qubits are collapsed.
+		
+		Raises:
+			ValueError: If the number of qubits and values differ.
+			RuntimeError: If the probability of the values is (close to) zero.
+		
+		Note:
+			Make sure all previous commands have passed through the compilation
+			chain (call main_engine.flush() beforehand).
+		"""
+		if len(qureg) != len(values):
+			raise ValueError("The number of qubits and values must agree.")
+		ids = []
+		bits = []
+		for qb, value in zip(qureg, values):
+			if qb.id not in self._lazy_qubits:
+				ids.append(qb.id)
+				bits.append(bool(value))
+			elif value:
+				# lazy qubits are in |0>
+				raise RuntimeError("collapse_wavefunction(): Invalid collapse! "
+				                   "Probability is ~0.")
+		self._simulator.collapse_wavefunction(ids, bits)
+	
+	def save_checkpoint(self, path):
+		"""
+		Write a checkpoint of the simulation to the file path, such that the
+		simulation can be resumed later (e.g., after the job has been
+		terminated) using load_checkpoint.
+		
+		The checkpoint contains the qubit mapping, the state of the random
+		number generator, the measurement results registered with the
+		MainEngine, and the state vector, which is streamed to the file in
+		chunks (i.e., without copying it). Call eng.flush() before writing a
+		checkpoint such that the simulator has received all gates.
+		
+		Args:
+			path (str): Path of the checkpoint file.
+		"""
+		self._materialize(self._lazy_qubits)
+		qubits = sorted(self._active_ids())
+		measurements = sorted(self.main_engine.get_measurement_results().items())
+		# qubit IDs which are in use and must not be handed out again
+		used_ids = qubits + [ID for ID, value in measurements]
+		metadata = json.dumps({
+		    'qubit_index': max(used_ids) + 1 if len(used_ids) > 0 else 0,
+		    'qubits': qubits,
+		    'measurements': measurements})
+		self._simulator.save_checkpoint(path, metadata)
+	
+	def load_checkpoint(self, path):
+		"""
+		Load a checkpoint (see save_checkpoint) before any qubits have been
+		allocated and return the qubits which were active when the checkpoint
+		was written, such that the program can apply the remaining commands.
+		
+		Args:
+			path (str): Path of the checkpoint file.
+		
+		Returns:
+			Qureg containing the active qubits of the checkpoint (ordered by
+			their IDs).
+		
+		Raises:
+			RuntimeError: If qubits have been allocated already.
+		
+		Example:
+			.. code-block:: python
+			
+				sim = Simulator()
+				eng = MainEngine(sim)
+				qureg = sim.load_checkpoint("state.ckpt")
+				H | qureg[0]
+		"""
+		if len(self._active_ids()) > 0:
+			raise RuntimeError("Checkpoints can only be loaded before any qubit "
+			                   "has been allocated.")
+		metadata = json.loads(self._simulator.load_checkpoint(path))
+		eng = self.main_engine
+		eng.reserve_qubit_ids(metadata['qubit_index'])
+		results = eng.get_measurement_results()
+		results.update((ID, value) for ID, value in metadata['measurements'])
+		eng.set_measurement_results(results)
+		qureg = Qureg()
+		for ID in metadata['qubits']:
+			qubit = Qubit(eng, ID)
+			eng.active_qubits.add(qubit)
+			qureg.append(qubit)
+		return qureg
+	
+	def _active_ids(self):
+		"""
+		Return the IDs of the qubits which have not been deallocated.
+		"""
+		return set(qb.id for qb in self.main_engine.active_qubits
+		           if qb.id != -1)
+	
+	def sample(self, qureg, shots):
+		"""
+		Draw samples of the measurement outcomes of the qubits in qureg from the
+		current state without collapsing it (i.e., without re-running the
+		circuit for every shot).
+		
+		Args:
+			qureg (Qureg): Qubits to sample.
+			shots (int): Number of samples to draw.
+			
+		Returns:
+			A NumPy array containing shots integers, where bit k of each sample is
+			the outcome of qureg[k].
+		
+		Note:
+			Make sure all previous commands have passed through the compilation
+			chain (call main_engine.flush() beforehand).
+		"""
+		self._materialize([qb.id for qb in qureg])
+		return _np.asarray(self._simulator.sample([qb.id for qb in qureg],
+		                                          shots))
+	
+	def get_expectation_value(self, terms, qureg):
+		"""
+		Return the expectation value of an observable acting on qureg, computed
+		directly on the state vector (without copying or modifying it).
+		
+		Args:
+			terms (dict or numpy.ndarray): Either a dict mapping Pauli strings to
+				real coefficients, where a Pauli string is a tuple of tuples
+				(index, 'X' / 'Y' / 'Z') and index refers to the qubit
+				qureg[index], e.g.,
+				
+				.. code-block:: python
+				
+					{((0, 'X'), (1, 'Z')): 0.5, ((2, 'Y'),): -1., (): 0.25}
+				
+				or the diagonal of a diagonal observable (i.e., 2^len(qureg) real
+				numbers, where bit k of the index corresponds to qureg[k]).
+			qureg (Qureg): Qubits on which the observable acts.
+			
+		Returns:
+			Expectation value (float).
+		
+		Note:
+			Make sure all previous commands have passed through the compilation
+			chain (call main_engine.flush() beforehand).
+		"""
+		self._materialize([qb.id for qb in qureg])
+		if isinstance(terms, dict):
+			pauli_terms = [([(qureg[index].id, op) for index, op in term],
+			                float(coefficient))
+			               for term, coefficient in terms.items()]
+			return self._simulator.get_expectation_value(pauli_terms)
+		diagonal = _np.ascontiguousarray(terms, dtype=_np.float64)
+		return self._simulator.get_expectation_value_diagonal(
+		    diagonal, [qb.id for qb in qureg])
+	
+	def _materialize(self, ids):
+		"""
+		Add the lazy qubits among ids to the state vector (resizing it only
+		once).
+		
+		Args:
+			ids (iterable<int>): IDs of the qubits which are about to be used.
+		"""
+		new_ids = sorted(self._lazy_qubits.intersection(ids))
+		if len(new_ids) > 0:
+			self._simulator.allocate_qureg(new_ids)
+			self._lazy_qubits.difference_update(new_ids)
+	
+	def _acts_trivially(self, cmd):
+		"""
+		Return True if cmd leaves the state unchanged because of lazy qubits,
+		i.e., if a control qubit is lazy (in |0>) or if all target qubits are
+		lazy and |0...0> is mapped to itself.
+		"""
+		if any(qb.id in self._lazy_qubits for qb in cmd.control_qubits):
+			return True
+		if not all(qb.id in self._lazy_qubits
+		           for qr in cmd.qubits for qb in qr):
+			return False
+		if isinstance(cmd.gate, BasicMathGate):
+			return False
+		matrix = _np.asarray(cmd.gate.matrix)
+		if len(matrix) > 2 ** 5:
+			return False
+		return matrix[0, 0] == 1 and not _np.any(matrix[1:, 0])
 	
 	def _handle(self, cmd):
 		"""
 		Handle all commands, i.e., call the member functions of the C++-simulator
 		object corresponding to measurement, allocation/deallocation, and
-		(controlled) single-qubit gate.
+		(controlled) k-qubit gates with k <= 5.
 		
 		Args:
 			cmd (Command): Command to handle.
 		
 		Raises:
-			Exception: If a non-single-qubit gate needs to be processed (which
-			should never happen due to is_available).
+			Exception: If a gate acting on more than 5 qubits needs to be processed
+				(which should never happen due to is_available) or if the size of
+				the gate matrix does not match the number of qubits.
 		"""
 		#print(cmd)
+		if cmd.gate == Allocate:
+			self._lazy_qubits.add(cmd.qubits[0][0].id)
+			return
+		if not (cmd.gate == Measure or cmd.gate == Deallocate):
+			if self._acts_trivially(cmd):
+				return
+			self._materialize([qb.id for qr in cmd.qubits for qb in qr])
 		if cmd.gate == Measure:
 			assert(get_control_count(cmd) == 0)
-			ids = [qb.id for qr in cmd.qubits for qb in qr]
-			out = self._simulator.measure_qubits(ids)
-			i = 0
+			ids = [qb.id for qr in cmd.qubits for qb in qr
+			       if qb.id not in self._lazy_qubits]
+			out = dict(zip(ids, self._simulator.measure_qubits(ids)))
 			for qr in cmd.qubits:
 				for qb in qr:
-					self.main_engine.set_measurement_result(qb, out[i])
-					i += 1
-		elif cmd.gate == Allocate:
-			ID = cmd.qubits[0][0].id
-			self._simulator.allocate_qubit(ID)
+					# lazy qubits are in |0>
+					self.main_engine.set_measurement_result(qb,
+					                                        out.get(qb.id, False))
 		elif cmd.gate == Deallocate:
 			ID = cmd.qubits[0][0].id
-			self._simulator.deallocate_qubit(ID)
+			if ID in self._lazy_qubits:
+				self._lazy_qubits.remove(ID)
+			else:
+				self._simulator.deallocate_qubit(ID)
 		elif isinstance(cmd.gate, BasicMathGate):
-			qubitids = []
-			for qr in cmd.qubits:
-				qubitids.append([])
-				for qb in qr:
-					qubitids[-1].append(qb.id)
-			self._simulator.emulate_math(cmd.gate.get_math_function(cmd.qubits),
-			                             qubitids, [qb.id for
-			                                        qb in cmd.control_qubits])
-		elif len(cmd.gate.matrix) == 2:
+			# the arithmetic gates of libs.math are emulated natively (without
+			# calling back into Python for every amplitude)
+			from projectq.libs.math import (AddConstant,
+			                                AddConstantModN,
+			                                MultiplyByConstantModN)
+			ids = [qb.id for qr in cmd.qubits for qb in qr]
+			ctrlids = [qb.id for qb in cmd.control_qubits]
+			if isinstance(cmd.gate, AddConstant):
+				self._simulator.emulate_math_add_constant(cmd.gate.a, ids, ctrlids)
+			elif isinstance(cmd.gate, AddConstantModN):
+				self._simulator.emulate_math_add_constant_modN(cmd.gate.a,
+				                                               cmd.gate.N, ids,
+				                                               ctrlids)
+			elif isinstance(cmd.gate, MultiplyByConstantModN):
+				self._simulator.emulate_math_multiply_by_constant_modN(
+				    cmd.gate.a, cmd.gate.N, ids, ctrlids)
+			else:
+				math_fun = cmd.gate.get_math_function_vectorized(cmd.qubits)
+				if math_fun is not None:
+					table = _math_table(math_fun, [len(qr) for qr in cmd.qubits])
+					self._simulator.emulate_math_table(table, ids, ctrlids)
+				else:
+					qubitids = []
+					for qr in cmd.qubits:
+						qubitids.append([])
+						for qb in qr:
+							qubitids[-1].append(qb.id)
+					self._simulator.emulate_math(
+					    cmd.gate.get_math_function(cmd.qubits), qubitids, ctrlids)
+		elif cmd.gate == Swap and get_control_count(cmd) == 0:
+			# relabel the qubits instead of moving amplitudes
+			self._simulator.swap_qubits(cmd.qubits[0][0].id, cmd.qubits[1][0].id)
+		elif cmd.gate == NOT or cmd.gate == Swap:
+			# classical reversible gates only move amplitudes around
+			ids = [qb.id for qr in cmd.qubits for qb in qr]
+			perm = [column.index(1) for column in cmd.gate.matrix.T.tolist()]
+			self._simulator.apply_controlled_permutation(perm, ids,
+			                                             [qb.id for qb in
+			                                             cmd.control_qubits])
+			if not self._gate_fusion:
+				self._simulator.run()
+		elif len(cmd.gate.matrix) <= 2 ** 5:
 			matrix = cmd.gate.matrix
-			self._simulator.apply_controlled_gate(matrix.tolist(),
-			                                      [cmd.qubits[0][0].id],
+			ids = [qb.id for qr in cmd.qubits for qb in qr]
+			if not 2 ** len(ids) == len(matrix):
+				raise Exception("Simulator: Error applying {} gate: {}-qubit gate "
+				                "applied to {} qubits.".format(
+				                    str(cmd.gate), int(math.log(len(matrix), 2)),
+				                    len(ids)))
+			self._simulator.apply_controlled_gate(matrix.tolist(), ids,
 			                                      [qb.id for qb in
 			                                      cmd.control_qubits])
 			if not self._gate_fusion:
 				self._simulator.run()
 		else:
-			raise Exception("This simulator only supports controlled single-qubit "
-			                "gates!\nPlease add an auto-replacer engine to your "
-			                "list of compiler engines.")
+			raise Exception("This simulator only supports controlled k-qubit "
+			                "gates with k < 6!\nPlease add an auto-replacer engine "
+			                "to your list of compiler engines.")
 	
 	def receive(self, command_list):
 		"""
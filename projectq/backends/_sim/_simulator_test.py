@@ -15,15 +15,27 @@ Tests for projectq.backends._sim._simulator.py, using both the Python
 and the C++ simulator as backends.
 """
 
+import math
+
+import numpy
 import pytest
 
 from projectq import MainEngine
-from projectq.cengines import DummyEngine
+from projectq.cengines import DummyEngine, NotYetMeasuredError
 from projectq.ops import (H,
                           X,
                           CNOT,
                           Toffoli,
                           Measure,
+                          Rx,
+                          Ry,
+                          Rz,
+                          Z,
+                          Swap,
+                          R,
+                          Ph,
+                          S,
+                          T,
                           BasicGate,
                           BasicMathGate)
 from projectq.meta import Control
@@ -69,6 +81,17 @@ class Mock2QubitGate(BasicGate):
 			return [[0,1,0,0],[1,0,0,0],[0,0,1,0],[0,0,0,1]]
 
 
+class Mock6QubitGate(BasicGate):
+		def __init__(self):
+			BasicGate.__init__(self)
+			self.cnt = 0
+		
+		@property
+		def matrix(self):
+			self.cnt += 1
+			return numpy.eye(2 ** 6)
+
+
 class MockNoMatrixGate(BasicGate):
 		def __init__(self):
 			BasicGate.__init__(self)
@@ -100,6 +123,10 @@ def test_simulator_is_available(sim):
 	assert new_cmd.gate.cnt == 1
 	
 	new_cmd.gate = Mock2QubitGate()
+	assert sim.is_available(new_cmd)
+	assert new_cmd.gate.cnt == 1
+	
+	new_cmd.gate = Mock6QubitGate()
 	assert not sim.is_available(new_cmd)
 	assert new_cmd.gate.cnt == 1
 	
@@ -111,7 +138,7 @@ def test_simulator_is_available(sim):
 	qubit1 = eng.allocate_qubit()
 	qubit2 = eng.allocate_qubit()
 	with pytest.raises(Exception):
-		Mock2QubitGate() | (qubit1, qubit2)
+		Mock2QubitGate() | qubit1
 
 
 def test_simulator_cheat(sim):
@@ -139,6 +166,29 @@ def test_simulator_cheat(sim):
 	assert len(sim.cheat()[1]) == 1
 
 
+def test_simulator_cheat_zero_copy(sim):
+	eng = MainEngine(sim, [])
+	qubit = eng.allocate_qubit()
+	eng.flush()
+	state = sim.cheat()[1]
+	assert isinstance(state, numpy.ndarray)
+	assert 1. == pytest.approx(abs(state[0]))
+	# the state vector is read-only by default
+	with pytest.raises(ValueError):
+		state[0] = 0.
+	# the array aliases the state vector of the simulator
+	X | qubit
+	eng.flush()
+	assert 0. == pytest.approx(abs(state[0]))
+	assert 1. == pytest.approx(abs(state[1]))
+	# modifications of a writable view are seen by the simulator
+	state = sim.cheat(writable=True)[1]
+	state[0], state[1] = state[1], state[0]
+	assert 1. == pytest.approx(abs(sim.cheat()[1][0]))
+	Measure | qubit
+	assert not int(qubit)
+
+
 def test_simulator_functional_measurement(sim):
 	eng = MainEngine(sim, [])
 	qubits = eng.allocate_qureg(5)
@@ -262,3 +312,967 @@ def test_simulator_functional_entangle(sim):
 		assert 0. == pytest.approx(abs(sim.cheat()[1][i]))
 	
 	Measure | qubits
+
+
+def _reference_controlled_gate(state, m, positions, ctrlpos):
+	"""
+	Apply the matrix m to the qubits at the bit-locations in positions (bit l of
+	the matrix index corresponds to positions[l]), conditioned on the bits in
+	ctrlpos being 1.
+	"""
+	mask = sum(1 << c for c in ctrlpos)
+	targetmask = sum(1 << p for p in positions)
+	idx = numpy.arange(len(state))
+	base = idx[((idx & mask) == mask) & ((idx & targetmask) == 0)]
+	offsets = [sum(((l >> i) & 1) << p for i, p in enumerate(positions))
+	           for l in range(len(m))]
+	block = base[:, None] | numpy.array(offsets)[None, :]
+	new_state = numpy.array(state)
+	new_state[block] = numpy.dot(new_state[block], numpy.array(m).T)
+	return new_state
+
+
+def test_simulator_controlled_gates_state(sim):
+	eng = MainEngine(sim, [])
+	qubits = eng.allocate_qureg(5)
+	for qb in qubits:
+		H | qb
+	eng.flush()
+	expected = numpy.array(sim.cheat()[1])
+	mapping = sim.cheat()[0]
+	
+	gates = [(Rx(0.3), 1, [0, 2]),
+	         (Ry(1.1), 4, []),
+	         (Rz(2.7), 0, [4]),
+	         (Rx(0.9), 3, [0, 1, 2]),
+	         (Ry(0.4), 2, [3])]
+	for gate, target, ctrls in gates:
+		with Control(eng, [qubits[c] for c in ctrls]):
+			gate | qubits[target]
+		expected = _reference_controlled_gate(
+		    expected, numpy.array(gate.matrix), [mapping[qubits[target].id]],
+		    [mapping[qubits[c].id] for c in ctrls])
+	eng.flush()
+	assert numpy.allclose(numpy.array(sim.cheat()[1]), expected)
+	
+	Measure | qubits
+	state = numpy.array(sim.cheat()[1])
+	assert 1. == pytest.approx(numpy.vdot(state, state).real)
+	assert 1. == pytest.approx(max(abs(state)))
+
+
+class MockUnitaryGate(BasicGate):
+	def __init__(self, num_qubits, seed):
+		BasicGate.__init__(self)
+		rng = numpy.random.RandomState(seed)
+		dim = 2 ** num_qubits
+		a = rng.randn(dim, dim) + 1j * rng.randn(dim, dim)
+		self._matrix = numpy.matrix(numpy.linalg.qr(a)[0])
+	
+	@property
+	def matrix(self):
+		return self._matrix
+
+
+@pytest.mark.parametrize("num_qubits", [2, 3, 4, 5])
+def test_simulator_kqubit_gate(sim, num_qubits):
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(num_qubits + 1)
+	for i, qb in enumerate(qureg):
+		Ry(0.3 * (i + 1)) | qb
+	eng.flush()
+	expected = numpy.array(sim.cheat()[1])
+	mapping = sim.cheat()[0]
+	
+	# apply the gate to the qubits in scrambled order, controlled on qureg[1]
+	targets = [qureg[i] for i in [2, 0] + list(range(3, num_qubits + 1))]
+	for ctrls, gate in [([], MockUnitaryGate(num_qubits, 1)),
+	                    ([qureg[1]], MockUnitaryGate(num_qubits, 2))]:
+		with Control(eng, ctrls):
+			gate | tuple([qb] for qb in targets)
+		expected = _reference_controlled_gate(
+		    expected, gate.matrix, [mapping[qb.id] for qb in targets],
+		    [mapping[qb.id] for qb in ctrls])
+	eng.flush()
+	assert numpy.allclose(numpy.array(sim.cheat()[1]), expected)
+	
+	with pytest.raises(Exception):
+		MockUnitaryGate(num_qubits, 3) | qureg
+	Measure | qureg
+
+
+def test_simulator_swap(sim):
+	eng = MainEngine(sim, [])
+	qubit1 = eng.allocate_qubit()
+	qubit2 = eng.allocate_qubit()
+	qubit3 = eng.allocate_qubit()
+	X | qubit1
+	Ry(0.5) | qubit3
+	eng.flush()
+	mapping, state = sim.cheat()
+	mapping, state = dict(mapping), numpy.array(state)
+	
+	# an uncontrolled swap only exchanges the bit-locations of the qubits
+	Swap | (qubit1, qubit2)
+	eng.flush()
+	assert sim.cheat()[0][qubit1[0].id] == mapping[qubit2[0].id]
+	assert sim.cheat()[0][qubit2[0].id] == mapping[qubit1[0].id]
+	assert numpy.allclose(numpy.array(sim.cheat()[1]), state)
+	
+	# gates and measurements act on the relabeled qubits
+	X | qubit1
+	Swap | (qubit2, qubit3)
+	CNOT | (qubit3, qubit1)
+	Ry(-0.5) | qubit2
+	Measure | (qubit1 + qubit2 + qubit3)
+	assert int(qubit1) == 0
+	assert int(qubit2) == 0
+	assert int(qubit3) == 1
+	state = numpy.array(sim.cheat()[1])
+	assert 1. == pytest.approx(abs(state[1 << sim.cheat()[0][qubit3[0].id]]))
+
+
+def test_simulator_diagonal_gates(sim):
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(14)
+	for i, qb in enumerate(qureg):
+		Rx(0.4 * (i + 1)) | qb
+	eng.flush()
+	expected = numpy.array(sim.cheat()[1])
+	mapping = sim.cheat()[0]
+	
+	# controlled phase-shifts as in a QFT, interleaved with a few dense gates
+	gates = []
+	for i in range(len(qureg)):
+		gates.append((H, i, []))
+		for j in range(i + 1, len(qureg)):
+			gates.append((R(math.pi / (1 << (j - i))), i, [j]))
+	gates += [(Rz(0.5), 3, []), (S, 4, [1, 2]), (T, 0, []), (Ph(0.2), 5, [7]),
+	          (Rx(0.7), 2, []), (R(0.1), 11, list(range(11))),
+	          (R(0.3), 13, [12])]
+	for gate, target, ctrls in gates:
+		with Control(eng, [qureg[c] for c in ctrls]):
+			gate | qureg[target]
+		expected = _reference_controlled_gate(
+		    expected, numpy.array(gate.matrix), [mapping[qureg[target].id]],
+		    [mapping[qureg[c].id] for c in ctrls])
+	eng.flush()
+	assert numpy.allclose(numpy.array(sim.cheat()[1]), expected)
+	
+	# cyclic permutation (increment modulo 8) on 3 qubits, controlled on qureg[0]
+	perm = [1, 2, 3, 4, 5, 6, 7, 0]
+	matrix = numpy.zeros((8, 8))
+	for l in range(8):
+		matrix[perm[l], l] = 1.
+	targets = [qureg[4], qureg[1], qureg[5]]
+	sim._simulator.apply_controlled_permutation(perm, [qb.id for qb in targets],
+	                                            [qureg[0].id])
+	sim._simulator.run()
+	expected = _reference_controlled_gate(expected, matrix,
+	                                      [mapping[qb.id] for qb in targets],
+	                                      [mapping[qureg[0].id]])
+	assert numpy.allclose(numpy.array(sim.cheat()[1]), expected)
+	Measure | qureg
+
+
+def test_simulator_permutation_gates(sim):
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(6)
+	for i, qb in enumerate(qureg):
+		Rx(0.4 * (i + 1)) | qb
+	eng.flush()
+	expected = numpy.array(sim.cheat()[1])
+	mapping = sim.cheat()[0]
+	
+	gates = [(X, [0], []), (X, [3], [1]), (X, [5], [2, 4]), (Ry(0.3), [1], []),
+	         (X, [1], [0, 2, 3, 4, 5]), (Swap, [4, 2], [1]), (Swap, [0, 5], [3]),
+	         (X, [2], [1]), (Swap, [1, 3], [0, 4])]
+	for gate, targets, ctrls in gates:
+		with Control(eng, [qureg[c] for c in ctrls]):
+			gate | tuple([qureg[t]] for t in targets)
+		expected = _reference_controlled_gate(
+		    expected, numpy.array(gate.matrix), [mapping[qureg[t].id]
+		                                         for t in targets],
+		    [mapping[qureg[c].id] for c in ctrls])
+	eng.flush()
+	assert numpy.allclose(numpy.array(sim.cheat()[1]), expected)
+	
+	# cyclic permutation (increment modulo 8) on 3 qubits, controlled on qureg[0]
+	perm = [1, 2, 3, 4, 5, 6, 7, 0]
+	matrix = numpy.zeros((8, 8))
+	for l in range(8):
+		matrix[perm[l], l] = 1.
+	targets = [qureg[4], qureg[1], qureg[5]]
+	sim._simulator.apply_controlled_permutation(perm, [qb.id for qb in targets],
+	                                            [qureg[0].id])
+	sim._simulator.run()
+	expected = _reference_controlled_gate(expected, matrix,
+	                                      [mapping[qb.id] for qb in targets],
+	                                      [mapping[qureg[0].id]])
+	assert numpy.allclose(numpy.array(sim.cheat()[1]), expected)
+	Measure | qureg
+
+
+@pytest.mark.parametrize("backend", ["_cppsim", "_pysim"])
+def test_simulator_single_precision(backend):
+	module = __import__("projectq.backends._sim." + backend,
+	                    fromlist=["SimulatorSingle"])
+	sim = Simulator(gate_fusion=True)
+	sim._simulator = module.Simulator(1)
+	sim_single = Simulator(gate_fusion=True, precision='single')
+	sim_single._simulator = module.SimulatorSingle(1)
+
+	states = []
+	for s in [sim, sim_single]:
+		eng = MainEngine(s, [])
+		qureg = eng.allocate_qureg(12)
+		for i, qb in enumerate(qureg):
+			Rx(0.3 * (i + 1)) | qb
+		for i in range(len(qureg) - 1):
+			CNOT | (qureg[i], qureg[i + 1])
+			Rz(0.1 * i) | qureg[i]
+			with Control(eng, qureg[i + 1]):
+				Ry(0.2 * i) | qureg[(i + 5) % len(qureg)]
+		Swap | (qureg[0], qureg[7])
+		with Control(eng, qureg[3]):
+			Swap | (qureg[1], qureg[10])
+		ancilla = eng.allocate_qubit()
+		H | ancilla
+		H | ancilla
+		del ancilla
+		eng.flush()
+		mapping, state = s.cheat()
+		order = numpy.argsort([mapping[qb.id] for qb in qureg])
+		states.append(numpy.array(state).reshape([2] * len(qureg))
+		              .transpose(order[::-1]))
+		Measure | qureg
+	assert states[0].dtype == numpy.complex128
+	assert states[1].dtype == numpy.complex64
+	assert numpy.allclose(states[0], states[1], atol=1.e-5)
+
+	with pytest.raises(ValueError):
+		Simulator(precision='half')
+
+
+@pytest.mark.parametrize("backend", ["_cppsim", "_pysim"])
+def test_simulator_storage_dir(backend, tmpdir):
+	module = __import__("projectq.backends._sim." + backend,
+	                    fromlist=["Simulator"])
+	sim = Simulator(gate_fusion=True)
+	sim._simulator = module.Simulator(1)
+	sim_mmap = Simulator(gate_fusion=True, storage_dir=str(tmpdir))
+	sim_mmap._simulator = module.Simulator(1, str(tmpdir))
+
+	states = []
+	for s in [sim, sim_mmap]:
+		eng = MainEngine(s, [])
+		qureg = eng.allocate_qureg(10)
+		for i, qb in enumerate(qureg):
+			Rx(0.3 * (i + 1)) | qb
+		for i in range(len(qureg) - 1):
+			CNOT | (qureg[i], qureg[i + 1])
+			Rz(0.1 * i) | qureg[i]
+		ancilla = eng.allocate_qubit()
+		X | ancilla
+		Measure | ancilla
+		del ancilla
+		eng.flush()
+		states.append(numpy.array(s.cheat()[1]))
+		Measure | qureg
+	assert numpy.allclose(states[0], states[1])
+	# the (deleted) files do not show up in the storage directory
+	assert len(tmpdir.listdir()) == 0
+
+	with pytest.raises(Exception):
+		module.Simulator(1, str(tmpdir.join("missing")))
+
+
+def test_simulator_allocate_qureg(sim):
+	class CountingBackend(object):
+		def __init__(self, backend):
+			self.backend = backend
+			self.allocations = []
+		
+		def allocate_qureg(self, ids):
+			self.allocations.append(list(ids))
+			self.backend.allocate_qureg(ids)
+		
+		def __getattr__(self, name):
+			return getattr(self.backend, name)
+	
+	backend = sim._simulator
+	sim._simulator = CountingBackend(backend)
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(6)
+	qubit = eng.allocate_qubit()
+	# allocations are deferred until the qubits are needed
+	assert sim._simulator.allocations == []
+	X | qureg[2]
+	ancilla = eng.allocate_qubit()
+	eng.flush()
+	assert sim._simulator.allocations == [[qureg[2].id]]
+	mapping, state = sim.cheat()
+	assert sim._simulator.allocations[1] == [qb.id for qb in
+	                                         qureg[:2] + qureg[3:] + qubit +
+	                                         ancilla]
+	assert len(mapping) == 8
+	assert abs(state[1 << mapping[qureg[2].id]]) == pytest.approx(1.)
+	with pytest.raises(RuntimeError):
+		backend.allocate_qureg([qubit[0].id])
+	with pytest.raises(RuntimeError):
+		backend.allocate_qureg([100, 100])
+	backend.allocate_qureg([])
+	assert len(sim.cheat()[0]) == 8
+	Measure | qureg + qubit + ancilla
+
+
+def test_simulator_lazy_qubits(sim):
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(4)
+	H | qureg[0]
+	# controls in |0> and gates which map |0> to itself do not touch the
+	# state vector
+	CNOT | (qureg[1], qureg[0])
+	with Control(eng, qureg[2]):
+		BasicMathGate(lambda x: (x + 1,)) | qureg[3]
+	Z | qureg[1]
+	Swap | (qureg[2], qureg[3])
+	Measure | qureg[3]
+	eng.flush()
+	assert not bool(qureg[3])
+	assert sim._lazy_qubits == set([qureg[1].id, qureg[2].id, qureg[3].id])
+	# untouched qubits are dropped without a sweep over the state vector
+	qureg[3].__del__()
+	assert sim._lazy_qubits == set([qureg[1].id, qureg[2].id])
+	# the first non-trivial gate adds the qubits to the state vector
+	CNOT | (qureg[0], qureg[1])
+	eng.flush()
+	assert sim._lazy_qubits == set([qureg[2].id])
+	mapping, state = sim.cheat()
+	assert sim._lazy_qubits == set()
+	assert len(mapping) == 3
+	assert abs(state[0]) == pytest.approx(math.sqrt(.5))
+	index = (1 << mapping[qureg[0].id]) | (1 << mapping[qureg[1].id])
+	assert abs(state[index]) == pytest.approx(math.sqrt(.5))
+	Measure | qureg[:3]
+	assert bool(qureg[0]) == bool(qureg[1])
+
+
+def test_simulator_lazy_qubits_keep_allocation_order(sim):
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(5)
+	X | qureg[3]
+	H | qureg[1]
+	eng.flush()
+	mapping, state = sim.cheat()
+	assert [mapping[qb.id] for qb in qureg] == list(range(5))
+	assert abs(state[8]) == pytest.approx(math.sqrt(.5))
+	assert abs(state[10]) == pytest.approx(math.sqrt(.5))
+	Measure | qureg
+
+
+def test_simulator_deallocate_reuses_memory(sim):
+	def product_state(mapping, angles):
+		state = numpy.ones(1)
+		for qb_id in sorted(mapping, key=mapping.get, reverse=True):
+			theta = angles[qb_id]
+			state = numpy.kron(state, [math.cos(theta / 2), math.sin(theta / 2)])
+		return state
+	
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(5)
+	angles = dict()
+	for i, qb in enumerate(qureg):
+		angles[qb.id] = 0.4 * (i + 1)
+		Ry(angles[qb.id]) | qb
+	eng.flush()
+	# deallocate qubits at the top, in the middle, and at the bottom (in
+	# state 1 and 0)
+	for k, value in [(4, 1), (2, 0), (0, 1)]:
+		Ry(-angles[qureg[k].id]) | qureg[k]
+		if value:
+			X | qureg[k]
+		del angles[qureg[k].id]
+		qureg[k].__del__()
+		eng.flush()
+		mapping, state = sim.cheat()
+		# the remaining qubits keep their order
+		assert sorted(mapping, key=mapping.get) == sorted(angles)
+		assert numpy.allclose(state, product_state(mapping, angles))
+	# newly allocated qubits are |0> (also when memory is reused)
+	qubit = eng.allocate_qubit()
+	Ry(0.5) | qubit
+	angles[qubit[0].id] = 0.5
+	eng.flush()
+	mapping, state = sim.cheat()
+	assert numpy.allclose(state, product_state(mapping, angles))
+	Measure | [qureg[1], qureg[3]] + qubit
+
+
+@pytest.mark.parametrize("backend", ["_cppsim", "_pysim"])
+def test_simulator_qubit_reordering(backend):
+	module = __import__("projectq.backends._sim." + backend,
+	                    fromlist=["Simulator"])
+	sim = Simulator()
+	sim._simulator = module.Simulator(1)
+	sim_reorder = Simulator(qubit_reordering=2)
+	sim_reorder._simulator = module.Simulator(1)
+	sim_reorder._simulator.set_qubit_reordering(2)
+	
+	states = []
+	for s in [sim, sim_reorder]:
+		eng = MainEngine(s, [])
+		qureg = eng.allocate_qureg(7)
+		for i, qb in enumerate(qureg):
+			Ry(0.2 * (i + 1)) | qb
+		# repeated dense gates on the qubits at the highest bit-locations
+		for i in range(4):
+			H | qureg[6]
+			Rx(0.3 * i) | qureg[5]
+			CNOT | (qureg[6], qureg[5])
+			Rx(0.1) | qureg[i]
+		eng.flush()
+		mapping, state = s.cheat()
+		if s is sim_reorder and backend == "_cppsim":
+			assert mapping[qureg[6].id] < 2 and mapping[qureg[5].id] < 2
+		n = len(qureg)
+		axes = [n - 1 - mapping[qb.id] for qb in reversed(qureg)]
+		states.append(numpy.array(state).reshape([2] * n).transpose(axes))
+		Measure | qureg
+	assert numpy.allclose(states[0], states[1])
+
+
+@pytest.mark.parametrize("backend", ["_cppsim", "_pysim"])
+def test_simulator_fusion_limits(backend):
+	module = __import__("projectq.backends._sim." + backend,
+	                    fromlist=["Simulator"])
+	simulator = module.Simulator(1)
+	for limits in [(0, 3), (3, 2), (2, 6)]:
+		with pytest.raises(ValueError):
+			simulator.set_fusion_limits(*limits)
+	simulator.set_fusion_limits(2, 3)
+	assert tuple(simulator.get_fusion_limits()) == (2, 3)
+	fusion_min, fusion_max = simulator.autotune_fusion(10)
+	assert 1 <= fusion_min <= fusion_max <= 5
+	assert tuple(simulator.get_fusion_limits()) == (fusion_min, fusion_max)
+	
+	states = []
+	for limits in [(1, 1), (2, 3), (4, 5), (5, 5), (None, 'auto')]:
+		sim = Simulator(gate_fusion=True, fusion_min=limits[0],
+		                fusion_max=limits[1])
+		sim._simulator = module.Simulator(1)
+		if limits[1] == 'auto':
+			sim._simulator.autotune_fusion(10)
+		else:
+			sim._simulator.set_fusion_limits(*limits)
+		eng = MainEngine(sim, [])
+		qureg = eng.allocate_qureg(6)
+		for i, qb in enumerate(qureg):
+			Rx(0.3 * (i + 1)) | qb
+		for i in range(5):
+			CNOT | (qureg[i], qureg[i + 1])
+			Ry(0.2 * i) | qureg[5 - i]
+			with Control(eng, qureg[(i + 2) % 6]):
+				H | qureg[i]
+			Toffoli | (qureg[i], qureg[(i + 3) % 6], qureg[(i + 4) % 6])
+		eng.flush()
+		mapping, state = sim.cheat()
+		axes = [5 - mapping[qb.id] for qb in reversed(qureg)]
+		states.append(numpy.array(state).reshape([2] * 6).transpose(axes))
+		Measure | qureg
+	for state in states[1:]:
+		assert numpy.allclose(state, states[0])
+
+
+@pytest.mark.parametrize("window", [1, 3, 16])
+def test_simulator_fusion_window(window):
+	from projectq.backends._sim._cppsim import Simulator as CppSim
+	states = []
+	for fusion_window in [0, window]:
+		sim = Simulator(gate_fusion=True, fusion_window=fusion_window)
+		sim._simulator = CppSim(1)
+		sim._simulator.set_fusion_limits(2, 3)
+		sim._simulator.set_fusion_window(fusion_window)
+		eng = MainEngine(sim, [])
+		qureg = eng.allocate_qureg(6)
+		# QFT-like and Trotter-like sequences with diagonal and permutation
+		# gates in between
+		for i, qb in enumerate(qureg):
+			H | qb
+			for j in range(i + 1, 6):
+				with Control(eng, qureg[j]):
+					R(math.pi / 2 ** (j - i)) | qb
+		for step in range(3):
+			for i in range(5):
+				CNOT | (qureg[i], qureg[i + 1])
+				Rz(0.1 * (step + i)) | qureg[i + 1]
+				CNOT | (qureg[i], qureg[i + 1])
+			for i, qb in enumerate(qureg):
+				Rx(0.2 * (step + 1)) | qb
+			Swap | (qureg[step], qureg[5 - step])
+			Toffoli | (qureg[0], qureg[2], qureg[4])
+		eng.flush()
+		mapping, state = sim.cheat()
+		axes = [5 - mapping[qb.id] for qb in reversed(qureg)]
+		states.append(numpy.array(state).reshape([2] * 6).transpose(axes))
+		Measure | qureg
+	assert numpy.allclose(states[0], states[1])
+
+
+def test_simulator_native_math_gates(sim, monkeypatch):
+	from projectq.libs.math import (AddConstant,
+	                                AddConstantModN,
+	                                MultiplyByConstantModN)
+	
+	def no_python_function(self, qubits):
+		raise AssertionError("The gate should be emulated natively.")
+	
+	monkeypatch.setattr(BasicMathGate, "get_math_function", no_python_function)
+	
+	def value(qureg):
+		mapping, state = sim.cheat()
+		index = int(numpy.argmax(numpy.abs(state)))
+		assert abs(state[index]) == pytest.approx(1.)
+		return sum(((index >> mapping[qb.id]) & 1) << k
+		           for k, qb in enumerate(qureg))
+	
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(5)
+	ctrl = eng.allocate_qubit()
+	X | qureg[1]
+	AddConstant(3) | qureg
+	assert value(qureg) == 5
+	AddConstant(-7) | qureg
+	assert value(qureg) == 30
+	X | qureg[4]
+	# values x >= N are left unchanged
+	AddConstantModN(10, 13) | qureg
+	assert value(qureg) == 14
+	X | qureg[3]
+	AddConstantModN(10, 13) | qureg
+	assert value(qureg) == 3
+	MultiplyByConstantModN(4, 13) | qureg
+	assert value(qureg) == 12
+	# not invertible modulo N
+	MultiplyByConstantModN(4, 14) | qureg
+	assert value(qureg) == 6
+	with Control(eng, ctrl):
+		AddConstant(1) | qureg
+	assert value(qureg) == 6
+	X | ctrl
+	with Control(eng, ctrl):
+		MultiplyByConstantModN(4, 13) | qureg
+	assert value(qureg) == 11
+	# superpositions are permuted
+	H | qureg[0]
+	AddConstantModN(2, 13) | qureg
+	eng.flush()
+	mapping, state = sim.cheat()
+	ctrl_bit = 1 << mapping[ctrl[0].id]
+	assert abs(state[ctrl_bit | 12]) == pytest.approx(math.sqrt(.5))
+	assert abs(state[ctrl_bit]) == pytest.approx(math.sqrt(.5))
+	Measure | qureg + ctrl
+
+
+def test_simulator_native_math_gates_match_math_function(sim):
+	from projectq.libs.math import (AddConstant,
+	                                AddConstantModN,
+	                                MultiplyByConstantModN)
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(4)
+	eng.flush()
+	rng = numpy.random.RandomState(7)
+	for gate in [AddConstant(3), AddConstant(-7), AddConstantModN(10, 13),
+	             MultiplyByConstantModN(4, 13), MultiplyByConstantModN(4, 14)]:
+		state = rng.randn(16) + 1j * rng.randn(16)
+		state /= numpy.linalg.norm(state)
+		sim.set_wavefunction(state, qureg)
+		gate | qureg
+		eng.flush()
+		# compare to the (Python) definition of the gate, including x >= N
+		f = gate.get_math_function([qureg])
+		expected = numpy.zeros(16, dtype=complex)
+		for x in range(16):
+			expected[f([x])[0] % 16] += state[x]
+		mapping, result = sim.cheat()
+		order = [sum(((x >> k) & 1) << mapping[qb.id]
+		             for k, qb in enumerate(qureg)) for x in range(16)]
+		assert numpy.allclose(numpy.array(result)[order], expected)
+	Measure | qureg
+
+
+def test_simulator_vectorized_math_gates(sim, monkeypatch):
+	def no_python_function(self, qubits):
+		raise AssertionError("The vectorized function should be used.")
+	
+	monkeypatch.setattr(BasicMathGate, "get_math_function", no_python_function)
+	eng = MainEngine(sim, [])
+	qureg1 = eng.allocate_qureg(3)
+	qureg2 = eng.allocate_qureg(3)
+	ctrl = eng.allocate_qubit()
+	for qb in qureg1:
+		H | qb
+	X | qureg2[0]
+	# (a, b) -> (a, a * b mod 8) is not a permutation
+	multiply = BasicMathGate(lambda a, b: (a, a * b % 8), vectorized=True)
+	add = BasicMathGate(lambda a, b: (a, a + b), vectorized=True)
+	multiply | (qureg1, qureg2)
+	with Control(eng, ctrl):
+		add | (qureg1, qureg2)
+	X | ctrl
+	with Control(eng, ctrl):
+		add | (qureg1, qureg2)
+	eng.flush()
+	mapping, state = sim.cheat()
+	expected = numpy.zeros(len(state), dtype=complex)
+	for a in range(8):
+		index = 1 << mapping[ctrl[0].id]
+		for k in range(3):
+			index |= ((a >> k) & 1) << mapping[qureg1[k].id]
+			index |= (((2 * a) % 8 >> k) & 1) << mapping[qureg2[k].id]
+		expected[index] = 1. / math.sqrt(8)
+	assert numpy.allclose(state, expected)
+	Measure | qureg1 + qureg2 + ctrl
+	
+	# the vectorized function is requested once per gate
+	calls = []
+	
+	class CountingGate(BasicMathGate):
+		def get_math_function_vectorized(self, qubits):
+			calls.append(qubits)
+			return lambda x: [x[0] ^ 1]
+	
+	CountingGate(lambda a: (a ^ 1,)) | qureg1
+	eng.flush()
+	assert len(calls) == 1
+	Measure | qureg1
+
+
+def test_simulator_math_emulation_skips_zero_amplitudes(sim):
+	calls = []
+	
+	def add_one(x):
+		calls.append(x)
+		return ((x + 1) % 1024,)
+	
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(10)
+	ctrl = eng.allocate_qubit()
+	H | qureg[0]
+	H | qureg[9]
+	X | ctrl
+	with Control(eng, ctrl):
+		BasicMathGate(add_one) | qureg
+	eng.flush()
+	# the function is only evaluated on the 4 basis states in the support
+	assert sorted(calls) == [0, 1, 512, 513]
+	mapping, state = sim.cheat()
+	for value in [1, 2, 513, 514]:
+		index = 1 << mapping[ctrl[0].id]
+		for k in range(10):
+			index |= ((value >> k) & 1) << mapping[qureg[k].id]
+		assert abs(state[index]) == pytest.approx(.5)
+	Measure | qureg + ctrl
+
+
+def test_simulator_math_table_chunks():
+	from projectq.backends._sim._simulator import _math_table
+	calls = []
+	
+	def math_fun(x):
+		calls.append(len(x[0]))
+		return (x[0] ^ x[1], x[1] + 5)
+	
+	table = _math_table(math_fun, [2, 3], chunk_size=8)
+	assert calls == [8, 8, 8, 8]
+	for key in range(32):
+		a, b = key & 3, key >> 2
+		assert table[key] == ((a ^ b) & 3) | (((b + 5) % 8) << 2)
+
+
+@pytest.mark.parametrize("num_measured", [1, 6])
+def test_simulator_measure_qubits_large_state(sim, num_measured):
+	# the state vector consists of several blocks (of 2^16 entries)
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(18)
+	H | qureg[0]
+	for qb in qureg[1:]:
+		CNOT | (qureg[0], qb)
+	eng.flush()
+	Measure | qureg[-num_measured:]
+	values = [int(qb) for qb in qureg[-num_measured:]]
+	assert values == [values[0]] * num_measured
+	eng.flush()
+	mapping, state = sim.cheat()
+	assert abs(state[(1 << 18) - 1 if values[0] else 0]) == pytest.approx(1.)
+	assert numpy.vdot(state, state).real == pytest.approx(1.)
+	Measure | qureg
+
+
+@pytest.mark.parametrize("num_measured", [2, 5])
+def test_simulator_measure_qubits_deallocate(sim, num_measured):
+	backend = sim._simulator
+	backend.allocate_qureg(list(range(8)))
+	hadamard = [[1. / math.sqrt(2), 1. / math.sqrt(2)],
+	            [1. / math.sqrt(2), -1. / math.sqrt(2)]]
+	for ID in range(8):
+		backend.apply_controlled_gate(hadamard, [ID], [])
+	backend.apply_controlled_gate([[0, 1], [1, 0]], [7], [0])
+	backend.run()
+	ids = [7, 0, 3, 2, 5][:num_measured]
+	res = backend.measure_qubits(ids, True)
+	if num_measured >= 2:
+		assert res[0] == res[1]
+	qubit_ids, state = backend.cheat()
+	remaining = [ID for ID in range(8) if ID not in ids]
+	assert list(qubit_ids) == remaining
+	expected = numpy.ones(1 << len(remaining)) / math.sqrt(1 << len(remaining))
+	assert numpy.allclose(state, expected)
+
+
+def test_simulator_snapshot(sim):
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(3)
+	H | qureg[0]
+	CNOT | (qureg[0], qureg[1])
+	Measure | qureg[2]
+	ancilla = eng.allocate_qubit()
+	classical = eng.allocate_qubit()
+	X | classical
+	eng.flush()
+	snapshot = sim.snapshot()
+	
+	results = []
+	for _ in range(3):
+		# qubits allocated after the snapshot are in the state |0> after
+		# restoring it, and deallocated (classical) qubits are removed again
+		extra = eng.allocate_qubit()
+		X | extra
+		X | ancilla
+		classical[0].__del__()
+		Measure | qureg[0]
+		eng.flush()
+		results.append(int(qureg[0]))
+		
+		sim.restore(snapshot)
+		assert int(qureg[2]) == 0
+		with pytest.raises(NotYetMeasuredError):
+			int(qureg[0])
+		mapping, state = sim.cheat()
+		assert classical[0].id not in mapping
+		assert sorted(mapping) == sorted(qb.id for qb in qureg + ancilla + extra)
+		Measure | qureg[1:2] + ancilla + extra
+		eng.flush()
+		assert int(ancilla) == 0
+		assert int(extra) == 0
+		# the state of the random number generator is restored as well
+		assert int(qureg[1]) == results[0]
+		
+		sim.restore(snapshot)
+		extra[0].__del__()
+		classical = eng.allocate_qubit()
+	Measure | qureg + ancilla
+	
+	# qubits which are in a superposition in the snapshot but have been
+	# deallocated since are measured and removed
+	H | ancilla
+	CNOT | (ancilla, qureg[1])
+	eng.flush()
+	snapshot = sim.snapshot()
+	Measure | ancilla
+	ancilla[0].__del__()
+	eng.flush()
+	sim.restore(snapshot)
+	mapping, state = sim.cheat()
+	assert sorted(mapping) == sorted(qb.id for qb in qureg + classical)
+	assert len(state) == 2 ** len(mapping)
+	assert numpy.linalg.norm(state) == pytest.approx(1.)
+	Measure | qureg + classical
+
+
+def test_simulator_set_wavefunction(sim):
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(3)
+	eng.flush()
+	wavefunction = numpy.arange(8) + 1j * numpy.arange(8)[::-1]
+	wavefunction /= numpy.linalg.norm(wavefunction)
+	with pytest.raises(ValueError):
+		sim.set_wavefunction(wavefunction[:4], qureg)
+	# all qubits are required, also those which have not been used yet
+	with pytest.raises(RuntimeError):
+		sim.set_wavefunction(wavefunction[:4], qureg[:2])
+	with pytest.raises(RuntimeError):
+		sim.set_wavefunction(wavefunction[:4], qureg[:1] + qureg[:1])
+	# the ordering differs from the allocation order
+	ordering = [qureg[2], qureg[0], qureg[1]]
+	sim.set_wavefunction(wavefunction, ordering)
+	mapping, state = sim.cheat()
+	assert numpy.allclose(state[:8], wavefunction)
+	assert [mapping[qb.id] for qb in ordering] == [0, 1, 2]
+	# qureg has to contain all allocated qubits
+	ancilla = eng.allocate_qubit()
+	eng.flush()
+	with pytest.raises(RuntimeError):
+		sim.set_wavefunction(wavefunction, ordering)
+	X | ancilla
+	with pytest.raises(RuntimeError):
+		sim.set_wavefunction(wavefunction, ordering)
+	X | ancilla
+	
+	# post-select qureg[2] = 1 and qureg[0] = 0
+	sim.collapse_wavefunction([qureg[2], qureg[0]], [1, 0])
+	eng.flush()
+	mapping, state = sim.cheat()
+	expected = numpy.zeros(16, dtype=complex)
+	for i in [1, 5]:
+		expected[i] = wavefunction[i]
+	expected /= numpy.linalg.norm(expected)
+	assert numpy.allclose([state[sum(((i >> k) & 1) << mapping[qb.id]
+	                                 for k, qb in enumerate(ordering + ancilla))]
+	                       for i in range(16)], expected)
+	with pytest.raises(RuntimeError):
+		sim.collapse_wavefunction([qureg[0]], [1])
+	with pytest.raises(ValueError):
+		sim.collapse_wavefunction(qureg, [0])
+	Measure | qureg + ancilla
+	assert [int(qb) for qb in ordering] == [1, 0, int(qureg[1])]
+
+
+@pytest.mark.parametrize("precision", ["double", "single"])
+def test_simulator_collapse_wavefunction_low_probability(precision):
+	# all backends accept the same (small) probabilities
+	for backend in ["_cppsim", "_pysim"]:
+		module = __import__("projectq.backends._sim." + backend,
+		                    fromlist=["Simulator", "SimulatorSingle"])
+		sim = Simulator()
+		if precision == "double":
+			sim._simulator = module.Simulator(1)
+		else:
+			sim._simulator = module.SimulatorSingle(1)
+		eng = MainEngine(sim, [])
+		qubit = eng.allocate_qubit()
+		# probability 5e-5 of measuring 1
+		Ry(2 * math.asin(math.sqrt(5.e-5))) | qubit
+		eng.flush()
+		sim.collapse_wavefunction(qubit, [1])
+		assert numpy.allclose(numpy.abs(sim.cheat()[1]), [0, 1], atol=1.e-6)
+		X | qubit
+		eng.flush()
+		with pytest.raises(RuntimeError):
+			sim.collapse_wavefunction(qubit, [1])
+		Measure | qubit
+
+
+def test_simulator_checkpoint(sim, tmpdir):
+	path = str(tmpdir.join("state.ckpt"))
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(4)
+	ancilla = eng.allocate_qubit()
+	Ry(0.4) | qureg[0]
+	CNOT | (qureg[0], qureg[2])
+	Swap | (qureg[1], qureg[3])
+	X | qureg[1]
+	Measure | qureg[1]
+	eng.flush()
+	sim.save_checkpoint(path)
+	mapping, state = sim.cheat()
+	state = numpy.array(state)
+	
+	# resume in a new engine
+	new_sim = Simulator()
+	new_sim._simulator = type(sim._simulator)(1)
+	new_eng = MainEngine(new_sim, [])
+	new_qureg = new_sim.load_checkpoint(path)
+	assert [qb.id for qb in new_qureg] == [qb.id for qb in qureg + ancilla]
+	assert int(new_qureg[1]) == 1
+	new_mapping, new_state = new_sim.cheat()
+	assert new_mapping == mapping
+	assert numpy.allclose(new_state, state)
+	qubit = new_eng.allocate_qubit()
+	assert qubit[0].id > max(qb.id for qb in new_qureg)
+	with pytest.raises(RuntimeError):
+		new_sim.load_checkpoint(path)
+	CNOT | (new_qureg[0], qubit)
+	Measure | new_qureg + qubit
+	assert int(new_qureg[0]) == int(new_qureg[2]) == int(qubit)
+	Measure | qureg + ancilla
+	tmpdir.join("invalid.ckpt").write("no checkpoint")
+	with pytest.raises(ValueError):
+		sim._simulator.load_checkpoint(str(tmpdir.join("invalid.ckpt")))
+
+
+def test_simulator_sample(sim):
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(3)
+	ancilla = eng.allocate_qubit()
+	# qureg[0] is 1 with probability 1/4, qureg[1] is always 1
+	Ry(math.pi / 3) | qureg[0]
+	X | qureg[1]
+	H | ancilla
+	eng.flush()
+	state = numpy.array(sim.cheat()[1])
+	
+	samples = sim.sample(qureg, 20000)
+	assert isinstance(samples, numpy.ndarray)
+	assert len(samples) == 20000
+	assert set(samples.tolist()) <= set([2, 3])
+	assert numpy.mean(samples == 3) == pytest.approx(.25, abs=.02)
+	# the state is not collapsed
+	assert numpy.allclose(numpy.array(sim.cheat()[1]), state)
+	
+	samples = sim.sample([qureg[1], ancilla[0]], 20000)
+	assert set(samples.tolist()) <= set([1, 3])
+	assert numpy.mean(samples == 3) == pytest.approx(.5, abs=.02)
+	assert len(sim.sample(qureg, 0)) == 0
+	Measure | (qureg + ancilla)
+
+
+def test_simulator_expectation_value(sim):
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(4)
+	for i, qb in enumerate(qureg):
+		Rx(0.4 * (i + 1)) | qb
+	CNOT | (qureg[0], qureg[2])
+	Ry(0.7) | qureg[3]
+	eng.flush()
+	mapping, state = sim.cheat()
+	state = numpy.array(state)
+	
+	paulis = {'X': numpy.array([[0, 1], [1, 0]]),
+	          'Y': numpy.array([[0, -1j], [1j, 0]]),
+	          'Z': numpy.array([[1, 0], [0, -1]])}
+	terms = {((0, 'X'), (1, 'Z')): 0.5, ((2, 'Y'),): -1.,
+	         ((0, 'Y'), (1, 'X'), (3, 'Z')): 2., ((3, 'Y'), (2, 'Z')): 0.3,
+	         (): 0.25}
+	expected = 0.
+	for term, coefficient in terms.items():
+		applied = numpy.array(state)
+		for index, op in term:
+			applied = _reference_controlled_gate(applied, paulis[op],
+			                                     [mapping[qureg[index].id]], [])
+		expected += coefficient * numpy.vdot(state, applied).real
+	assert sim.get_expectation_value(terms, qureg) == pytest.approx(expected)
+	
+	diagonal = numpy.arange(16) * 0.5 - 2.
+	probabilities = numpy.abs(state) ** 2
+	expected = sum(probabilities[i] *
+	               diagonal[sum(((i >> mapping[qb.id]) & 1) << k
+	                            for k, qb in enumerate(qureg))]
+	               for i in range(len(state)))
+	assert (sim.get_expectation_value(diagonal, qureg) ==
+	        pytest.approx(expected))
+	# the state is not modified
+	assert numpy.allclose(numpy.array(sim.cheat()[1]), state)
+	
+	with pytest.raises(Exception):
+		sim.get_expectation_value({((0, 'A'),): 1.}, qureg)
+	with pytest.raises(Exception):
+		sim.get_expectation_value(diagonal[:8], qureg)
+	# each qubit may appear at most once in a Pauli string
+	with pytest.raises(ValueError):
+		sim.get_expectation_value({((0, 'X'), (0, 'X')): 1.}, qureg)
+	with pytest.raises(ValueError):
+		sim.get_expectation_value({((0, 'X'), (0, 'Z')): 1.}, qureg)
+	with pytest.raises(RuntimeError):
+		sim._simulator.get_expectation_value([([(12345, 'Z')], 1.)])
+	Measure | qureg
@@ -0,0 +1,333 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Contains a compiler engine which simulates Clifford circuits (H, S, Sdag, X,
+Y, Z, CNOT, Swap and measurements) using the tableau algorithm of Aaronson
+and Gottesman (Phys. Rev. A 70, 052328, 2004).
+
+Instead of 2^n amplitudes, the state of n qubits is represented by n
+stabilizer and n destabilizer generators (Pauli operators with a sign), i.e.,
+using O(n^2) bits. Gates take O(n) and measurements O(n^2) time, which allows
+to simulate hundreds or thousands of qubits.
+"""
+import random
+
+import numpy as _np
+
+from projectq.cengines import BasicEngine
+from projectq.meta import get_control_count
+from projectq.ops import (FlushGate,
+                          Allocate,
+                          Deallocate,
+                          Measure,
+                          H,
+                          S,
+                          Sdag,
+                          X,
+                          Y,
+                          Z,
+                          Swap)
+
+_WORD_SIZE = 64
+
+
+def _popcount(words):
+	"""
+	Return the number of set bits in each row of the 2D uint64 array words.
+	"""
+	bits = _np.unpackbits(_np.ascontiguousarray(words).view(_np.uint8), axis=1)
+	return bits.sum(axis=1, dtype=_np.int64)
+
+
+def _phase_exponent(x1, z1, x2, z2):
+	"""
+	Return the exponent (mod 4) of the factor i which arises when multiplying
+	the Pauli operators (x1, z1) and (x2, z2), summed over all qubits (this is
+	the function g of Aaronson and Gottesman, evaluated 64 qubits at a time).
+
+	Args:
+		x1, z1, x2, z2 (ndarray): Bit-packed X- and Z-parts of the Pauli
+			operators (2D uint64 arrays, one Pauli operator per row).
+	"""
+	y1 = x1 & z1
+	x_only1 = x1 & ~z1
+	z_only1 = z1 & ~x1
+	y2 = x2 & z2
+	x_only2 = x2 & ~z2
+	z_only2 = z2 & ~x2
+	# e.g., X * Y = iZ and X * Z = -iY
+	plus = (x_only1 & y2) | (y1 & z_only2) | (z_only1 & x_only2)
+	minus = (x_only1 & z_only2) | (y1 & x_only2) | (z_only1 & y2)
+	return _popcount(plus) - _popcount(minus)
+
+
+class StabilizerSimulator(BasicEngine):
+	"""
+	StabilizerSimulator is a compiler engine which simulates Clifford circuits
+	using a bit-packed stabilizer tableau.
+
+	Only H, S, Sdag, X, Y, Z, CNOT, Swap and measurements are supported (see
+	is_available), i.e., other gates have to be decomposed by an AutoReplacer
+	into this gate set (which is only possible if the circuit is a Clifford
+	circuit).
+
+	The tableau consists of 2m rows (m destabilizer generators followed by m
+	stabilizer generators) with X- and Z-bits for m qubit slots, each packed
+	into m / 64 words of 64 bits, and one sign bit per row. The number of slots
+	m is doubled whenever all slots are in use; slots of deallocated qubits
+	(which are reset to |0>) are reused by new qubits.
+	"""
+	def __init__(self, rnd_seed=None):
+		"""
+		Initialize the stabilizer simulator with an empty tableau and a random
+		seed.
+
+		Args:
+			rnd_seed (int): Random seed (uses random.randint(0, 1024) by default).
+		"""
+		BasicEngine.__init__(self)
+		if rnd_seed is None:
+			rnd_seed = random.randint(0, 1024)
+		self._rng = random.Random(rnd_seed)
+		self._num_slots = 0
+		self._x = _np.zeros((0, 0), dtype=_np.uint64)
+		self._z = _np.zeros((0, 0), dtype=_np.uint64)
+		self._r = _np.zeros(0, dtype=bool)
+		# maps qubit IDs to slots (i.e., columns of the tableau)
+		self._map = dict()
+		self._free_slots = []
+
+	def is_available(self, cmd):
+		"""
+		Specialized implementation of is_available: The stabilizer simulator
+		can deal with H, S, Sdag, X, Y, Z and Swap gates, CNOTs (X gates with one
+		control qubit), measurements and allocation/deallocation.
+
+		Args:
+			cmd (Command): Command for which to check availability.
+
+		Returns:
+			True if it can be simulated and False otherwise.
+		"""
+		if (cmd.gate == Measure or cmd.gate == Allocate or
+		    cmd.gate == Deallocate):
+			return True
+		num_controls = get_control_count(cmd)
+		if cmd.gate == X:
+			return num_controls <= 1
+		return num_controls == 0 and any(cmd.gate == gate for gate in
+		                                 (H, S, Sdag, Y, Z, Swap))
+
+	def cheat(self):
+		"""
+		Access the stabilizer generators of the current state.
+
+		Returns:
+			A tuple where the first entry is a dictionary mapping qubit IDs to
+			slots and the second entry is the list of stabilizer generators.
+			Each generator is a string consisting of its sign ('+' or '-')
+			followed by one Pauli operator ('I', 'X', 'Y' or 'Z') per slot.
+			Unused slots are in state |0>.
+		"""
+		paulis = _np.array(['I', 'X', 'Z', 'Y'])
+		generators = []
+		for row in range(self._num_slots, 2 * self._num_slots):
+			x = self._bits(self._x[row])
+			z = self._bits(self._z[row])
+			sign = '-' if self._r[row] else '+'
+			generators.append(sign + "".join(paulis[x + 2 * z]))
+		return dict(self._map), generators
+
+	def _bits(self, words):
+		"""
+		Unpack the bit-packed row words into one bit per slot.
+		"""
+		bits = _np.unpackbits(words.view(_np.uint8), bitorder='little')
+		return bits[:self._num_slots].astype(int)
+
+	def _column(self, slot):
+		"""
+		Return the index of the word and the mask of the bit which holds the
+		given slot in each row of the tableau.
+		"""
+		return slot // _WORD_SIZE, _np.uint64(1 << (slot % _WORD_SIZE))
+
+	def _grow(self):
+		"""
+		Double the number of slots (at least 64). The new slots are in |0>,
+		i.e., they are stabilized by Z and destabilized by X.
+		"""
+		old = self._num_slots
+		new = max(2 * old, _WORD_SIZE)
+		words = new // _WORD_SIZE
+		x = _np.zeros((2 * new, words), dtype=_np.uint64)
+		z = _np.zeros((2 * new, words), dtype=_np.uint64)
+		r = _np.zeros(2 * new, dtype=bool)
+		old_words = self._x.shape[1]
+		for src, dst in [(0, 0), (old, new)]:
+			x[dst:dst + old, :old_words] = self._x[src:src + old]
+			z[dst:dst + old, :old_words] = self._z[src:src + old]
+			r[dst:dst + old] = self._r[src:src + old]
+		for slot in range(old, new):
+			word, mask = self._column(slot)
+			x[slot, word] = mask
+			z[new + slot, word] = mask
+		self._x, self._z, self._r = x, z, r
+		self._num_slots = new
+		self._free_slots.extend(range(new - 1, old - 1, -1))
+
+	def _measure(self, slot):
+		"""
+		Measure the qubit in the given slot in the computational basis and
+		update the tableau.
+
+		Args:
+			slot (int): Slot of the qubit to measure.
+
+		Returns:
+			The measurement outcome (bool).
+		"""
+		n = self._num_slots
+		word, mask = self._column(slot)
+		anticommuting = (self._x[:, word] & mask) != 0
+		stabilizers = _np.flatnonzero(anticommuting[n:])
+		if len(stabilizers) > 0:
+			# random outcome: multiply all other generators which anticommute
+			# with Z by the stabilizer p (computing all products at once), then
+			# replace p by +-Z
+			p = n + stabilizers[0]
+			rows = _np.flatnonzero(anticommuting)
+			rows = rows[rows != p]
+			exponent = (2 * self._r[rows] + 2 * self._r[p] +
+			            _phase_exponent(self._x[p:p + 1], self._z[p:p + 1],
+			                            self._x[rows], self._z[rows]))
+			self._r[rows] = exponent % 4 == 2
+			self._x[rows] ^= self._x[p]
+			self._z[rows] ^= self._z[p]
+			self._x[p - n] = self._x[p]
+			self._z[p - n] = self._z[p]
+			self._r[p - n] = self._r[p]
+			outcome = self._rng.random() < .5
+			self._x[p] = 0
+			self._z[p] = 0
+			self._z[p, word] = mask
+			self._r[p] = outcome
+			return outcome
+		# deterministic outcome: +-Z is the product of the stabilizers whose
+		# destabilizers anticommute with Z. The phase of the product is
+		# obtained by multiplying each of them onto the product of the previous
+		# ones (exclusive prefix sums computed by one cumulative XOR).
+		rows = n + _np.flatnonzero(anticommuting[:n])
+		x = self._x[rows]
+		z = self._z[rows]
+		x_prefix = _np.zeros_like(x)
+		z_prefix = _np.zeros_like(z)
+		x_prefix[1:] = _np.bitwise_xor.accumulate(x[:-1], axis=0)
+		z_prefix[1:] = _np.bitwise_xor.accumulate(z[:-1], axis=0)
+		exponent = (2 * int(self._r[rows].sum()) +
+		            int(_phase_exponent(x, z, x_prefix, z_prefix).sum()))
+		return exponent % 4 == 2
+
+	def _handle(self, cmd):
+		"""
+		Handle all commands, i.e., update the tableau according to the gate,
+		measurement, or allocation/deallocation.
+
+		Args:
+			cmd (Command): Command to handle.
+
+		Raises:
+			Exception: If the gate is not supported (which should never happen
+				due to is_available).
+			RuntimeError: If a qubit in a superposition is deallocated.
+		"""
+		if cmd.gate == Allocate:
+			if len(self._free_slots) == 0:
+				self._grow()
+			self._map[cmd.qubits[0][0].id] = self._free_slots.pop()
+			return
+		if cmd.gate == Deallocate:
+			ID = cmd.qubits[0][0].id
+			word, mask = self._column(self._map[ID])
+			if _np.any(self._x[self._num_slots:, word] & mask):
+				raise RuntimeError("Qubit has not been measured / uncomputed. "
+				                   "Cannot deallocate a qubit in superposition!")
+			# reset the qubit to |0>, such that the slot can be reused
+			if self._measure(self._map[ID]):
+				self._r ^= (self._z[:, word] & mask) != 0
+			self._free_slots.append(self._map.pop(ID))
+			return
+		if cmd.gate == Measure:
+			assert(get_control_count(cmd) == 0)
+			for qr in cmd.qubits:
+				for qb in qr:
+					self.main_engine.set_measurement_result(
+					    qb, self._measure(self._map[qb.id]))
+			return
+		slots = [self._map[qb.id] for qr in cmd.qubits for qb in qr]
+		if cmd.gate == Swap:
+			# relabel the qubits instead of moving columns
+			ids = [qb.id for qr in cmd.qubits for qb in qr]
+			self._map[ids[0]], self._map[ids[1]] = slots[1], slots[0]
+			return
+		word, mask = self._column(slots[0])
+		x = (self._x[:, word] & mask) != 0
+		z = (self._z[:, word] & mask) != 0
+		if get_control_count(cmd) == 1 and cmd.gate == X:
+			control = self._map[cmd.control_qubits[0].id]
+			control_word, control_mask = self._column(control)
+			x_control = (self._x[:, control_word] & control_mask) != 0
+			z_control = (self._z[:, control_word] & control_mask) != 0
+			self._r ^= x_control & z & ~(x ^ z_control)
+			self._x[x_control, word] ^= mask
+			self._z[z, control_word] ^= control_mask
+		elif get_control_count(cmd) > 0:
+			raise Exception("StabilizerSimulator: Controlled {} gates are not "
+			                "supported.".format(str(cmd.gate)))
+		elif cmd.gate == H:
+			self._r ^= x & z
+			flip = x ^ z
+			self._x[flip, word] ^= mask
+			self._z[flip, word] ^= mask
+		elif cmd.gate == S:
+			self._r ^= x & z
+			self._z[x, word] ^= mask
+		elif cmd.gate == Sdag:
+			self._r ^= x & ~z
+			self._z[x, word] ^= mask
+		elif cmd.gate == X:
+			self._r ^= z
+		elif cmd.gate == Y:
+			self._r ^= x ^ z
+		elif cmd.gate == Z:
+			self._r ^= x
+		else:
+			raise Exception("StabilizerSimulator only supports Clifford gates "
+			                "(H, S, Sdag, X, Y, Z, CNOT and Swap)!\nPlease add an "
+			                "auto-replacer engine to your list of compiler "
+			                "engines.")
+
+	def receive(self, command_list):
+		"""
+		Receive a list of commands from the previous engine and handle them
+		(simulate them classically) prior to sending them on to the next engine.
+
+		Args:
+			command_list (list<Command>): List of commands to execute on the
+				simulator.
+		"""
+		for cmd in command_list:
+			if not cmd.gate == FlushGate():
+				self._handle(cmd)
+			if not self.is_last_engine:
+				self.send([cmd])
@@ -0,0 +1,192 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Tests for projectq.backends._stabilizer.py.
+"""
+
+import random
+
+import numpy
+import pytest
+
+from projectq import MainEngine
+from projectq.cengines import DummyEngine
+from projectq.ops import (H,
+                          S,
+                          Sdag,
+                          T,
+                          X,
+                          Y,
+                          Z,
+                          CNOT,
+                          Toffoli,
+                          Swap,
+                          Rx,
+                          C,
+                          Entangle,
+                          Measure)
+
+from projectq.backends import Simulator, StabilizerSimulator
+
+
+def test_stabilizer_simulator_is_available():
+	backend = DummyEngine(save_commands=True)
+	eng = MainEngine(backend, [])
+	qureg = eng.allocate_qureg(3)
+	for gate in [H, S, Sdag, X, Y, Z]:
+		gate | qureg[0]
+	CNOT | (qureg[0], qureg[1])
+	Swap | (qureg[0], qureg[1])
+	Measure | qureg[2]
+	available = len(backend.received_commands)
+	T | qureg[0]
+	Rx(0.5) | qureg[0]
+	Toffoli | (qureg[0], qureg[1], qureg[2])
+	C(Z) | (qureg[0], qureg[1])
+	C(Swap) | (qureg[0], qureg[1], qureg[2])
+	sim = StabilizerSimulator()
+	for i, cmd in enumerate(backend.received_commands):
+		assert sim.is_available(cmd) == (i < available)
+
+
+def _apply_pauli(state, pauli):
+	# apply the Pauli operator pauli (dict: bit-location -> 'I', 'X', 'Y' or
+	# 'Z') to the state vector
+	index = numpy.arange(len(state))
+	phase = numpy.ones(len(state), dtype=complex)
+	flip = 0
+	for location, op in pauli.items():
+		bit = (index >> location) & 1
+		if op in 'XY':
+			flip |= 1 << location
+		if op in 'YZ':
+			phase *= 1 - 2 * bit
+		if op == 'Y':
+			phase *= 1j
+	result = numpy.zeros_like(state)
+	result[index ^ flip] = phase * state
+	return result
+
+
+def test_stabilizer_simulator_compare_to_simulator():
+	rng = random.Random(42)
+	sim = Simulator()
+	stab_sim = StabilizerSimulator()
+	engines = [MainEngine(sim, []), MainEngine(stab_sim, [])]
+	quregs = [eng.allocate_qureg(6) for eng in engines]
+	for _ in range(100):
+		choice = rng.randint(0, 7)
+		i, j = rng.sample(range(6), 2)
+		for qureg in quregs:
+			if choice < 6:
+				[H, S, Sdag, X, Y, Z][choice] | qureg[i]
+			elif choice == 6:
+				CNOT | (qureg[i], qureg[j])
+			else:
+				Swap | (qureg[i], qureg[j])
+	for eng in engines:
+		eng.flush()
+	mapping, state = sim.cheat()
+	state = numpy.array(state)
+	slots, generators = stab_sim.cheat()
+	for generator in generators:
+		sign = 1 if generator[0] == '+' else -1
+		ops = generator[1:]
+		pauli = {mapping[qb.id]: ops[slots[qb.id]] for qb in quregs[1]}
+		# unused slots are in |0>
+		assert all(ops[k] in 'IZ' for k in range(len(ops))
+		           if k not in slots.values())
+		assert numpy.vdot(state, _apply_pauli(state, pauli)) == pytest.approx(sign)
+	for qureg in quregs:
+		Measure | qureg
+
+
+def test_stabilizer_simulator_deterministic_measurements():
+	eng = MainEngine(StabilizerSimulator(), [])
+	qureg = eng.allocate_qureg(4)
+	# H S S H = X, H S Sdag H = I
+	for gate in [H, S, S, H]:
+		gate | qureg[0]
+	for gate in [H, S, Sdag, H]:
+		gate | qureg[1]
+	Y | qureg[2]
+	H | qureg[3]
+	Z | qureg[3]
+	H | qureg[3]
+	Measure | qureg
+	assert [int(qb) for qb in qureg] == [1, 0, 1, 1]
+	# measuring again gives the same outcomes
+	Measure | qureg
+	assert [int(qb) for qb in qureg] == [1, 0, 1, 1]
+
+
+def test_stabilizer_simulator_ghz():
+	outcomes = set()
+	for seed in range(10):
+		eng = MainEngine(StabilizerSimulator(rnd_seed=seed), [])
+		qureg = eng.allocate_qureg(300)
+		H | qureg[0]
+		for k in range(1, len(qureg)):
+			CNOT | (qureg[k - 1], qureg[k])
+		Measure | qureg[150]
+		Measure | qureg
+		results = set(int(qb) for qb in qureg)
+		assert len(results) == 1
+		outcomes.update(results)
+	assert outcomes == {0, 1}
+
+
+def test_stabilizer_simulator_allocation():
+	sim = StabilizerSimulator(rnd_seed=1)
+	eng = MainEngine(sim, [])
+	qureg = eng.allocate_qureg(3)
+	H | qureg[0]
+	CNOT | (qureg[0], qureg[1])
+	CNOT | (qureg[1], qureg[2])
+	eng.flush()
+	# the tableau grows, keeping the GHZ state
+	more = eng.allocate_qureg(100)
+	Swap | (qureg[2], more[70])
+	X | more[0]
+	eng.flush()
+	slots, generators = sim.cheat()
+	assert len(generators) == 128
+	assert "+" + "XXX" + "I" * 125 in generators
+	Measure | qureg + more
+	assert int(qureg[0]) == int(qureg[1]) == int(more[70])
+	assert int(more[0]) == 1
+	assert int(qureg[2]) == 0
+	# qubits in superposition cannot be deallocated
+	H | qureg[2]
+	eng.flush()
+	with pytest.raises(RuntimeError):
+		qureg[2].__del__()
+	# deallocated qubits are reset to |0>
+	qubit = more[0]
+	slot = slots[qubit.id]
+	qubit.__del__()
+	new_qubit = eng.allocate_qubit()
+	eng.flush()
+	assert sim.cheat()[0][new_qubit[0].id] == slot
+	Measure | new_qubit
+	assert int(new_qubit) == 0
+	H | qureg[2]
+	Measure | qureg[2]
+
+
+def test_stabilizer_simulator_auto_replacer():
+	eng = MainEngine(StabilizerSimulator())
+	qureg = eng.allocate_qureg(5)
+	Entangle | qureg
+	Measure | qureg
+	assert len(set(int(qb) for qb in qureg)) == 1
@@ -127,6 +127,26 @@ def test_basic_engine_allocate_and_deallocate_qubit_and_qureg():
 	assert saving_backend.received_commands[7].tags == [DirtyQubitTag()]
 
 
+def test_basic_engine_allocate_qureg_sends_one_list():
+	saving_backend = DummyEngine(save_commands=True)
+	lists = []
+	def receive(self, cmd_list):
+		lists.append(cmd_list)
+		self.send(cmd_list)
+	
+	eng = DummyEngine()
+	eng.receive = types.MethodType(receive, eng)
+	main_engine = MainEngine(backend=saving_backend, engine_list=[eng])
+	qureg = main_engine.allocate_qureg(4)
+	assert len(lists) == 1
+	assert [cmd.qubits[0][0].id for cmd in lists[0]] == [qb.id for qb in qureg]
+	for cmd in lists[0]:
+		assert cmd.gate == AllocateQubitGate()
+	assert all(qb in main_engine.active_qubits for qb in qureg)
+	assert main_engine.allocate_qureg(0) == []
+	assert len(lists) == 1
+
+
 def test_basic_engine_is_meta_tag_supported():
 	eng = _basics.BasicEngine()
 	# BasicEngine needs receive function to function so let's add it:
@@ -195,6 +195,40 @@ class MainEngine(BasicEngine):
 			                "underlying backend failed to register " +
 			                "the measurement result\n")
 	
+	def get_measurement_results(self):
+		"""
+		Return all registered measurement results.
+		
+		Returns:
+			Dictionary mapping qubit IDs to measurement outcomes (bool), which
+			can be modified without affecting the registered results.
+		"""
+		return dict(self._measurements)
+	
+	def set_measurement_results(self, results):
+		"""
+		Replace all registered measurement results, e.g., by results obtained
+		from get_measurement_results, when a backend restores an earlier state
+		of the simulation.
+		
+		Args:
+			results (dict): Dictionary mapping qubit IDs to measurement outcomes
+				(bool).
+		"""
+		self._measurements = dict((ID, bool(value))
+		                          for ID, value in results.items())
+	
+	def reserve_qubit_ids(self, next_id):
+		"""
+		Make sure that get_new_qubit_id only returns IDs >= next_id, e.g., when
+		a backend restores qubits which were allocated in an earlier run.
+		
+		Args:
+			next_id (int): Smallest qubit ID which may be returned by
+				get_new_qubit_id.
+		"""
+		self._qubit_idx = max(self._qubit_idx, int(next_id))
+	
 	def get_new_qubit_id(self):
 		"""
 		Returns a unique qubit id to be used for the next qubit allocation.
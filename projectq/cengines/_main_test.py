@@ -87,6 +87,15 @@ def test_main_engine_set_and_get_measurement_result():
 	eng.set_measurement_result(qubit1[0], False)
 	assert int(qubit0)
 	assert not int(qubit1)
+	results = eng.get_measurement_results()
+	assert results == {qubit0[0].id: True, qubit1[0].id: False}
+	# the returned dict is a copy
+	results[qubit1[0].id] = True
+	assert not int(qubit1)
+	eng.set_measurement_results({qubit1[0].id: 1})
+	assert int(qubit1)
+	with pytest.raises(_main.NotYetMeasuredError):
+		print(int(qubit0))
 
 
 def test_main_engine_get_qubit_id():
@@ -96,6 +105,10 @@ def test_main_engine_get_qubit_id():
 	for _ in range(10):
 		ids.append(eng.get_new_qubit_id())
 	assert len(set(ids)) == 10
+	eng.reserve_qubit_ids(5)
+	assert eng.get_new_qubit_id() == 10
+	eng.reserve_qubit_ids(20)
+	assert eng.get_new_qubit_id() == 20
 
 
 def test_main_engine_flush():
@@ -77,6 +77,7 @@ class AddConstantModN(BasicMathGate):
 	Add a constant to a quantum number represented by a quantum register modulo N.
 	
 	The number is stored from low- to high-bit, i.e., qunum[0] is the LSB.
+	Values x >= N are left unchanged, such that the gate is unitary.
 	
 	Example:
 		.. code-block:: python
@@ -96,7 +97,7 @@ class AddConstantModN(BasicMathGate):
 		It also initializes its base class, BasicMathGate, with the corresponding
 		function, so it can be emulated efficiently.
 		"""
-		BasicMathGate.__init__(self, lambda x: ((x + a) % N,))
+		BasicMathGate.__init__(self, lambda x: ((x + a) % N if x < N else x,))
 		self.a = a
 		self.N = N
 
@@ -145,6 +146,8 @@ class MultiplyByConstantModN(BasicMathGate):
 	modulo N.
 	
 	The number is stored from low- to high-bit, i.e., qunum[0] is the LSB.
+	Values x >= N are left unchanged, such that the gate is unitary if a and N
+	are coprime.
 	
 	Example:
 		.. code-block:: python
@@ -164,7 +167,7 @@ class MultiplyByConstantModN(BasicMathGate):
 		It also initializes its base class, BasicMathGate, with the corresponding
 		function, so it can be emulated efficiently.
 		"""
-		BasicMathGate.__init__(self, lambda x: ((a * x) % N,))
+		BasicMathGate.__init__(self, lambda x: ((a * x) % N if x < N else x,))
 		self.a = a
 		self.N = N
 
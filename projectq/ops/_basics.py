@@ -368,7 +368,7 @@ class BasicMathGate(BasicGate):
 		def multiply(a,b,c)
 			return (a,b,c+a*b)
 	"""
-	def __init__(self, math_fun):
+	def __init__(self, math_fun, vectorized=False):
 		"""
 		Initialize a BasicMathGate by providing the mathematical function that it
 		implements.
@@ -377,6 +377,11 @@ class BasicMathGate(BasicGate):
 			math_fun (function): Function which takes as many int values as input,
 				as the gate takes registers. For each of these values, it then returns
 				the output (i.e., it returns a list/tuple of output values).
+			vectorized (bool): If True, math_fun also accepts NumPy integer arrays
+				(the values of the registers for many basis states at once) and
+				returns arrays of output values. Simulators then emulate the gate
+				with a few calls instead of one call per basis state (see
+				get_math_function_vectorized).
 				
 		Example:
 			.. code-block:: python
@@ -409,6 +414,7 @@ class BasicMathGate(BasicGate):
 		BasicGate.__init__(self)
 		math_function = lambda x: list(math_fun(*x))
 		self._math_function = math_function
+		self._vectorized = vectorized
 	
 	"""
 	Return the math function which corresponds to the action of this math gate,
@@ -423,3 +429,33 @@ class BasicMathGate(BasicGate):
 	"""
 	def get_math_function(self, qubits):
 		return self._math_function
+	
+	def get_math_function_vectorized(self, qubits):
+		"""
+		Return the math function in vectorized form (if available), given the
+		input to the gate (a tuple of quantum registers).
+		
+		The vectorized function takes a list containing one NumPy integer array
+		per register (the values of the register for many basis states) and
+		returns a list/tuple of arrays with the corresponding output values.
+		
+		Args:
+			qubits (tuple<Qureg>): Qubits to which the math gate is being applied.
+		
+		Returns:
+			math_fun (function): Vectorized Python function describing the action
+				of this gate or None if the gate does not provide one (then,
+				get_math_function is used).
+		
+		Example:
+			.. code-block:: python
+			
+				def get_math_function_vectorized(self, qubits):
+					n = len(qubits[0])
+					def math_fun(x):
+						return ((x[0] + x[1]) % (1 << n), x[1])
+					return math_fun
+		"""
+		if self._vectorized:
+			return self._math_function
+		return None
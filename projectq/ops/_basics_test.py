@@ -15,6 +15,7 @@
 import pytest
 from copy import deepcopy
 import math
+import numpy
 
 from projectq.types import Qubit, Qureg
 from projectq.ops import Command
@@ -194,3 +195,15 @@ def test_basic_math_gate():
 	gate = MyMultiplyGate()
 	# Test a=2, b=3, and c=5 should give a=2, b=3, c=11
 	assert gate.get_math_function(("qreg1", "qreg2", "qreg3"))([2,3,5]) == [2,3,11]
+
+
+def test_basic_math_gate_vectorized():
+	gate = _basics.BasicMathGate(lambda a, b: (a, a + b))
+	assert gate.get_math_function_vectorized(("qreg1", "qreg2")) is None
+	gate = _basics.BasicMathGate(lambda a, b: (a, a + b), vectorized=True)
+	math_fun = gate.get_math_function_vectorized(("qreg1", "qreg2"))
+	a, b = numpy.array([1, 2, 3]), numpy.array([4, 5, 6])
+	outputs = math_fun([a, b])
+	assert numpy.array_equal(outputs[0], a)
+	assert numpy.array_equal(outputs[1], [5, 7, 9])
+	assert gate.get_math_function(("qreg1", "qreg2"))([2, 3]) == [2, 5]